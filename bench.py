@@ -0,0 +1,572 @@
+# -*- coding: utf-8 -*-
+"""
+성능 측정 스크립트
+
+사용법:
+    python bench.py matcher [--iterations N] [--extra-commands N]
+    python bench.py snowman-storm [--mentions N] [--teams N] [--sheets-latency-ms MS] ...
+    python bench.py battle-log-storm [--mentions N] [--sheets-latency-ms MS] [--engine asyncio] ...
+    python bench.py storage [--players N] [--commits N] [--threads N]
+    python bench.py html [--fuzz N] [--size CHARS] [--iterations N]
+    python bench.py grammar [--fuzz N] [--artifacts N] [--iterations N]
+
+*-storm 벤치마크는 fakes.py 의 가짜 Mastodon/gspread 로 실행되므로 네트워크가 필요 없다.
+"""
+
+import argparse
+import asyncio
+import html
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+import halloween
+import player_storage
+import snowman_bot
+from dedup import SeenSet
+from fakes import FakeMastodon, FakeSpreadsheet, SheetsQuota
+
+
+def _percentile(samples, q):
+    if not samples:
+        return float("nan")
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def _wait_until(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def _ops_per_sec(fn, inputs, iterations):
+    """inputs 전체를 iterations번 처리하는 데 걸린 시간으로 초당 처리 수를 계산"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for item in inputs:
+            fn(item)
+    elapsed = time.perf_counter() - started
+    return len(inputs) * iterations / elapsed
+
+
+# ============================================================
+# matcher: 명령어 매칭 (기존 선형 탐색 vs CommandMatcher)
+# ============================================================
+
+def _legacy_match(commands):
+    """기존 handle_command 의 방식: 명령어마다 부분 문자열 탐색 + 별도의 대괄호 정규식"""
+    lowered = [cmd.lower() for cmd in commands]
+
+    def match(content):
+        content = content.lower()
+        command_found = None
+        for cmd, cmd_lower in zip(commands, lowered):
+            if cmd_lower in content:
+                command_found = cmd
+                break
+        return command_found, re.search(r'\[.*?\]', content) is not None
+
+    return match
+
+
+def _sample_toots(commands, count, seed=0):
+    rng = random.Random(seed)
+    filler = "오늘도 눈이 펑펑 내린다. 다 같이 힘내서 굴려 보자! " * 3
+    toots = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.7:
+            body = f"{rng.choice(commands)} {filler}"
+        elif kind < 0.85:
+            body = f"[눈사람/굴리긔] {filler}"  # 오타
+        else:
+            body = filler
+        toots.append(f"@snowman {body}")
+    return toots
+
+
+def bench_matcher(args):
+    command_sets = [("현재 명령어", list(snowman_bot.ALL_COMMANDS))]
+    if args.extra_commands:
+        extra = [f"[이벤트{i // 10}/명령{i}]" for i in range(args.extra_commands)]
+        command_sets.append((f"+{args.extra_commands}개", list(snowman_bot.ALL_COMMANDS) + extra))
+
+    for label, commands in command_sets:
+        toots = _sample_toots(commands, 1000)
+        legacy = _legacy_match(commands)
+        matcher = snowman_bot.CommandMatcher(commands)
+
+        # 두 방식의 결과가 같은지 먼저 확인
+        for toot in toots:
+            assert legacy(toot) == matcher.match(toot), toot
+
+        legacy_ops = _ops_per_sec(legacy, toots, args.iterations)
+        matcher_ops = _ops_per_sec(matcher.match, toots, args.iterations)
+        print(
+            f"[{label}] 명령어 {len(commands)}개 | "
+            f"기존 {legacy_ops:,.0f} ops/s | CommandMatcher {matcher_ops:,.0f} ops/s | "
+            f"x{matcher_ops / legacy_ops:.1f}"
+        )
+
+
+# ============================================================
+# snowman-storm: 눈사람 봇 멘션 폭주 재현
+# ============================================================
+
+def _snowman_fixture(teams: int, spreadsheet: FakeSpreadsheet):
+    """팀마다 머리/몸통 두 명이 등록된 player_db.json 과 팀 워크시트를 만든다."""
+    db = {}
+    players = []
+    for t in range(teams):
+        sheet_name = f"팀{t:03d}"
+        spreadsheet.add_worksheet(sheet_name, values=[[f"p{t}a", f"p{t}b"], [200, 200]])
+        for suffix, role, col in (("a", "머리", "A"), ("b", "몸통", "B")):
+            user_id = str(10000 + t * 2 + (suffix == "b"))
+            db[user_id] = {
+                "sheet_name": sheet_name,
+                "role": role,
+                "col": col,
+                "acct": f"p{t}{suffix}",
+                "cooldown_times": {"snowman_cmd": "", "decoration_cmd": ""},
+            }
+            players.append((user_id, f"p{t}{suffix}"))
+    with open(snowman_bot.DB_FILE, "w", encoding="utf-8") as f:
+        json.dump(db, f, ensure_ascii=False)
+    return players
+
+
+def bench_snowman_storm(args):
+    os.chdir(tempfile.mkdtemp(prefix="snowman-bench-"))
+    snowman_bot.COOL_DOWN_HOURS = 0  # 같은 사람이 연달아 명령해도 매번 실제 처리 경로를 타도록
+    snowman_bot.SHEET_FLUSH_INTERVAL = args.flush_interval
+
+    spreadsheet = FakeSpreadsheet(
+        latency=args.sheets_latency_ms / 1000.0,
+        quota=SheetsQuota(args.sheets_quota, args.sheets_quota),
+    )
+    mastodon = FakeMastodon(
+        latency=args.reply_latency_ms / 1000.0,
+        ratelimit_limit=args.mastodon_limit,
+        ratelimit_window=args.mastodon_window,
+    )
+    players = _snowman_fixture(args.teams, spreadsheet)
+
+    started = time.monotonic()
+    bot = snowman_bot.SnowmanBot(mastodon=mastodon, spreadsheet=spreadsheet)
+    cold_start = time.monotonic() - started
+    startup_calls = spreadsheet.total_calls()
+    # 시작 뒤의 응답 몇 건은 429 로 거절해, ReplySender 가 실제 Mastodon.py 예외를 받아 재시도하는지 확인
+    mastodon.forced_429 = args.mastodon_forced_429
+
+    rng = random.Random(args.seed)
+    commands = snowman_bot.SNOWMAN_COOL_DOWN_CMDS + [snowman_bot.DECORATION_COMMAND]
+    submitted_at = {}
+
+    started = time.monotonic()
+    for _ in range(args.mentions):
+        user_id, acct = rng.choice(players)
+        notification = mastodon.push_mention(acct, user_id, f"<p>@bot {rng.choice(commands)}</p>")
+        status = notification["status"]
+        submitted_at[status["id"]] = time.monotonic()
+        bot.dispatcher.submit(status)
+
+    if not _wait_until(lambda: len(mastodon.replies) >= args.mentions, args.timeout):
+        print(f"경고: 제한 시간 안에 응답 {len(mastodon.replies)}/{args.mentions}건만 전송되었습니다.")
+
+    bot.dispatcher.stop()
+    bot.replies.stop()
+    bot.teams.flush()
+
+    replies = list(mastodon.replies)
+    elapsed = max((sent_at for _, _, sent_at in replies), default=time.monotonic()) - started
+    latencies = [sent_at - submitted_at[status_id] for status_id, _, sent_at in replies]
+    sheet_calls = spreadsheet.total_calls() - startup_calls
+
+    print(f"팀 {args.teams}개 / 멘션 {args.mentions}건 (시작 {cold_start:.2f}s, 시작 시 Sheets 호출 {startup_calls}회)")
+    print(f"  처리량        {len(replies) / elapsed:,.1f} commands/s")
+    print(f"  응답 지연     p50 {_percentile(latencies, 0.50) * 1000:.1f}ms | p99 {_percentile(latencies, 0.99) * 1000:.1f}ms")
+    print(f"  Sheets 호출   {sheet_calls}회 ({sheet_calls / max(len(replies), 1):.3f}회/명령, 429 {spreadsheet.calls['429']}회)")
+    print(f"  Mastodon 호출 {sum(mastodon.calls.values()) - mastodon.calls['429']}회 (429 {mastodon.calls['429']}회)")
+    print(f"  디스패처      {bot.dispatcher.stats()}")
+    if bot.replies._stats['rate_limited'] < args.mastodon_forced_429:
+        print(f"경고: 강제 429 {args.mastodon_forced_429}회 중 {bot.replies._stats['rate_limited']}회만 ReplySender 가 처리했습니다.")
+
+
+# ============================================================
+# battle-log-storm: 전투 로그봇 멘션 폭주 재현
+# ============================================================
+
+def bench_battle_log_storm(args):
+    os.chdir(tempfile.mkdtemp(prefix="battle-log-bench-"))
+    halloween.LOG_SPOOL_FILE = "bench_spool.db"
+    halloween.LOG_PACE_SEC = args.pace
+    halloween.LOG_STATS.pace = args.pace
+
+    spreadsheet = FakeSpreadsheet(
+        latency=args.sheets_latency_ms / 1000.0,
+        quota=SheetsQuota(args.sheets_quota, args.sheets_quota),
+    )
+    halloween._SHEET_CACHE = spreadsheet.add_worksheet(halloween.TAB_LOG)
+    mastodon = FakeMastodon()
+    listener = halloween.BattleLogListener(mastodon, None, SeenSet())
+
+    if args.engine == "asyncio":
+        # 비동기 기록 작업을 별도 이벤트 루프에서 실행
+        worker = threading.Thread(
+            target=asyncio.run, args=(halloween._async_log_writer(halloween.get_spool()),), daemon=True,
+        )
+    else:
+        worker = threading.Thread(target=halloween.log_worker, daemon=True)
+    worker.start()
+
+    rng = random.Random(args.seed)
+    texts = ["[공격 1]", "[방어 1] [해리/지니]", "[치유 2] [해리/지니]", "[공격/1]", "[사용/아티팩트] 아티팩트_지원"]
+
+    started = time.monotonic()
+    for i in range(args.mentions):
+        listener.on_notification(
+            mastodon.push_mention(f"runner{i % 50}", i % 50, f"<p>@bot {rng.choice(texts)} (지문 {i})</p>")
+        )
+    enqueue_elapsed = time.monotonic() - started
+
+    spool = halloween.get_spool()
+    if not _wait_until(lambda: spool.qsize() == 0, args.timeout):
+        print(f"경고: 제한 시간 안에 기록을 마치지 못했습니다. (남은 {spool.qsize()}건)")
+    elapsed = time.monotonic() - started
+    spool.close()
+    worker.join(timeout=5)
+
+    stats = halloween.LOG_STATS.snapshot()
+    appends = spreadsheet.calls["append_rows"] + spreadsheet.calls["append_row"]
+    print(f"멘션 {args.mentions}건 (엔진 {args.engine})")
+    print(f"  수신 처리량   {args.mentions / enqueue_elapsed:,.0f} mentions/s (스풀 적재까지)")
+    print(f"  기록 처리량   {stats['rows_written'] / elapsed:,.1f} rows/s (시트 기록 완료까지)")
+    print(f"  Sheets 호출   {appends}회 ({stats['rows_written'] / max(appends, 1):.1f}줄/호출, 429 {spreadsheet.calls['429']}회)")
+    print(f"  워커 통계     {stats}")
+
+
+# ============================================================
+# storage: player_db 저장소 백엔드 비교 (JSON+저널 vs SQLite)
+# ============================================================
+
+def bench_storage(args):
+    os.chdir(tempfile.mkdtemp(prefix="storage-bench-"))
+    records = {
+        str(10000 + i): {
+            "sheet_name": f"팀{i // 2:03d}",
+            "role": "머리" if i % 2 == 0 else "몸통",
+            "col": "A" if i % 2 == 0 else "B",
+            "acct": f"player{i}",
+            "cooldown_times": {"snowman_cmd": "", "decoration_cmd": ""},
+        }
+        for i in range(args.players)
+    }
+    backends = [
+        ("json", player_storage.JsonJournalStorage("player_db.json", "player_db.journal", snowman_bot.DB_COMPACT_EVERY)),
+        ("sqlite", player_storage.SqliteStorage("player_db.sqlite3")),
+    ]
+
+    for label, storage in backends:
+        storage.replace_all(records)
+        db = snowman_bot.PlayerDB(storage)
+        user_ids = list(db.data)
+        latencies = []
+        lock = threading.Lock()
+
+        def run(seed):
+            rng = random.Random(seed)
+            local = []
+            for _ in range(args.commits // args.threads):
+                user_id = rng.choice(user_ids)
+                started = time.perf_counter()
+                # 명령 처리 한 번 = 쿨타임 갱신 + commit (실제 handle_command 와 같은 경로)
+                db.set_cooldown(user_id, "snowman_cmd", time.time())
+                local.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=run, args=(args.seed + i,)) for i in range(args.threads)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        # 다시 읽었을 때 마지막 값이 그대로 남아 있는지 확인
+        reloaded = storage.load()
+        for user_id in user_ids:
+            # 한 번도 갱신되지 않은 사용자는 저장소에 이전 형식('')이 남아 있으므로 읽기 변환 후 비교
+            assert snowman_bot._parse_user(reloaded[user_id]) == db.data[user_id], user_id
+        storage.close()
+
+        print(
+            f"[{label}] 사용자 {args.players}명 / 스레드 {args.threads}개 | "
+            f"{len(latencies) / elapsed:,.0f} commits/s | "
+            f"p50 {_percentile(latencies, 0.50) * 1000:.2f}ms | p99 {_percentile(latencies, 0.99) * 1000:.2f}ms"
+        )
+
+
+# ============================================================
+# html: 본문 HTML → 텍스트 (차등 퍼징 + 처리량)
+# ============================================================
+
+_LEGACY_TAG_RE = re.compile(r"<[^>]+>")
+# 태그와 공백을 정규식 한 번으로 처리하는 단일 패스 후보 (비교용)
+_FUSED_TAG_SPACE_RE = re.compile(r"(?:<[^>]+>|\s)+")
+
+
+def _reference_battle_text(content):
+    """기준 구현: 기존 전투 로그봇 정규식 경로 (태그 → 공백, 공백 정리) + 엔티티 복원"""
+    return " ".join(html.unescape(_LEGACY_TAG_RE.sub(" ", content or "")).split())
+
+
+def _reference_snowman_text(content):
+    """기준 구현: 기존 눈사람 봇 정규식 경로 (태그 → 공백) + 엔티티 복원"""
+    return html.unescape(_LEGACY_TAG_RE.sub(" ", content or ""))
+
+
+def _legacy_battle_text(content):
+    """엔티티 복원 전의 전투 로그봇 html_to_text (처리량 비교 기준)"""
+    return " ".join(_LEGACY_TAG_RE.sub(" ", content or "").split())
+
+
+def _fused_battle_text(content):
+    """단일 패스 후보: 태그와 연속 공백을 정규식 한 번으로 치환 (엔티티가 있을 때만 복원 후 다시 정리)"""
+    text = _FUSED_TAG_SPACE_RE.sub(" ", content or "")
+    if "&" in text:
+        return " ".join(html.unescape(text).split())
+    return text.strip()
+
+
+_HTML_FUZZ_PIECES = [
+    "<p>", "</p>", "<br>", "<br />", '<span class="h-card">', "</span>", '<a href="https://x.y/?a=1&amp;b=2">', "</a>",
+    '<p><span class="h-card"><a href="https://x.y/@bot" class="u-url mention">@<span>bot</span></a></span>',
+    "<p><span><span>", "</span></span></p>", '<span class="invisible">https://</span>',
+    "&amp;", "&lt;", "&gt;", "&quot;", "&#39;", "&#91;", "&#93;", "&#x5B;", "&#X5d;", "&nbsp;", "&amp", "&ampx",
+    "&notit;", "&#", "&#x;", "&", ";", "&amp;lt;", "&lt;p&gt;", "&lt", "&#39", "&nbsp", "&AMP;", "&#10;",
+    "<", ">", "[", "]", "/", " ", "  ", "\n", "\t", "\u3000",
+    "공격", "방어", "[공격 1]", "[해리/지니]", "[눈사람/굴리기]", "@bot", "눈사람", "abc", "1",
+]
+
+
+def _random_html(rng, max_pieces=40):
+    return "".join(rng.choice(_HTML_FUZZ_PIECES) for _ in range(rng.randint(0, max_pieces)))
+
+
+def _large_html(rng, size):
+    """실제 멘션처럼 중첩 <p>/<span> 마크업과 엔티티, 대괄호가 섞인 긴 본문"""
+    parts = ['<p><span class="h-card"><a href="https://example.social/@bot" class="u-url mention">@<span>bot</span></a></span> ']
+    length = 0
+    while length < size:
+        chunk = rng.choice([
+            "[공격 1] [해리/지니] ", "[방어 2] [론/위즐리] [헤르/미온] ", "오늘의 전투 로그 &amp; 메모 ",
+            "&lt;지문&gt; 조심스럽게 다가간다. ", "</p><p>", "<br>", "긴 지문이 이어진다. " * 3, "&#91;지원 3&#93; ",
+            '<span class="ellipsis">링크</span> ',
+        ])
+        parts.append(chunk)
+        length += len(chunk)
+    parts.append("</p>")
+    return "".join(parts)
+
+
+def bench_html(args):
+    rng = random.Random(args.seed)
+
+    # 1) 차등 퍼징: 두 봇의 html_to_text (와 단일 패스 후보) 가 기준 정규식 경로와 결과가 완전히 같은지
+    checks = (
+        ("halloween.html_to_text", halloween.html_to_text, _reference_battle_text),
+        ("snowman_bot.html_to_text", snowman_bot.html_to_text, _reference_snowman_text),
+        ("단일 패스 후보", _fused_battle_text, _reference_battle_text),
+    )
+    for i in range(args.fuzz):
+        content = _random_html(rng)
+        for name, fn, reference in checks:
+            assert fn(content) == reference(content), (name, i, content, fn(content), reference(content))
+    print(f"퍼징 {args.fuzz:,}건: 기준 구현과 결과 일치 ({', '.join(name for name, _, _ in checks)})")
+
+    # 2) 처리량: 일반 멘션 / 엔티티 없는 짧은 멘션 / 긴 본문
+    chatter = [f'<p><span class="h-card"><a href="https://x.y/@bot">@<span>bot</span></a></span> 오늘 날씨 좋다 {i}</p>'
+               for i in range(1000)]
+    for label, toots in (
+        ("일반 멘션", [_large_html(rng, 120) for _ in range(1000)]),
+        ("엔티티 없는 멘션", chatter),
+        (f"긴 본문 {args.size:,}자", [_large_html(rng, args.size) for _ in range(20)]),
+    ):
+        mb = sum(len(toot) for toot in toots) / len(toots) / 1e6
+        legacy_ops = _ops_per_sec(_legacy_battle_text, toots, args.iterations)
+        results = [
+            (name, _ops_per_sec(fn, toots, args.iterations))
+            for name, fn in (("halloween", halloween.html_to_text), ("snowman", snowman_bot.html_to_text),
+                             ("단일 패스", _fused_battle_text))
+        ]
+        print(f"[{label}] 기존(엔티티 복원 없음) {legacy_ops:,.0f} ops/s ({legacy_ops * mb:,.1f} MB/s)")
+        for name, ops in results:
+            print(f"    {name}: {ops:,.0f} ops/s ({ops * mb:,.1f} MB/s) | x{ops / legacy_ops:.2f}")
+
+
+# ============================================================
+# grammar: 전투 커맨드 형식 검사 (차등 퍼징 + 처리량)
+# ============================================================
+
+_LEGACY_BRACKET_RE = re.compile(r"\[([^\]]*)\]")
+
+
+def _legacy_validate(text, valid_commands, required_min, artifacts):
+    """기준 구현: 컴파일 전 validate_command (매번 findall / 정규식 / 아티팩트 이름 부분 문자열 검사)"""
+    errors = []
+    tokens = _LEGACY_BRACKET_RE.findall(text)
+    if not tokens:
+        return False, None, "", "커맨드 대괄호가 없습니다."
+
+    idx_cmd = 0
+    if tokens[0].strip() == "대리 선언":
+        idx_cmd = 1
+        if len(tokens) <= 1:
+            return False, None, "", "대리 선언 뒤에 실제 행동 커맨드가 없습니다."
+
+    raw_cmd = tokens[idx_cmd]
+    cmd = raw_cmd.strip()
+    if halloween.BAD_SLASH_CMD_RE.match(cmd):
+        errors.append(f"커맨드는 [공격 1]처럼 공백으로 쓰고, 슬래시(/)는 사용하지 않습니다: [{raw_cmd}]")
+    if cmd not in valid_commands:
+        errors.append(f"알 수 없는 커맨드입니다: [{raw_cmd}]")
+    effective_cmd = cmd if cmd in valid_commands else None
+
+    target_tokens = tokens[idx_cmd + 1:]
+    targets_str = "".join(f"[{t}]" for t in target_tokens)
+    for t in target_tokens:
+        if "/" not in t:
+            errors.append(f"대상 대괄호 안에 '/'가 없습니다: [{t}]")
+
+    required = 0
+    if effective_cmd is not None:
+        required = required_min.get(effective_cmd, 0)
+        if effective_cmd == "사용/아티팩트":
+            for name in artifacts:
+                if name in text:
+                    required = max(required, 1)
+    if required > 0 and len(target_tokens) < required:
+        if target_tokens:
+            errors.append(
+                f"커맨드 [{cmd}] 에는 최소 {required}개의 대상 대괄호가 필요합니다. (현재 {len(target_tokens)}개)"
+            )
+        else:
+            errors.append(
+                f"커맨드 [{cmd}] 에는 최소 {required}개의 대상 대괄호가 필요합니다. 현재 대상이 전혀 지정되지 않았습니다."
+            )
+    return len(errors) == 0, effective_cmd, targets_str, ", ".join(errors)
+
+
+_GRAMMAR_TOKENS = [
+    "공격 1", "공격 2", " 방어 1 ", "방어 2", "치유 1", "치유 2", "지원 1", "지원 3", "사용/아티팩트", " 사용/아티팩트",
+    "대리 선언", " 대리 선언", "공격/1", "방어 / 2", "지원/12", "공격", "해리/지니", "론/위즐리", "헤르미온", "", " ", "/",
+]
+
+
+def _random_declaration(rng, artifact_names):
+    tokens = [rng.choice(_GRAMMAR_TOKENS) for _ in range(rng.randint(0, 5))]
+    extra = " ".join(rng.choice(artifact_names + ["지문", "곡", "아티팩트_", "치유의"]) for _ in range(rng.randint(0, 3)))
+    return "@bot " + " ".join(f"[{t}]" for t in tokens) + " " + extra
+
+
+def bench_grammar(args):
+    rng = random.Random(args.seed)
+    valid, required = halloween.VALID_COMMANDS, halloween.REQUIRED_TARGET_MIN
+
+    # 1) 차등 퍼징: 아티팩트 표를 바꿔 가며 기준 구현과 결과가 완전히 같은지
+    tables = [set(), {""}, set(halloween.REQUIRES_TARGET_ARTIFACTS),
+              {"치유의 곡옥", "치유의 방패", "치유", "곡", "아티팩트_지원", "a.b", "(x)"}]
+    for artifacts in tables:
+        grammar = halloween.CommandGrammar(valid, required, artifacts)
+        names = sorted(artifacts) or ["아티팩트_지원"]
+        for i in range(args.fuzz):
+            text = _random_declaration(rng, names)
+            expected = _legacy_validate(text, valid, required, artifacts)
+            assert grammar.validate(text) == expected, (i, text, grammar.validate(text), expected)
+    print(f"퍼징 {args.fuzz * len(tables):,}건: 기준 구현과 결과 일치")
+
+    # 2) 처리량: 레이드처럼 같은 선언이 반복되는 경우, 아티팩트 표가 큰 경우
+    artifacts = {f"아티팩트_{i:04d}" for i in range(args.artifacts)} | set(halloween.REQUIRES_TARGET_ARTIFACTS)
+    grammar = halloween.CommandGrammar(valid, required, artifacts)
+    runners = [f"{name}/러너{i}" for i, name in enumerate(["해리", "론", "헤르", "지니", "네빌"])]
+    raid = [f"@bot [{rng.choice(['공격 1', '방어 1', '치유 1', '지원 1'])}] [{rng.choice(runners)}] (지문 {i})"
+            for i in range(2000)]
+    artifact_use = [f"@bot [사용/아티팩트] 아티팩트_{rng.randrange(args.artifacts * 2):04d} 사용 [{rng.choice(runners)}]"
+                    for _ in range(2000)]
+
+    for label, texts in (("레이드 선언", raid), (f"아티팩트 사용 (표 {len(artifacts):,}개)", artifact_use)):
+        legacy_ops = _ops_per_sec(lambda t: _legacy_validate(t, valid, required, artifacts), texts, args.iterations)
+        grammar_ops = _ops_per_sec(grammar.validate, texts, args.iterations)
+        print(f"[{label}] 기존 {legacy_ops:,.0f} ops/s | CommandGrammar {grammar_ops:,.0f} ops/s | x{grammar_ops / legacy_ops:.2f}")
+    print(f"  캐시 {grammar.cache_info()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="눈사람 봇 / 전투 로그봇 성능 측정")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("matcher", help="명령어 매칭 속도 비교")
+    p.add_argument("--iterations", type=int, default=20)
+    p.add_argument("--extra-commands", type=int, default=500, help="확장 명령어 수 (0이면 생략)")
+    p.set_defaults(func=bench_matcher)
+
+    p = sub.add_parser("snowman-storm", help="가짜 서버로 눈사람 봇 멘션 폭주 재현")
+    p.add_argument("--mentions", type=int, default=2000)
+    p.add_argument("--teams", type=int, default=20)
+    p.add_argument("--sheets-latency-ms", type=float, default=80.0)
+    p.add_argument("--sheets-quota", type=int, default=300, help="분당 읽기/쓰기 요청 한도")
+    p.add_argument("--reply-latency-ms", type=float, default=30.0)
+    p.add_argument("--mastodon-limit", type=int, default=100000, help="window 동안 허용되는 Mastodon 요청 수")
+    p.add_argument("--mastodon-window", type=float, default=300.0)
+    p.add_argument("--mastodon-forced-429", type=int, default=2, help="시작 뒤 강제로 429 를 돌려줄 Mastodon 요청 수")
+    p.add_argument("--flush-interval", type=float, default=1.0)
+    p.add_argument("--timeout", type=float, default=300.0)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_snowman_storm)
+
+    p = sub.add_parser("battle-log-storm", help="가짜 서버로 전투 로그봇 멘션 폭주 재현")
+    p.add_argument("--mentions", type=int, default=5000)
+    p.add_argument("--sheets-latency-ms", type=float, default=150.0)
+    p.add_argument("--sheets-quota", type=int, default=60, help="분당 읽기/쓰기 요청 한도")
+    p.add_argument("--pace", type=float, default=halloween.LOG_PACE_SEC, help="시트 요청 사이 간격(초)")
+    p.add_argument("--engine", choices=["thread", "asyncio"], default="thread", help="로그 기록 엔진")
+    p.add_argument("--timeout", type=float, default=300.0)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_battle_log_storm)
+
+    p = sub.add_parser("html", help="본문 HTML → 텍스트 퍼징 + 처리량")
+    p.add_argument("--fuzz", type=int, default=20000, help="차등 퍼징 건수")
+    p.add_argument("--size", type=int, default=20000, help="긴 본문 길이(자)")
+    p.add_argument("--iterations", type=int, default=5)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_html)
+
+    p = sub.add_parser("grammar", help="전투 커맨드 형식 검사 퍼징 + 속도 비교")
+    p.add_argument("--fuzz", type=int, default=20000, help="아티팩트 표마다 퍼징할 선언 수")
+    p.add_argument("--artifacts", type=int, default=500, help="처리량 측정에 쓸 아티팩트 표 크기")
+    p.add_argument("--iterations", type=int, default=5)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_grammar)
+
+    p = sub.add_parser("storage", help="player_db 저장소 백엔드 비교")
+    p.add_argument("--players", type=int, default=2000)
+    p.add_argument("--commits", type=int, default=4000)
+    p.add_argument("--threads", type=int, default=snowman_bot.DISPATCH_WORKERS)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_storage)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
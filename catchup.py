@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+스트림이 끊겨 있던 동안 놓친 멘션 따라잡기 (눈사람 봇 / 전투 로그봇 공용)
+
+- NotificationCursor: 처리를 마친 알림 위치를 파일에 저장
+- catch_up(): 저장된 ID 이후의 멘션 알림을 오래된 것부터 페이지 단위로 가져와
+  스트림과 같은 핸들러로 넘긴다. (핸들러는 cursor.is_new() 로 중복을 거른다)
+
+핸들러가 알림을 워커 대기열에 넘기고 바로 돌아오는 경우(눈사람 봇)에는 begin()/done() 으로
+처리 중인 알림을 표시한다. 파일에는 아직 끝나지 않은 가장 오래된 알림 바로 앞까지만 저장하므로
+대기열에 남은 채로 종료되어도 다음 시작 때 따라잡기로 다시 받는다.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from mastodon import MastodonRatelimitError
+
+import metrics
+
+# 알림 API 한 페이지 크기 (마스토돈 최대값)
+CATCHUP_PAGE_LIMIT = 80
+
+# 커서 파일 저장 최소 간격(초). 따라잡기 중 수천 건을 처리해도 파일은 가끔만 쓴다.
+CURSOR_SAVE_INTERVAL = 2.0
+
+
+class NotificationCursor:
+    """
+    알림 ID (숫자 문자열) 위치를 파일에 저장/복원.
+
+    - last_id: 지금까지 받은 가장 큰 알림 ID (메모리, 중복 확인용)
+    - 파일: 처리가 끝나지 않은 알림이 있으면 그중 가장 작은 ID - 1, 없으면 last_id
+    """
+
+    def __init__(self, path: str, save_interval: float = CURSOR_SAVE_INTERVAL):
+        self.path = path
+        self.save_interval = save_interval
+        self.last_id = None
+        self._pending = Counter()  # 처리 중인 알림 ID(int) → begin 횟수
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = 0.0
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.last_id = json.load(f).get("last_id")
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    def is_new(self, notification_id) -> bool:
+        """아직 받지 않은 (커서보다 큰) 알림인지."""
+        last_id = self.last_id
+        return last_id is None or int(notification_id) > int(last_id)
+
+    def begin(self, notification_id):
+        """처리를 시작한 알림. done() 전까지는 파일에 저장되는 위치가 이 알림 앞에 머문다."""
+        with self._lock:
+            if self.is_new(notification_id):
+                self.last_id = str(notification_id)
+            self._pending[int(notification_id)] += 1
+
+    def done(self, notification_id):
+        """begin() 한 알림의 처리가 끝남 (성공/실패 모두, 파일 저장은 save_interval 마다)"""
+        with self._lock:
+            key = int(notification_id)
+            self._pending[key] -= 1
+            if self._pending[key] <= 0:
+                del self._pending[key]
+            self._dirty = True
+            if time.monotonic() - self._saved_at < self.save_interval:
+                return
+        self.save()
+
+    def advance(self, notification_id):
+        """바로 처리를 마친 알림으로 커서를 옮긴다. (뒤로는 가지 않음)"""
+        self.begin(notification_id)
+        self.done(notification_id)
+
+    def _saved_position(self):
+        if self._pending:
+            return str(min(self._pending) - 1)
+        return self.last_id
+
+    def save(self):
+        """처리가 끝난 위치를 파일에 원자적으로 기록."""
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"last_id": self._saved_position()}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            self._saved_at = time.monotonic()
+
+
+def _fetch_page(api, **kwargs):
+    """알림 한 페이지 조회. rate limit(429)에 걸리면 리셋 시각까지 기다렸다가 다시 요청."""
+    while True:
+        try:
+            metrics.inc("mastodon_calls_total", op="notifications")
+            return api.notifications(**kwargs)
+        except MastodonRatelimitError:
+            metrics.inc("mastodon_429_total", op="notifications")
+            reset = getattr(api, "ratelimit_reset", None)
+            wait = max(1.0, reset - time.time()) if reset else 5.0
+            logging.warning("따라잡기 중 rate limit, %.1f초 대기", wait)
+            time.sleep(wait)
+
+
+def catch_up(api, handle, cursor: NotificationCursor, page_limit: int = CATCHUP_PAGE_LIMIT) -> int:
+    """
+    커서 이후에 도착한 멘션 알림을 오래된 것부터 handle(notification) 으로 넘긴다.
+
+    - min_id 로 페이지를 넘기므로 커서 바로 다음 알림부터 앞으로 진행한다.
+    - 저장된 커서가 없으면(첫 실행) 과거 알림은 처리하지 않고 최신 알림 ID로 커서만 맞춘다.
+
+    반환값: 핸들러로 넘긴 알림 수
+    """
+    if cursor.last_id is None:
+        latest = _fetch_page(api, limit=1)
+        if latest:
+            cursor.advance(latest[0]["id"])
+            cursor.save()
+        logging.info("저장된 알림 커서가 없어 따라잡기를 건너뜁니다. (커서=%s)", cursor.last_id)
+        return 0
+
+    started = time.monotonic()
+    handled = 0
+    min_id = cursor.last_id
+
+    while True:
+        page = _fetch_page(api, min_id=min_id, limit=page_limit, types=["mention"])
+        if not page:
+            break
+
+        page = sorted(page, key=lambda n: int(n["id"]))
+        for notification in page:
+            handle(notification)
+            handled += 1
+
+        min_id = page[-1]["id"]
+        if len(page) < page_limit:
+            break
+
+    cursor.save()
+    if handled:
+        logging.info(
+            "놓친 멘션 %d건 따라잡기 완료 (%.2fs, 커서=%s)",
+            handled, time.monotonic() - started, cursor.last_id,
+        )
+    return handled
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+이미 처리한 툿(status) ID 기억하기 (눈사람 봇 / 전투 로그봇 공용)
+
+재접속·따라잡기·스트림 중복으로 같은 툿이 다시 들어와도
+크기 변경이나 로그 기록이 두 번 적용되지 않도록 한다.
+처리에 실패한 툿은 forget() 으로 지워 두어 다시 들어오면 재시도한다.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+SEEN_MAX_SIZE = 10000          # 기억할 최대 ID 수 (넘으면 가장 오래된 것부터 삭제)
+SEEN_TTL_SECONDS = 24 * 3600   # 이 시간보다 오래된 ID는 삭제
+SEEN_SAVE_INTERVAL = 5.0       # 파일 저장 최소 간격(초)
+
+
+class SeenSet:
+    """
+    크기와 보관 시간이 제한된 처리 완료 ID 집합.
+
+    - 삽입 순서대로 OrderedDict 에 보관하므로 확인/추가/만료 삭제가 모두 O(1) (분할 상환)
+    - path 가 주어지면 주기적으로 파일에 저장하고 시작 시 복원한다.
+    """
+
+    def __init__(self, path: str = None, max_size: int = SEEN_MAX_SIZE,
+                 ttl: float = SEEN_TTL_SECONDS, save_interval: float = SEEN_SAVE_INTERVAL):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.save_interval = save_interval
+        self._items = OrderedDict()  # id -> 처음 본 시각(epoch)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = 0.0
+        self.hits = 0      # 중복으로 걸러낸 횟수
+        self.misses = 0    # 처음 본 ID 수
+        self.evicted = 0   # 크기/시간 제한으로 삭제된 ID 수
+
+        if path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        for key, seen_at in entries[-self.max_size:]:
+            self._items[str(key)] = seen_at
+        self._evict(time.time())
+
+    def _evict(self, now: float):
+        items = self._items
+        while items:
+            key, seen_at = next(iter(items.items()))
+            if now - seen_at < self.ttl and len(items) <= self.max_size:
+                break
+            items.popitem(last=False)
+            self.evicted += 1
+
+    def first_seen(self, key) -> bool:
+        """처음 보는 ID면 기록하고 True, 이미 처리한 ID면 False."""
+        key = str(key)
+        save = False
+        with self._lock:
+            if key in self._items:
+                self.hits += 1
+                return False
+            now = time.time()
+            self._items[key] = now
+            self.misses += 1
+            self._evict(now)
+            self._dirty = True
+            save = self.path and time.monotonic() - self._saved_at >= self.save_interval
+        if save:
+            self.save()
+        return True
+
+    def forget(self, key):
+        """first_seen() 으로 기록한 ID를 지운다. (처리에 실패해 다시 받으면 재시도하도록)"""
+        key = str(key)
+        with self._lock:
+            if self._items.pop(key, None) is not None:
+                self.misses -= 1
+                self._dirty = True
+
+    def __contains__(self, key) -> bool:
+        return str(key) in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+        }
+
+    def save(self):
+        """파일에 원자적으로 기록."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = list(self._items.items())
+            self._dirty = False
+            self._saved_at = time.monotonic()
+
+        with self._save_lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+여러 이벤트 봇을 한 프로세스에서 돌리는 공용 런타임
+
+- 마스토돈 스트림은 하나만 열고, 받은 멘션을 등록된 이벤트 핸들러들에 나눠 준다. (fan-out)
+- Mastodon 클라이언트는 연결 풀을 키운 requests.Session 하나를 함께 쓴다.
+- gspread 클라이언트(서비스 계정 인증)와 SheetsScheduler 도 이벤트끼리 공유한다.
+  → 이벤트가 늘어도 스트림 연결, 인증, 시트 요청 대기열은 하나
+
+주의: 스트림이 하나이므로 함께 등록하는 이벤트는 같은 봇 계정(HOST_ACCESS_TOKEN)을 써야 한다.
+      이벤트 시트들은 HOST_SERVICE_ACCOUNT_FILE 의 서비스 계정에 공유되어 있어야 한다.
+
+이벤트 핸들러 형식:
+    (api, client, scheduler, cursor) 로 생성
+    name                        이벤트 이름
+    claims(notification)        이 멘션을 처리할지 여부 (여러 이벤트가 같은 멘션을 받을 수도 있음)
+    on_notification(notification)  공용 커서의 begin/done 사이에서 호출된다.
+                                처리를 나중에 마치는 핸들러는 cursor.begin/done 으로 직접 위치를 붙잡는다.
+    stop()                      종료 시 남은 작업 정리
+
+사용법:
+    python event_host.py                        # HOST_EVENTS 전체
+    python event_host.py --events snowman       # 일부만
+"""
+
+import argparse
+import logging
+import threading
+import time
+
+import gspread
+import requests
+from mastodon import Mastodon, StreamListener
+from requests.adapters import HTTPAdapter
+
+import halloween
+import metrics
+import snowman_bot
+from catchup import NotificationCursor, catch_up
+from dedup import SeenSet
+from sheets_scheduler import SheetsScheduler
+
+# ============================================================
+# 설정
+# ============================================================
+
+HOST_MASTODON_BASE_URL = snowman_bot.MASTODON_INSTANCE
+HOST_ACCESS_TOKEN = snowman_bot.ACCESS_TOKEN
+HOST_SERVICE_ACCOUNT_FILE = snowman_bot.SERVICE_ACCOUNT_FILE
+HOST_CURSOR_FILE = "event_host_cursor.json"  # 공용 스트림의 마지막 처리 알림 ID
+HOST_HTTP_POOL_SIZE = 16  # Mastodon 세션 연결 풀 크기 (응답 워커 수보다 넉넉하게)
+HOST_EVENTS = ["snowman", "battle_log"]
+HOST_METRICS_PORT = None
+STREAM_RETRY_SECONDS = 5
+
+
+def make_session(pool_size: int = HOST_HTTP_POOL_SIZE) -> requests.Session:
+    """연결을 재사용하는 requests 세션 (keep-alive 연결 풀)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# ============================================================
+# 이벤트 핸들러
+# ============================================================
+
+class SnowmanEvent:
+    """눈사람 게임 (snowman_bot.SnowmanBot 을 공용 연결로 생성)"""
+
+    name = "snowman"
+
+    def __init__(self, api, client, scheduler: SheetsScheduler, cursor: NotificationCursor):
+        self.bot = snowman_bot.SnowmanBot(
+            mastodon=api,
+            spreadsheet=scheduler.call(client.open, snowman_bot.SHEET_NAME, kind="read"),
+            scheduler=scheduler,
+            # 명령은 워커가 나중에 처리하므로, 처리를 마칠 때까지 공용 커서가 그 알림을 지나 저장되지 않도록
+            cursor=cursor,
+        )
+
+    def claims(self, notification) -> bool:
+        # 눈사람 명령이 있거나 '눈사람'을 언급한 멘션만 (오타 안내 포함)
+        text = snowman_bot.html_to_text(notification["status"].get("content"))
+        command, _ = snowman_bot.COMMAND_MATCHER.match(text)
+        return command is not None or "눈사람" in text
+
+    def on_notification(self, notification):
+        self.bot.on_mention(notification)
+
+    def stop(self):
+        self.bot.shutdown()
+
+
+class BattleLogEvent:
+    """전투 로그 (halloween.BattleLogListener + 로그 워커)"""
+
+    name = "battle_log"
+
+    def __init__(self, api, client, scheduler: SheetsScheduler, cursor: NotificationCursor):
+        halloween.configure(client=client, scheduler=scheduler)
+        self.seen = SeenSet(halloween.SEEN_FILE)
+        # 스풀 기록까지 on_notification 안에서 끝나므로 커서는 공용 런타임의 begin/done 으로 충분 (리스너에는 넘기지 않음)
+        self.listener = halloween.BattleLogListener(api, None, self.seen)
+        self.worker = threading.Thread(target=halloween.log_worker, name="battle-log-worker", daemon=True)
+        self.worker.start()
+
+    def claims(self, notification) -> bool:
+        return halloween.should_handle(halloween.html_to_text(notification["status"].get("content")))
+
+    def on_notification(self, notification):
+        self.listener.on_notification(notification)
+
+    def stop(self):
+        halloween.get_spool().close()
+        self.worker.join(timeout=10)
+        self.seen.save()
+
+
+EVENT_TYPES = {
+    SnowmanEvent.name: SnowmanEvent,
+    BattleLogEvent.name: BattleLogEvent,
+}
+
+
+# ============================================================
+# 공용 런타임
+# ============================================================
+
+class EventHost(StreamListener):
+    """스트림 하나를 받아 멘션을 등록된 이벤트들에 나눠 주는 리스너 + 실행 루프"""
+
+    def __init__(self, api, handlers, cursor: NotificationCursor):
+        super().__init__()
+        self.api = api
+        self.handlers = list(handlers)
+        self.cursor = cursor
+
+    def on_notification(self, notification):
+        if notification.get("type") != "mention":
+            return
+
+        # 따라잡기와 스트림이 겹쳐 같은 알림이 두 번 오는 경우 무시
+        if not self.cursor.is_new(notification["id"]):
+            return
+
+        # 모든 핸들러가 받아 간 뒤에야 커서가 이 알림을 지나 저장된다
+        self.cursor.begin(notification["id"])
+        try:
+            for handler in self.handlers:
+                try:
+                    if handler.claims(notification):
+                        metrics.inc("event_host_dispatched_total", event=handler.name)
+                        handler.on_notification(notification)
+                except Exception:
+                    # 한 이벤트의 오류가 다른 이벤트 처리를 막지 않도록
+                    logging.exception("이벤트 처리 오류 (%s, 알림 %s)", handler.name, notification.get("id"))
+        finally:
+            self.cursor.done(notification["id"])
+
+    def on_error(self, error):
+        logging.warning("스트리밍 오류 발생: %s", error)
+
+    def run(self):
+        while True:
+            try:
+                catch_up(self.api, self.on_notification, self.cursor)
+                logging.info("공용 스트림 시작 (이벤트: %s)", ", ".join(h.name for h in self.handlers))
+                self.api.stream_user(self, run_async=False, reconnect_async=True)
+            except Exception:
+                logging.exception("스트림 에러 발생, %d초 후 재접속", STREAM_RETRY_SECONDS)
+                time.sleep(STREAM_RETRY_SECONDS)
+            finally:
+                self.cursor.save()
+
+    def stop(self):
+        for handler in self.handlers:
+            try:
+                handler.stop()
+            except Exception:
+                logging.exception("이벤트 종료 오류 (%s)", handler.name)
+        self.cursor.save()
+
+
+def build_host(event_names, api=None, client=None, scheduler: SheetsScheduler = None) -> EventHost:
+    """공용 연결을 만들고(넘겨받은 것은 그대로 사용) 이벤트들을 등록한 EventHost 반환"""
+    started = time.monotonic()
+    if api is None:
+        api = Mastodon(
+            api_base_url=HOST_MASTODON_BASE_URL,
+            access_token=HOST_ACCESS_TOKEN,
+            session=make_session(),
+            ratelimit_method="throw",
+        )
+    if client is None:
+        client = gspread.service_account(filename=HOST_SERVICE_ACCOUNT_FILE)
+    if scheduler is None:
+        scheduler = SheetsScheduler("event_host")
+
+    cursor = NotificationCursor(HOST_CURSOR_FILE)
+    handlers = [EVENT_TYPES[name](api, client, scheduler, cursor) for name in event_names]
+    logging.info("이벤트 %d개 시작 완료 (%.2fs)", len(handlers), time.monotonic() - started)
+    return EventHost(api, handlers, cursor)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    parser = argparse.ArgumentParser(description="여러 이벤트 봇 공용 런타임")
+    parser.add_argument("--events", default=",".join(HOST_EVENTS),
+                        help=f"쉼표로 구분한 이벤트 이름 ({', '.join(EVENT_TYPES)})")
+    args = parser.parse_args()
+    event_names = [name.strip() for name in args.events.split(",") if name.strip()]
+    unknown = [name for name in event_names if name not in EVENT_TYPES]
+    if unknown:
+        parser.error(f"알 수 없는 이벤트: {', '.join(unknown)}")
+
+    if HOST_METRICS_PORT:
+        metrics.start_server(HOST_METRICS_PORT)
+
+    host = build_host(event_names)
+    try:
+        host.run()
+    finally:
+        host.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+가짜 Mastodon / gspread (벤치마크용, 네트워크 없이 프로세스 안에서 동작)
+
+- FakeMastodon: 알림 스트림, notifications(), status_reply() 를 흉내내고
+  호출 지연과 rate limit(429, X-RateLimit-* 값)을 설정할 수 있다.
+- FakeClient / FakeSpreadsheet / FakeWorksheet: 봇이 쓰는 gspread 메서드를 메모리에서 처리하고
+  분당 읽기/쓰기 할당량을 넘기면 실제와 같은 APIError(429)를 던진다.
+"""
+
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from gspread.exceptions import APIError
+from mastodon import MastodonRatelimitError
+
+
+# ============================================================
+# Mastodon
+# ============================================================
+
+class FakeMastodon:
+    """
+    Mastodon 대역.
+
+    latency: 호출마다 걸리는 시간(초)
+    ratelimit_limit / ratelimit_window: window 초 동안 허용하는 요청 수 (넘으면 429)
+    forced_429: 이 수만큼 다음 요청을 남은 횟수와 상관없이 429 로 거절 (같은 토큰을 쓰는 다른 클라이언트가
+                한도를 다 쓴 경우처럼 1초 뒤 리셋). 봇이 실제 Mastodon.py 예외를 받아 처리하는 경로 확인용
+    """
+
+    def __init__(self, latency: float = 0.0, ratelimit_limit: int = 300,
+                 ratelimit_window: float = 300.0, acct: str = "bot", forced_429: int = 0):
+        self.latency = latency
+        self.forced_429 = forced_429
+        self.ratelimit_limit = ratelimit_limit
+        self.ratelimit_window = ratelimit_window
+        self.acct = acct
+        self.ratelimit_remaining = ratelimit_limit
+        self.ratelimit_reset = time.time() + ratelimit_window
+        self.calls = Counter()
+        self.replies = []        # (in_reply_to_id, text, 보낸 시각 monotonic)
+        self.notifications_log = []
+        self._streamed = 0
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def _request(self, name: str):
+        """지연 + rate limit 처리 (실제 API처럼 X-RateLimit-* 값을 갱신)"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[name] += 1
+            now = time.time()
+            if now >= self.ratelimit_reset:
+                self.ratelimit_remaining = self.ratelimit_limit
+                self.ratelimit_reset = now + self.ratelimit_window
+            if self.forced_429 > 0:
+                self.forced_429 -= 1
+                self.ratelimit_remaining = 0
+                self.ratelimit_reset = now + 1.0
+            if self.ratelimit_remaining <= 0:
+                self.calls["429"] += 1
+                raise MastodonRatelimitError("Too many requests")
+            self.ratelimit_remaining -= 1
+
+    # --- 테스트 입력 ---
+
+    def push_mention(self, acct: str, account_id, content: str, display_name: str = None) -> dict:
+        """멘션 알림 하나를 만들어 대기열에 추가"""
+        with self._lock:
+            notification_id = str(self._next_id)
+            self._next_id += 1
+            notification = {
+                "id": notification_id,
+                "type": "mention",
+                "status": {
+                    "id": f"s{notification_id}",
+                    "content": content,
+                    "account": {"id": account_id, "acct": acct, "display_name": display_name or acct},
+                },
+            }
+            self.notifications_log.append(notification)
+        return notification
+
+    # --- Mastodon.py 와 같은 이름의 메서드 ---
+
+    def account_verify_credentials(self):
+        self._request("account_verify_credentials")
+        return {"id": 0, "acct": self.acct}
+
+    def status_reply(self, to_status, status, **kwargs):
+        self._request("status_reply")
+        with self._lock:
+            self.replies.append((to_status.get("id"), status, time.monotonic()))
+        return {"id": f"r{len(self.replies)}", "content": status}
+
+    def status_post(self, status, **kwargs):
+        self._request("status_post")
+        with self._lock:
+            self.replies.append((kwargs.get("in_reply_to_id"), status, time.monotonic()))
+        return {"id": f"p{len(self.replies)}", "content": status}
+
+    def notifications(self, min_id=None, since_id=None, max_id=None, limit=40, types=None, **kwargs):
+        """실제 API처럼 최신순으로 반환. min_id 가 있으면 그 바로 다음 페이지."""
+        self._request("notifications")
+        with self._lock:
+            items = [
+                n for n in self.notifications_log
+                if (types is None or n["type"] in types)
+                and (max_id is None or int(n["id"]) < int(max_id))
+            ]
+        lower = min_id if min_id is not None else since_id
+        if lower is not None:
+            items = [n for n in items if int(n["id"]) > int(lower)]
+        if min_id is not None:
+            return list(reversed(items[:limit]))
+        return list(reversed(items))[:limit]
+
+    def stream_user(self, listener, run_async=False, reconnect_async=False, **kwargs):
+        """아직 스트림으로 보내지 않은 알림을 모두 listener 에 전달하고 반환 (스트림 종료 흉내)"""
+        with self._lock:
+            pending = self.notifications_log[self._streamed:]
+            self._streamed = len(self.notifications_log)
+        for notification in pending:
+            listener.on_notification(notification)
+
+
+# ============================================================
+# gspread
+# ============================================================
+
+class _FakeResponse:
+    """gspread.exceptions.APIError 가 읽는 requests.Response 흉내"""
+
+    def __init__(self, code: int, message: str):
+        self.status_code = code
+        self._payload = {"error": {"code": code, "message": message, "status": "RESOURCE_EXHAUSTED"}}
+        self.text = str(self._payload)
+
+    def json(self):
+        return self._payload
+
+
+_A1_CELL_RE = re.compile(r"^([A-Z]+)(\d+)$")
+
+
+def _col_to_index(letters: str) -> int:
+    index = 0
+    for ch in letters:
+        index = index * 26 + (ord(ch) - ord("A") + 1)
+    return index
+
+
+def _split_range(a1: str):
+    """"'시트'!A2:B10" → ('시트', 'A2:B10'), "A2" → (None, 'A2')"""
+    if "!" in a1:
+        sheet, cells = a1.rsplit("!", 1)
+        if sheet.startswith("'") and sheet.endswith("'"):
+            sheet = sheet[1:-1].replace("''", "'")
+        return sheet, cells
+    return None, a1
+
+
+def _parse_cells(cells: str):
+    """'A2:B10' → (row1, col1, row2, col2)"""
+    start, _, end = cells.partition(":")
+    m1 = _A1_CELL_RE.match(start)
+    m2 = _A1_CELL_RE.match(end or start)
+    return int(m1.group(2)), _col_to_index(m1.group(1)), int(m2.group(2)), _col_to_index(m2.group(1))
+
+
+class SheetsQuota:
+    """분당 읽기/쓰기 요청 수 제한 (넘으면 429)"""
+
+    def __init__(self, reads_per_minute: int = 300, writes_per_minute: int = 300):
+        self.limits = {"read": reads_per_minute, "write": writes_per_minute}
+        self._window = {"read": [], "write": []}
+        self._lock = threading.Lock()
+
+    def check(self, kind: str):
+        with self._lock:
+            now = time.monotonic()
+            window = [t for t in self._window[kind] if now - t < 60.0]
+            if len(window) >= self.limits[kind]:
+                self._window[kind] = window
+                raise APIError(_FakeResponse(429, f"Quota exceeded for {kind} requests per minute"))
+            window.append(now)
+            self._window[kind] = window
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title: str, values=None):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self._cells = {}
+        for r, row in enumerate(values or [], start=1):
+            for c, value in enumerate(row, start=1):
+                if value not in ("", None):
+                    self._cells[(r, c)] = value
+
+    def _call(self, name: str, kind: str):
+        self.spreadsheet._call(name, kind)
+
+    def _read(self, r1, c1, r2, c2):
+        rows = []
+        for r in range(r1, r2 + 1):
+            row = [str(self._cells.get((r, c), "")) for c in range(c1, c2 + 1)]
+            while row and row[-1] == "":
+                row.pop()
+            rows.append(row)
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def _write(self, r1, c1, values):
+        for dr, row in enumerate(values):
+            for dc, value in enumerate(row):
+                self._cells[(r1 + dr, c1 + dc)] = value
+
+    def _last_row(self):
+        return max((r for r, _ in self._cells), default=0)
+
+    # --- gspread.Worksheet 와 같은 이름의 메서드 ---
+
+    def cell(self, row, col):
+        self._call("cell", "read")
+        value = self._cells.get((row, col))
+        return SimpleNamespace(row=row, col=col, value=None if value is None else str(value))
+
+    def get(self, range_name):
+        self._call("get", "read")
+        return self._read(*_parse_cells(_split_range(range_name)[1]))
+
+    def get_all_values(self):
+        self._call("get_all_values", "read")
+        max_col = max((c for _, c in self._cells), default=0)
+        return [row + [""] * (max_col - len(row)) for row in self._read(1, 1, self._last_row(), max_col)]
+
+    def update_cell(self, row, col, value):
+        self._call("update_cell", "write")
+        self._cells[(row, col)] = value
+
+    def update(self, range_name, values, **kwargs):
+        self._call("update", "write")
+        r1, c1, _, _ = _parse_cells(_split_range(range_name)[1])
+        self._write(r1, c1, values)
+
+    def batch_update(self, data, **kwargs):
+        self._call("batch_update", "write")
+        for entry in data:
+            r1, c1, _, _ = _parse_cells(_split_range(entry["range"])[1])
+            self._write(r1, c1, entry["values"])
+
+    def append_row(self, values, **kwargs):
+        self._call("append_row", "write")
+        self._write(self._last_row() + 1, 1, [values])
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows", "write")
+        self._write(self._last_row() + 1, 1, values)
+
+
+class FakeSpreadsheet:
+    """
+    latency: 요청마다 걸리는 시간(초)
+    quota: SheetsQuota (None이면 제한 없음)
+    calls: 메서드별 호출 수 (워크시트 호출 포함)
+    """
+
+    def __init__(self, title: str = "fake", latency: float = 0.0, quota: SheetsQuota = None):
+        self.title = title
+        self.latency = latency
+        self.quota = quota
+        self.calls = Counter()
+        self._worksheets = {}
+        self._lock = threading.Lock()
+
+    def _call(self, name: str, kind: str):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[name] += 1
+        if self.quota is not None:
+            try:
+                self.quota.check(kind)
+            except APIError:
+                with self._lock:
+                    self.calls["429"] += 1
+                raise
+
+    def total_calls(self) -> int:
+        return sum(count for name, count in self.calls.items() if name != "429")
+
+    def add_worksheet(self, title: str, rows=1000, cols=26, values=None):
+        ws = FakeWorksheet(self, title, values)
+        self._worksheets[title] = ws
+        return ws
+
+    def worksheet(self, title: str):
+        self._call("worksheet", "read")
+        try:
+            return self._worksheets[title]
+        except KeyError:
+            raise APIError(_FakeResponse(400, f"Unable to parse range: {title}"))
+
+    def worksheets(self):
+        self._call("worksheets", "read")
+        return list(self._worksheets.values())
+
+    def values_get(self, range_name, params=None):
+        self._call("values_get", "read")
+        sheet, cells = _split_range(range_name)
+        return {"range": range_name, "values": self._worksheets[sheet]._read(*_parse_cells(cells))}
+
+    def values_batch_get(self, ranges, params=None):
+        self._call("values_batch_get", "read")
+        value_ranges = []
+        for a1 in ranges:
+            sheet, cells = _split_range(a1)
+            ws = self._worksheets[sheet]
+            value_ranges.append({"range": a1, "values": ws._read(*_parse_cells(cells))})
+        return {"spreadsheetId": self.title, "valueRanges": value_ranges}
+
+    def values_batch_update(self, body):
+        self._call("values_batch_update", "write")
+        for entry in body.get("data", []):
+            sheet, cells = _split_range(entry["range"])
+            r1, c1, _, _ = _parse_cells(cells)
+            self._worksheets[sheet]._write(r1, c1, entry["values"])
+        return {"totalUpdatedCells": sum(len(e["values"]) for e in body.get("data", []))}
+
+
+class FakeClient:
+    """gspread.Client 대역 (open 만 지원)"""
+
+    def __init__(self, *spreadsheets: FakeSpreadsheet):
+        self._spreadsheets = {ss.title: ss for ss in spreadsheets}
+
+    def open(self, title: str):
+        return self._spreadsheets[title]
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+눈사람 게임 명령 저널 (이벤트 기록 + 스냅숏 + 빠른 복구)
+
+- 처리된 명령마다 (사용자, 팀, 명령, 무작위 결과, 시각, 바뀐 셀의 최종 값) 을 JSON Lines 로 한 줄 추가
+  셀 값은 변화량이 아니라 결과 값이라 같은 이벤트를 두 번 적용해도 상태가 같다.
+- 주기적으로 전체 팀 셀을 스냅숏 파일에 한 줄로 추가 (그 시점의 저널 위치 포함)
+- 시작 시 마지막 스냅숏 + 그 뒤의 저널만 읽어 팀 상태를 복구 (시트를 다시 읽지 않음)
+- 저널은 지우지 않으므로 특정 시점의 상태를 다시 계산해 볼 수 있다. (audit)
+
+저널 한 줄:
+    {"seq": 12, "ts": 1766570000.12, "user": "1234", "team": "1조", "cmd": "[눈사람/던지기]",
+     "rng": {"delta": -3}, "cells": {"A2": 197}}
+    시트 대조로 운영자 수정을 캐시에 반영한 경우: {"seq": 13, ..., "user": "", "team": "1조", "cmd": "reconcile", "cells": {"A2": 150}}
+스냅숏 한 줄:
+    {"seq": 12, "offset": 3456, "ts": ..., "teams": {"1조": {"A1": "닉네임", "A2": 197, ...}}, "pending": [["1조", "A2"]]}
+    pending: 스냅숏 당시 아직 시트에 기록되지 않았던 셀 (복구 시 다시 기록)
+
+사용법:
+    python game_journal.py audit --at "2025-12-24 18:00" [--team 1조]   # 그 시각의 팀 상태/점수
+    python game_journal.py audit --seq 1200
+    python game_journal.py history [--team 1조] [--user 1234] [--since ...] [--until ...]
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+JOURNAL_SNAPSHOT_EVERY = 500  # 이벤트 몇 건마다 스냅숏을 남길지
+RECONCILE_COMMAND = "reconcile"  # 시트 대조 이벤트의 cmd
+
+Recovery = namedtuple("Recovery", ["seq", "teams", "pending", "events"])
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def read_events(path: str, offset: int = 0):
+    """offset 바이트 위치부터 저널 이벤트를 차례로 읽는다. (잘린 마지막 줄은 무시)"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+    except FileNotFoundError:
+        return
+
+
+def read_snapshots(path: str):
+    """스냅숏 파일의 스냅숏들을 오래된 것부터 읽는다."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+    except FileNotFoundError:
+        return
+
+
+def apply_event(teams: dict, event: dict):
+    """{팀: {셀: 값}} 에 이벤트의 셀 값을 덮어쓴다."""
+    teams.setdefault(event["team"], {}).update(event.get("cells", {}))
+
+
+class GameJournal:
+    """
+    명령 저널 + 스냅숏.
+
+    record() 는 여러 명령 처리 워커에서 동시에 불릴 수 있다. (seq 는 전체에서 하나씩 증가)
+    snapshot() 은 저널 위치를 먼저 정한 뒤 상태를 복사하므로,
+    그 사이에 적용된 명령은 복구 때 한 번 더 적용될 뿐 (결과 값이라 상태는 같음) 빠지지 않는다.
+    """
+
+    def __init__(self, path: str, snapshot_path: str, snapshot_every: int = JOURNAL_SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self.seq = 0
+        self.since_snapshot = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "ab")
+
+    def _truncate_partial_line(self):
+        """마지막 줄이 쓰다가 끊긴 경우 잘라낸다. (다음 기록이 그 줄에 이어 붙지 않도록)"""
+        try:
+            with open(self.path, "rb+") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                if size == 0:
+                    return
+                f.seek(size - 1)
+                if f.read(1) == b"\n":
+                    return
+                # 뒤에서부터 마지막 줄바꿈 위치를 찾는다
+                pos = size
+                while pos > 0:
+                    step = min(4096, pos)
+                    pos -= step
+                    f.seek(pos)
+                    chunk = f.read(step)
+                    newline = chunk.rfind(b"\n")
+                    if newline >= 0:
+                        pos += newline + 1
+                        break
+                f.truncate(pos)
+                print(f"경고: {self.path} 의 끊긴 마지막 줄을 잘라냈습니다.")
+        except FileNotFoundError:
+            pass
+
+    def load(self) -> Recovery:
+        """
+        마지막 스냅숏과 그 뒤의 이벤트를 읽는다.
+        반환값: Recovery(seq=스냅숏 seq 또는 None, teams={팀: {셀: 값}}, pending=[(팀, 셀)], events=[...])
+        """
+        with self._lock:
+            self._truncate_partial_line()
+
+            snapshot = None
+            for snapshot in read_snapshots(self.snapshot_path):
+                pass
+
+            if snapshot is None:
+                seq, teams, pending, offset = None, {}, [], 0
+            else:
+                seq = snapshot["seq"]
+                teams = snapshot.get("teams", {})
+                pending = [tuple(key) for key in snapshot.get("pending", [])]
+                offset = snapshot.get("offset", 0)
+
+            events = [event for event in read_events(self.path, offset) if seq is None or event["seq"] > seq]
+            self.seq = events[-1]["seq"] if events else (seq or 0)
+            self.since_snapshot = len(events)
+            return Recovery(seq, teams, pending, events)
+
+    def record(self, user_id, team: str, command: str, cells: dict, rng: dict = None) -> int:
+        """처리된 명령 하나를 기록하고 seq 를 반환"""
+        with self._lock:
+            self._open()
+            self.seq += 1
+            event = {"seq": self.seq, "ts": round(time.time(), 3), "user": str(user_id), "team": team, "cmd": command}
+            if rng:
+                event["rng"] = rng
+            event["cells"] = cells
+            self._file.write((_dumps(event) + "\n").encode("utf-8"))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.since_snapshot += 1
+            return self.seq
+
+    def record_reconcile(self, team: str, cells: dict) -> int:
+        """시트 대조로 캐시에 반영한 셀 값(운영자 수정 등)을 기록. (복구 때 이전 명령 결과가 이 값을 덮어쓰지 않도록)"""
+        return self.record("", team, RECONCILE_COMMAND, cells)
+
+    def due_snapshot(self) -> bool:
+        return self.since_snapshot >= self.snapshot_every
+
+    def snapshot(self, export):
+        """
+        export() → ({팀: {셀: 값}}, [(팀, 셀), ...] 기록 대기 셀) 로 얻은 상태를 스냅숏으로 남긴다.
+        export() 는 저널 잠금 밖에서 부른다. (캐시는 잠금을 잡은 채 record_reconcile 을 부르므로 잠금 순서가 엇갈리지 않도록)
+        """
+        with self._lock:
+            self._open()
+            seq, offset = self.seq, self._file.tell()
+            self.since_snapshot = 0
+        teams, pending = export()
+        entry = {"seq": seq, "offset": offset, "ts": round(time.time(), 3), "teams": teams,
+                 "pending": [list(key) for key in pending]}
+        with self._lock:
+            with open(self.snapshot_path, "a", encoding="utf-8") as f:
+                f.write(_dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        print(f"게임 저널 스냅숏 저장 (seq {seq}, 팀 {len(teams)}개)")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# ============================================================
+# 감사 (특정 시점 상태 재계산 / 이력 조회)
+# ============================================================
+
+def state_at(path: str, snapshot_path: str, until_ts: float = None, until_seq: int = None):
+    """
+    until_ts / until_seq 시점의 팀 셀 상태를 계산한다.
+    그 시점 이전의 가장 최근 스냅숏부터 저널을 다시 적용한다.
+    반환값: ({팀: {셀: 값}}, 마지막으로 적용한 이벤트 또는 None)
+    """
+    def before(entry):
+        if until_seq is not None and entry["seq"] > until_seq:
+            return False
+        return until_ts is None or entry["ts"] <= until_ts
+
+    base = None
+    for snapshot in read_snapshots(snapshot_path):
+        if before(snapshot):
+            base = snapshot
+    teams = {name: dict(cells) for name, cells in (base or {}).get("teams", {}).items()}
+    last = None
+    for event in read_events(path, base["offset"] if base else 0):
+        if base is not None and event["seq"] <= base["seq"]:
+            continue
+        if not before(event):
+            break
+        apply_event(teams, event)
+        last = event
+    return teams, last
+
+
+def _parse_time(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _format_ts(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def main():
+    import snowman_bot  # 점수 계산 규칙은 봇과 같은 것을 사용
+
+    parser = argparse.ArgumentParser(description="눈사람 게임 명령 저널 조회")
+    parser.add_argument("--journal", default=snowman_bot.JOURNAL_FILE)
+    parser.add_argument("--snapshots", default=snowman_bot.JOURNAL_SNAPSHOT_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("audit", help="특정 시점의 팀 상태와 점수")
+    p.add_argument("--at", help="시각 (예: 2025-12-24 18:00, 없으면 마지막 이벤트까지)")
+    p.add_argument("--seq", type=int, help="이 seq 까지 적용")
+    p.add_argument("--team")
+
+    p = sub.add_parser("history", help="명령 이력")
+    p.add_argument("--team")
+    p.add_argument("--user")
+    p.add_argument("--since")
+    p.add_argument("--until")
+    args = parser.parse_args()
+
+    if args.command == "audit":
+        teams, last = state_at(args.journal, args.snapshots, _parse_time(args.at) if args.at else None, args.seq)
+        if last:
+            print(f"마지막 적용 이벤트: seq {last['seq']} ({_format_ts(last['ts'])}) {last['team']} {last['cmd']}")
+        for name in sorted(teams):
+            if args.team and name != args.team:
+                continue
+            state = snowman_bot.TeamState.from_a1(name, teams[name])
+            print(
+                f"{name}: 머리 {state.size('A')} / 몸통 {state.size('B')} | "
+                f"크기 점수 {state.size_scores['A']}+{state.size_scores['B']} | "
+                f"장식 점수 {state.deco_scores['A']}+{state.deco_scores['B']} | 최종 {state.final_score}"
+            )
+    else:
+        since = _parse_time(args.since) if args.since else None
+        until = _parse_time(args.until) if args.until else None
+        for event in read_events(args.journal):
+            if args.team and event["team"] != args.team:
+                continue
+            if args.user and event["user"] != args.user:
+                continue
+            if (since and event["ts"] < since) or (until and event["ts"] > until):
+                continue
+            rng = f" {event['rng']}" if event.get("rng") else ""
+            print(f"{event['seq']:>6} {_format_ts(event['ts'])} {event['team']} {event['user']} {event['cmd']}{rng} {event['cells']}")
+
+
+if __name__ == "__main__":
+    main()
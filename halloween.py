@@ -10,16 +10,33 @@
     2) [공격/1] 같은 슬래시(/) 잘못 사용
     3) 정의되지 않은 커맨드 문자열
     4) 대상 대괄호에 / 가 없는 경우 (최소한의 검사)
-- 구글 시트 기록은 큐에 쌓고, 워커 스레드가 천천히 처리
+- 구글 시트 기록은 디스크 스풀(SQLite)에 쌓고, 워커 스레드가 모아서 append_rows 로 한 번에 처리
+  (프로세스가 죽어도 기록되지 않은 로그는 재시작 시 이어서 기록)
 - 429(Too Many Requests) 발생 시 backoff 하며 재시도
+- 선택: asyncio 엔진 (python halloween.py --engine asyncio, aiohttp 필요)
+    스트림을 aiohttp 로 직접 받아(SSE) 이벤트 루프 안에서 바로 검사하고,
+    시트 기록은 비동기 작업 하나가 스풀에서 꺼내 도착 순서대로 처리한다.
+    재접속은 고정 5초 대신 짧은 대기부터 지수적으로 늘린다.
+- 오프라인 재검사 (python halloween.py --revalidate sheet|로그.csv|로그.jsonl)
+    규칙(VALID_COMMANDS 등)이 바뀐 뒤 지난 로그의 D열 본문을 다시 검사해서
+    결과가 달라진 줄의 G/H열만 batch_update 한 번으로 고친다.
 """
 
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import os
 import logging
 import re
+import sqlite3
 import time
 import threading
-import queue
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime
+from functools import lru_cache
+from html import unescape as html_unescape
 
 import pytz
 import gspread
@@ -27,6 +44,16 @@ from google.oauth2.service_account import Credentials
 from gspread.exceptions import APIError
 from mastodon import Mastodon, StreamListener
 
+try:
+    import aiohttp  # asyncio 엔진에서만 사용
+except ImportError:
+    aiohttp = None
+
+import metrics
+from catchup import NotificationCursor, catch_up
+from dedup import SeenSet
+from sheets_scheduler import PRIORITY_LOG, SheetsScheduler, is_rate_limited
+
 # ============================================================
 # 설정 영역 (네 환경에 맞게 수정)
 # ============================================================
@@ -42,6 +69,9 @@ GOOGLE_SERVICE_JSON = "march-credential.json"
 SHEET_NAME = "전투로그문서"  # 문서 제목
 TAB_LOG    = "전투로그"      # 탭 이름
 
+# 계측 (예: 9109 로 설정하면 http://127.0.0.1:9109/metrics 제공, None이면 비활성)
+METRICS_PORT = None
+
 # 타임존
 KST = pytz.timezone("Asia/Seoul")
 
@@ -84,23 +114,56 @@ REQUIRES_TARGET_ARTIFACTS = {
     "아티팩트_지원"
 }
 
+# 아티팩트 사용 커맨드 (본문에 REQUIRES_TARGET_ARTIFACTS 이름이 있으면 대상 1개 이상 필요)
+ARTIFACT_COMMAND = "사용/아티팩트"
+
+# 형식 검사 결과 캐시 크기 (같은 대괄호 토큰 조합은 다시 검사하지 않음)
+VALIDATE_CACHE_SIZE = 4096
+
 # HTML 태그 제거용 정규식
 HTML_TAG_RE    = re.compile(r"<[^>]+>")
 # 대괄호 안 내용 추출용 정규식
 BRACKET_RE     = re.compile(r"\[([^\]]*)\]")
 
-# 로그 큐 (멘션 내용을 여기 쌓아두고 워커가 처리)
-LOG_QUEUE      = queue.Queue(maxsize=1000)
+# 로그 스풀 (멘션 내용을 디스크(SQLite WAL)에 쌓아두고 워커가 처리, 재시작 시 이어서 기록)
+LOG_SPOOL_FILE = "battle_log_spool.db"
+
+# 마지막으로 처리한 알림 ID (재접속 시 놓친 멘션 따라잡기용)
+NOTIFICATION_CURSOR_FILE = "battle_log_cursor.json"
+
+# 이미 기록한 툿 ID (같은 멘션이 두 번 기록되지 않도록)
+SEEN_FILE = "battle_log_seen.json"
+
+# 로그 워커 배치 설정
+LOG_BATCH_MAX       = 50     # 한 번의 append_rows 로 기록할 기본 최대 줄 수
+LOG_BATCH_LIMIT_MAX = 500    # 429가 계속될 때 늘릴 수 있는 최대 줄 수
+LOG_BATCH_WAIT_MS   = 500    # 첫 항목 이후 더 모으기 위해 기다리는 최대 시간(ms)
+LOG_PACE_SEC        = 1.0    # 시트 요청 사이 기본 간격(초)
+LOG_PACE_MAX_SEC    = 30.0   # 429가 계속될 때 늘릴 수 있는 최대 간격(초)
+LOG_RECOVER_AFTER   = 10     # 연속 성공 몇 번마다 배치/간격을 기본값 쪽으로 되돌릴지
+LOG_MAX_FAILURES    = 5      # 429가 아닌 오류로 이만큼 실패한 배치는 dead 테이블로 옮김
+LOG_STATS_INTERVAL  = 60     # 워커 통계 로그 주기(초)
+
+# asyncio 엔진 설정 (--engine asyncio)
+ASYNC_STREAMING_BASE_URL  = None   # 스트리밍 서버 주소 (None이면 인스턴스 정보의 streaming_api 사용)
+ASYNC_STREAM_IDLE_TIMEOUT = 90     # 이 시간(초) 동안 heartbeat 도 없으면 끊긴 것으로 보고 재접속
+ASYNC_RECONNECT_MIN       = 0.5    # 재접속 첫 대기(초), 실패할 때마다 2배
+ASYNC_RECONNECT_MAX       = 30.0   # 재접속 최대 대기(초)
+ASYNC_RECONNECT_RESET     = 60     # 이 시간(초) 이상 연결이 유지되었으면 대기를 처음 값으로
+
+# 오프라인 재검사 설정 (--revalidate)
+REVALIDATE_CHUNK_SIZE = 5000   # 프로세스 하나에 한 번에 넘길 줄 수
+REVALIDATE_OUTPUT     = "revalidate_changes.csv"  # 파일 입력일 때 바뀐 줄 목록을 저장할 파일
 
 # ============================================================
 # 유틸 함수
 # ============================================================
 
 def html_to_text(html: str) -> str:
-    """아주 단순하게 HTML 태그를 제거하고 공백을 정리."""
+    """HTML 태그를 제거하고 엔티티(&amp; 등)를 복원한 뒤 공백을 정리."""
     if not html:
         return ""
-    text = HTML_TAG_RE.sub(" ", html)
+    text = html_unescape(HTML_TAG_RE.sub(" ", html))
     return " ".join(text.split())
 
 
@@ -121,31 +184,181 @@ def should_handle(text: str) -> bool:
         return False
     return any(kw in text for kw in TRIGGER_KEYWORDS)
 
-def get_required_target_min(cmd: str, target_tokens, text: str) -> int:
+def _trie_regex(words):
     """
-    커맨드와 전체 텍스트를 보고 '최소 몇 개의 대상 대괄호가 필요하냐'를 결정한다.
-    - 기본값은 REQUIRED_TARGET_MIN에서 가져오고
-    - 사용/아티팩트인 경우에는 텍스트 내 아티 이름 등에 따라 예외 처리 가능
+    단어 목록 → 공통 접두사를 묶은 정규식 (트라이를 그대로 정규식으로 옮긴 것)
+    예: ["곡옥", "곡궁", "방패"] → "(?:곡(?:궁|옥)|방패)"
+    search() 한 번으로 본문에 단어 중 하나라도 있는지 알 수 있다. (단어가 없으면 None)
+    """
+    words = list(words)
+    if not words:
+        return None
+
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}  # 단어 끝 표시
+
+    def emit(node):
+        alts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if "" in node:
+            # 여기서 끝나는 단어가 있으면 뒤쪽은 선택 사항
+            return "(?:" + body + ")?"
+        return body
+
+    return re.compile(emit(trie))
+
+
+class CommandGrammar:
+    """
+    VALID_COMMANDS / REQUIRED_TARGET_MIN / 아티팩트 규칙을 한 번 컴파일해 둔 형식 검사기.
+
+    - 커맨드 허용 여부와 최소 대상 수는 dict 조회 한 번
+    - 대상이 필요한 아티팩트 이름은 트라이 정규식으로 본문을 한 번만 훑는다. (아티팩트 커맨드일 때만)
+    - 결과는 (대괄호 토큰 튜플, 아티팩트 이름 포함 여부) 기준으로 LRU 캐시
+      → 레이드에서 같은 선언이 반복되면 검사 비용이 거의 들지 않고, 표가 커져도 비용이 늘지 않는다.
     """
-    base = REQUIRED_TARGET_MIN.get(cmd, 0)
 
-    if cmd == "사용/아티팩트":
-        # 기본적으로는 대상 없어도 된다고 가정 (필요하면 base를 0으로 세팅)
-        required = base
+    def __init__(self, valid_commands, required_min, requires_target_artifacts,
+                 artifact_command: str = ARTIFACT_COMMAND, cache_size: int = VALIDATE_CACHE_SIZE):
+        self.valid_commands = frozenset(valid_commands)
+        self.required_min = dict(required_min)
+        self.artifact_command = artifact_command
+        self.artifact_re = _trie_regex(requires_target_artifacts)
+        self._check = lru_cache(maxsize=cache_size)(self._check_tokens)
+
+    def required_targets(self, cmd: str, text: str) -> int:
+        """커맨드와 전체 텍스트를 보고 최소 몇 개의 대상 대괄호가 필요한지"""
+        return self._required(cmd, cmd == self.artifact_command and self._artifact_in(text))
+
+    def _artifact_in(self, text: str) -> bool:
+        return self.artifact_re is not None and self.artifact_re.search(text) is not None
+
+    def _required(self, cmd: str, artifact_hit: bool) -> int:
+        base = self.required_min.get(cmd, 0)
+        if artifact_hit:
+            # 예: 텍스트 안에 "치유의 곡옥" 같은 특정 아티 이름이 들어있으면 대상 1개를 필수로 둔다.
+            return max(base, 1)
+        return base
+
+    def validate(self, text: str):
+        """validate_command 와 같은 값을 반환"""
+        tokens = tuple(BRACKET_RE.findall(text))
+
+        # 본문 내용에 따라 결과가 달라지는 건 아티팩트 커맨드뿐이므로 그때만 본문을 본다.
+        artifact_hit = False
+        if tokens:
+            idx_cmd = 1 if tokens[0].strip() == "대리 선언" else 0
+            if idx_cmd < len(tokens) and tokens[idx_cmd].strip() == self.artifact_command:
+                artifact_hit = self._artifact_in(text)
+        return self._check(tokens, artifact_hit)
+
+    def cache_info(self):
+        return self._check.cache_info()
+
+    def _check_tokens(self, tokens: tuple, artifact_hit: bool):
+        errors = []
+
+        if not tokens:
+            errors.append("커맨드 대괄호가 없습니다.")
+            return False, None, "", ", ".join(errors)
+
+        # 0) [대리 선언] 프리픽스 처리
+        idx_cmd = 0
+
+        first = tokens[0].strip()
+        if first == "대리 선언":
+            idx_cmd = 1
+            if len(tokens) <= 1:
+                # [대리 선언]만 있고 실제 커맨드가 없는 경우
+                errors.append("대리 선언 뒤에 실제 행동 커맨드가 없습니다.")
+                return False, None, "", ", ".join(errors)
+
+        # 1) 커맨드 토큰 결정
+        raw_cmd = tokens[idx_cmd]
+        cmd = raw_cmd.strip()
+
+        # [공격/1] 같은 잘못된 형식
+        if BAD_SLASH_CMD_RE.match(cmd):
+            errors.append(
+                f"커맨드는 [공격 1]처럼 공백으로 쓰고, 슬래시(/)는 사용하지 않습니다: [{raw_cmd}]"
+            )
+
+        # 허용된 커맨드인지 체크
+        if cmd not in self.valid_commands:
+            errors.append(f"알 수 없는 커맨드입니다: [{raw_cmd}]")
+
+        effective_cmd = cmd if cmd in self.valid_commands else None
+
+        # 2) 대상 토큰들 (대리 선언/커맨드 대괄호를 제외한 나머지)
+        target_tokens = tokens[idx_cmd + 1 :]
+        targets_str = ""
+        if target_tokens:
+            targets_str = "".join(f"[{t}]" for t in target_tokens)
+
+        # 3) 대상 형식 및 개수 검사
+        # - / 없는 대상만 잡는다
+        if target_tokens:
+            for t in target_tokens:
+                if "/" not in t:
+                    errors.append(f"대상 대괄호 안에 '/'가 없습니다: [{t}]")
 
-        # 예: 텍스트 안에 "치유의 곡옥" 같은 특정 아티 이름이 들어있으면
-        #     대상 1개를 필수로 둔다.
-        for name in REQUIRES_TARGET_ARTIFACTS:
-            if name in text:
-                required = max(required, 1)
+        # "최소 N개의 대상이 필요" 조건 검사
+        required_min = 0
+        if effective_cmd is not None:
+            required_min = self._required(effective_cmd, artifact_hit)
 
-        return required
+        if required_min > 0:
+            if len(target_tokens) < required_min:
+                if target_tokens:
+                    errors.append(
+                        f"커맨드 [{cmd}] 에는 최소 {required_min}개의 대상 대괄호가 필요합니다. "
+                        f"(현재 {len(target_tokens)}개)"
+                    )
+                else:
+                    errors.append(
+                        f"커맨드 [{cmd}] 에는 최소 {required_min}개의 대상 대괄호가 필요합니다. "
+                        f"현재 대상이 전혀 지정되지 않았습니다."
+                    )
+
+        # 4) 최종 결과
+        is_valid = len(errors) == 0
+        error_msg = ", ".join(errors)
+
+        # cmd는 '실제 행동 커맨드'만 반환 (대리 선언 여부는 여기선 따로 안 기록)
+        return is_valid, effective_cmd, targets_str, error_msg
+
+
+GRAMMAR = None  # compile_grammar() 결과
+
+
+def compile_grammar() -> CommandGrammar:
+    """설정 표(VALID_COMMANDS 등)로 형식 검사기를 만든다. 표를 바꿨으면 다시 호출."""
+    global GRAMMAR
+    GRAMMAR = CommandGrammar(VALID_COMMANDS, REQUIRED_TARGET_MIN, REQUIRES_TARGET_ARTIFACTS)
+    return GRAMMAR
+
+
+compile_grammar()
+
+
+def get_required_target_min(cmd: str, target_tokens, text: str) -> int:
+    """
+    커맨드와 전체 텍스트를 보고 '최소 몇 개의 대상 대괄호가 필요하냐'를 결정한다.
+    - 기본값은 REQUIRED_TARGET_MIN에서 가져오고
+    - 사용/아티팩트인 경우에는 텍스트 내 아티 이름(REQUIRES_TARGET_ARTIFACTS)이 있으면 1개 이상
+    """
+    return GRAMMAR.required_targets(cmd, text)
 
-    return base
 
 def validate_command(text: str):
     """
-    멘션 전체 텍스트를 받아 전투 커맨드 형식을 검사.
+    멘션 전체 텍스트를 받아 전투 커맨드 형식을 검사. (컴파일된 GRAMMAR 사용, 결과 캐시)
 
     반환값:
         is_valid: bool
@@ -156,80 +369,7 @@ def validate_command(text: str):
     특이 사항:
         - 첫 대괄호가 [대리 선언]이면, 두 번째 대괄호를 실제 커맨드로 본다.
     """
-    errors = []
-    tokens = extract_bracket_tokens(text)
-
-    if not tokens:
-        errors.append("커맨드 대괄호가 없습니다.")
-        return False, None, "", ", ".join(errors)
-
-    # 0) [대리 선언] 프리픽스 처리
-    idx_cmd = 0
-    is_proxy = False
-
-    first = tokens[0].strip()
-    if first == "대리 선언":
-        is_proxy = True
-        idx_cmd = 1
-        if len(tokens) <= 1:
-            # [대리 선언]만 있고 실제 커맨드가 없는 경우
-            errors.append("대리 선언 뒤에 실제 행동 커맨드가 없습니다.")
-            return False, None, "", ", ".join(errors)
-
-    # 1) 커맨드 토큰 결정
-    raw_cmd = tokens[idx_cmd]
-    cmd = raw_cmd.strip()
-
-    # [공격/1] 같은 잘못된 형식
-    if BAD_SLASH_CMD_RE.match(cmd):
-        errors.append(
-            f"커맨드는 [공격 1]처럼 공백으로 쓰고, 슬래시(/)는 사용하지 않습니다: [{raw_cmd}]"
-        )
-
-    # 허용된 커맨드인지 체크
-    if cmd not in VALID_COMMANDS:
-        errors.append(f"알 수 없는 커맨드입니다: [{raw_cmd}]")
-
-    effective_cmd = cmd if cmd in VALID_COMMANDS else None
-
-    # 2) 대상 토큰들 (대리 선언/커맨드 대괄호를 제외한 나머지)
-    target_tokens = tokens[idx_cmd + 1 :]
-    targets_str = ""
-    if target_tokens:
-        targets_str = "".join(f"[{t}]" for t in target_tokens)
-
-    # 3) 대상 형식 및 개수 검사
-    # - / 없는 대상만 잡는다
-    # - 커맨드별 최소 대상 개수는 get_required_target_min()으로 결정
-    if target_tokens:
-        for t in target_tokens:
-            if "/" not in t:
-                errors.append(f"대상 대괄호 안에 '/'가 없습니다: [{t}]")
-
-    # "최소 N개의 대상이 필요" 조건 검사
-    required_min = 0
-    if effective_cmd is not None:
-        required_min = get_required_target_min(effective_cmd, target_tokens, text)
-
-    if required_min > 0:
-        if len(target_tokens) < required_min:
-            if target_tokens:
-                errors.append(
-                    f"커맨드 [{cmd}] 에는 최소 {required_min}개의 대상 대괄호가 필요합니다. "
-                    f"(현재 {len(target_tokens)}개)"
-                )
-            else:
-                errors.append(
-                    f"커맨드 [{cmd}] 에는 최소 {required_min}개의 대상 대괄호가 필요합니다. "
-                    f"현재 대상이 전혀 지정되지 않았습니다."
-                )
-
-    # 4) 최종 결과
-    is_valid = len(errors) == 0
-    error_msg = ", ".join(errors)
-
-    # cmd는 '실제 행동 커맨드'만 반환 (대리 선언 여부는 여기선 따로 안 기록)
-    return is_valid, (effective_cmd), targets_str, error_msg
+    return GRAMMAR.validate(text)
 
 
 # ============================================================
@@ -237,6 +377,27 @@ def validate_command(text: str):
 # ============================================================
 
 _SHEET_CACHE = None  # 전역 워크시트 캐시
+_CLIENT = None  # 공용 런타임이 넘겨준 gspread 클라이언트 (없으면 직접 인증)
+_SCHEDULER_CACHE = None  # 전역 Sheets 스케줄러
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def configure(client=None, scheduler: SheetsScheduler = None):
+    """공용 런타임(event_host)에서 gspread 클라이언트와 Sheets 스케줄러를 다른 이벤트와 공유할 때 호출."""
+    global _CLIENT, _SCHEDULER_CACHE
+    _CLIENT = client
+    with _SCHEDULER_LOCK:
+        _SCHEDULER_CACHE = scheduler
+
+
+def get_scheduler() -> SheetsScheduler:
+    """Sheets 스케줄러 (configure 로 받은 것이 없으면 전용으로 하나 생성)"""
+    global _SCHEDULER_CACHE
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER_CACHE is None:
+            _SCHEDULER_CACHE = SheetsScheduler("battle_log")
+        return _SCHEDULER_CACHE
+
 
 def get_sheet():
     """구글 시트 워크시트를 한 번 열어두고 캐시."""
@@ -244,26 +405,32 @@ def get_sheet():
     if _SHEET_CACHE is not None:
         return _SHEET_CACHE
 
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    creds = Credentials.from_service_account_file(GOOGLE_SERVICE_JSON, scopes=scopes)
-    client = gspread.authorize(creds)
-    ss = client.open(SHEET_NAME)
-    ws = ss.worksheet(TAB_LOG)
+    client = _CLIENT
+    if client is None:
+        scopes = [
+            "https://www.googleapis.com/auth/spreadsheets",
+            "https://www.googleapis.com/auth/drive",
+        ]
+        creds = Credentials.from_service_account_file(GOOGLE_SERVICE_JSON, scopes=scopes)
+        client = gspread.authorize(creds)
+    scheduler = get_scheduler()
+    ss = scheduler.call(client.open, SHEET_NAME, kind="read", priority=PRIORITY_LOG)
+    ws = scheduler.call(ss.worksheet, TAB_LOG, kind="read", priority=PRIORITY_LOG)
     _SHEET_CACHE = ws
     logging.info("Google Sheet 연결 완료: %s / %s", SHEET_NAME, TAB_LOG)
     return ws
 
 
-def append_log_row(nickname: str, handle: str, text: str,
-                   is_valid: bool, cmd: str, targets: str, error_msg: str):
-    """전투 로그 한 줄을 시트에 추가."""
-    ws = get_sheet()
-    ts = datetime.now(KST).strftime("%Y-%m-%d %H:%M:%S")
+def now_ts() -> str:
+    return datetime.now(KST).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def build_log_row(nickname: str, handle: str, text: str,
+                  is_valid: bool, cmd: str, targets: str, error_msg: str, ts: str = None):
+    """전투 로그 한 줄(A~H열)을 만든다. ts 가 없으면 현재 시각."""
+    ts = ts or now_ts()
 
-    row = [
+    return [
         ts,                              # A: 타임스탬프
         nickname,                        # B: 러너 닉네임
         f"@{handle}" if handle else "",  # C: 계정
@@ -274,59 +441,325 @@ def append_log_row(nickname: str, handle: str, text: str,
         error_msg,                       # H: 오류 사유
     ]
 
-    ws.append_row(row, value_input_option="USER_ENTERED")
-    logging.info(
-        "시트 기록 완료 | nick=%s handle=%s valid=%s cmd=%s errors=%s",
-        nickname, handle, is_valid, cmd, error_msg
-    )
+
+def append_log_rows(rows):
+    """전투 로그 여러 줄을 단일 append_rows 요청으로 시트에 추가."""
+    ws = get_sheet()
+    metrics.inc("sheets_calls_total", bot="battle_log", op="append_rows")
+    with metrics.timed("battle_log_stage_seconds", stage="sheets_append"):
+        # 429 는 _write_batch 가 배치 크기/간격을 조절하며 직접 재시도하므로 retries=0
+        get_scheduler().call(
+            ws.append_rows, rows, value_input_option="USER_ENTERED",
+            kind="write", priority=PRIORITY_LOG, retries=0,
+        )
+    logging.info("시트 기록 완료 | %d줄", len(rows))
+
+
+def append_log_row(nickname: str, handle: str, text: str,
+                   is_valid: bool, cmd: str, targets: str, error_msg: str):
+    """전투 로그 한 줄을 시트에 추가."""
+    append_log_rows([build_log_row(nickname, handle, text, is_valid, cmd, targets, error_msg)])
 
 
 # ============================================================
-# 로그 워커 (큐 소비 + 429 재시도)
+# 로그 스풀 (SQLite WAL, 확인 응답 후 삭제)
 # ============================================================
 
-def log_worker():
+class LogSpool:
     """
-    큐에 쌓인 로그를 하나씩 꺼내서 구글 시트에 기록하는 워커.
+    디스크에 저장되는 로그 대기열.
 
-    - 기본적으로 요청 사이에 짧게 sleep해서 속도 제한
-    - 429(Too Many Requests) 발생 시 backoff 하며 재시도
+    - put(): 한 줄 INSERT (WAL + synchronous=NORMAL 이라 저렴함). 가득 차서 버리는 일은 없다.
+    - get_batch(): 아직 꺼내지 않은 항목을 id 순서대로 꺼낸다. (꺼낸 항목은 in-flight)
+    - ack(): 기록이 끝난 항목 삭제 / release(): 실패한 항목을 다음 배치에서 다시 꺼내도록 되돌림
+    - 프로세스가 죽으면 ack 되지 않은 항목은 다음 시작 시 그대로 다시 기록된다.
     """
-    while True:
-        item = LOG_QUEUE.get()  # (nickname, handle, text, is_valid, cmd, targets, error_msg)
-        if item is None:
-            LOG_QUEUE.task_done()
-            break
 
-        nickname, handle, text, is_valid, cmd, targets, error_msg = item
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool_dead (id INTEGER PRIMARY KEY, payload TEXT NOT NULL, failed_at TEXT)"
+        )
+        self._cond = threading.Condition()
+        self._closed = False
+        self._last_id = 0       # 지금까지 꺼낸 가장 큰 id
+        self._retry = []        # release 된 (id, item) — 다음 배치에서 먼저 꺼냄
+        self._depth = self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        self._in_flight = 0
+        if self._depth:
+            logging.info("스풀에 기록되지 않은 로그 %d건이 남아 있어 이어서 기록합니다.", self._depth)
+
+    def put(self, item: dict):
+        payload = json.dumps(item, ensure_ascii=False)
+        with self._cond:
+            self._conn.execute("INSERT INTO spool (payload) VALUES (?)", (payload,))
+            self._depth += 1
+            self._cond.notify()
+
+    def qsize(self) -> int:
+        """ack 되지 않은 전체 항목 수 (꺼내서 기록 중인 것 포함)"""
+        return self._depth
+
+    def _available(self) -> int:
+        return self._depth - self._in_flight
+
+    def get_batch(self, max_items: int, wait_ms: int):
+        """
+        최대 max_items개를 꺼낸다.
+        첫 항목은 올 때까지 기다리고, 그 뒤로는 wait_ms 안에 들어온 것까지 모은다.
+
+        반환값: (items, stop) — items 는 [(id, item), ...], stop 은 close() 되었는지 여부
+        """
+        with self._cond:
+            while not self._closed and self._available() <= 0:
+                self._cond.wait()
+            if self._closed:
+                return [], True
+
+            deadline = time.monotonic() + wait_ms / 1000.0
+            while not self._closed and self._available() < max_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._retry[:max_items]
+            self._retry = self._retry[max_items:]
+            if len(batch) < max_items:
+                rows = self._conn.execute(
+                    "SELECT id, payload FROM spool WHERE id > ? ORDER BY id LIMIT ?",
+                    (self._last_id, max_items - len(batch)),
+                ).fetchall()
+                if rows:
+                    self._last_id = rows[-1][0]
+                batch.extend((row_id, json.loads(payload)) for row_id, payload in rows)
+
+            self._in_flight += len(batch)
+            return batch, False
+
+    def ack(self, ids):
+        with self._cond:
+            self._conn.executemany("DELETE FROM spool WHERE id = ?", [(i,) for i in ids])
+            self._depth -= len(ids)
+            self._in_flight -= len(ids)
+
+    def release(self, batch):
+        """기록에 실패한 항목을 되돌림 (순서 유지)"""
+        with self._cond:
+            self._retry = sorted(batch + self._retry, key=lambda pair: pair[0])
+            self._in_flight -= len(batch)
+            self._cond.notify()
+
+    def dead_letter(self, batch):
+        """반복해서 실패한 항목을 spool_dead 테이블로 옮긴다. (버리지 않음)"""
+        with self._cond:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO spool_dead (id, payload, failed_at) VALUES (?, ?, ?)",
+                [(i, json.dumps(item, ensure_ascii=False), now_ts()) for i, item in batch],
+            )
+            self._conn.executemany("DELETE FROM spool WHERE id = ?", [(i,) for i, _ in batch])
+            self._conn.execute("COMMIT")
+            self._depth -= len(batch)
+            self._in_flight -= len(batch)
 
-        max_attempts = 5
-        delay = 1.0  # 첫 재시도 대기 시간(초)
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
 
-        for attempt in range(1, max_attempts + 1):
-            try:
-                append_log_row(nickname, handle, text, is_valid, cmd, targets, error_msg)
-                break  # 성공 시 루프 탈출
-            except APIError as e:
-                # 429가 아니면 그냥 포기
-                if "429" not in str(e):
-                    logging.exception("시트 API 오류 발생 (429 아님), 재시도하지 않음")
-                    break
 
-                logging.warning(
-                    "시트 429 오류, %s초 후 재시도 (%d/%d)",
-                    delay, attempt, max_attempts
-                )
-                time.sleep(delay)
-                delay *= 2  # backoff
-            except Exception:
-                logging.exception("시트 기록 중 알 수 없는 오류, 재시도하지 않음")
+_SPOOL_CACHE = None  # 전역 스풀 캐시
+_SPOOL_LOCK = threading.Lock()
+
+
+def get_spool() -> LogSpool:
+    """로그 스풀을 한 번 열어두고 캐시. (리스너/워커 스레드가 동시에 불러도 하나만 생성)"""
+    global _SPOOL_CACHE
+    with _SPOOL_LOCK:
+        if _SPOOL_CACHE is None:
+            _SPOOL_CACHE = LogSpool(LOG_SPOOL_FILE)
+        return _SPOOL_CACHE
+
+
+# ============================================================
+# 로그 워커 (스풀 소비 + 배치 기록 + 429 재시도)
+# ============================================================
+
+class LogWorkerStats:
+    """로그 워커 처리량 통계 (rows/s, 큐 깊이, 429 횟수 등)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.rows_written = 0
+        self.batches = 0
+        self.errors_429 = 0
+        self.rows_dead = 0
+        self.batch_limit = LOG_BATCH_MAX
+        self.pace = LOG_PACE_SEC
+        self._window_started_at = self.started_at
+        self._window_rows = 0
+
+    def record_batch(self, rows: int):
+        with self._lock:
+            self.rows_written += rows
+            self.batches += 1
+            self._window_rows += rows
+
+    def record_429(self):
+        with self._lock:
+            self.errors_429 += 1
+
+    def record_dead(self, rows: int):
+        with self._lock:
+            self.rows_dead += rows
+
+    def snapshot(self, reset_window: bool = False) -> dict:
+        """현재 통계. rows_per_sec 는 직전 구간(마지막 reset 이후) 기준."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = max(now - self._window_started_at, 1e-9)
+            snap = {
+                "rows_written": self.rows_written,
+                "batches": self.batches,
+                "rows_per_sec": self._window_rows / elapsed,
+                "queue_depth": get_spool().qsize(),
+                "errors_429": self.errors_429,
+                "rows_dead": self.rows_dead,
+                "batch_limit": self.batch_limit,
+                "pace": self.pace,
+            }
+            if reset_window:
+                self._window_started_at = now
+                self._window_rows = 0
+            return snap
+
+
+LOG_STATS = LogWorkerStats()
+
+
+def _write_batch(items) -> bool:
+    """
+    한 배치를 기록. 429면 배치 크기/요청 간격을 늘리고 같은 배치를 재시도한다.
+    반환값: 성공 여부
+    """
+    rows = [build_log_row(**item) for item in items]
+
+    max_attempts = 5
+    delay = 1.0  # 첫 재시도 대기 시간(초)
+
+    for attempt in range(1, max_attempts + 1):
+        try:
+            append_log_rows(rows)
+            LOG_STATS.record_batch(len(rows))
+            metrics.inc("battle_log_rows_written_total", len(rows))
+            return True
+        except APIError as e:
+            # 429가 아니면 이 배치는 재시도하지 않고 되돌린다
+            if not is_rate_limited(e):
+                logging.exception("시트 API 오류 발생 (429 아님), 배치를 스풀에 되돌림")
                 break
 
-        # 너무 빠르게 연속해서 쓰지 않도록 기본 속도 제한
-        time.sleep(0.7)
+            # 요청 수를 줄이기 위해 한 번에 더 많이 모아서, 더 드물게 쓴다.
+            LOG_STATS.record_429()
+            metrics.inc("sheets_429_total", bot="battle_log")
+            LOG_STATS.batch_limit = min(LOG_STATS.batch_limit * 2, LOG_BATCH_LIMIT_MAX)
+            LOG_STATS.pace = min(LOG_STATS.pace * 2, LOG_PACE_MAX_SEC)
 
-        LOG_QUEUE.task_done()
+            logging.warning(
+                "시트 429 오류, %s초 후 재시도 (%d/%d) | batch_limit=%d pace=%.1fs",
+                delay, attempt, max_attempts, LOG_STATS.batch_limit, LOG_STATS.pace
+            )
+            time.sleep(delay)
+            delay *= 2  # backoff
+        except Exception:
+            logging.exception("시트 기록 중 알 수 없는 오류, 배치를 스풀에 되돌림")
+            break
+
+    return False
+
+
+class BatchSettler:
+    """
+    기록 결과에 따라 배치를 ack/release/dead_letter 하는 부분 (스레드 워커/asyncio 작업 공용).
+    연속 성공이면 batch_limit/pace 를 기본값 쪽으로 되돌리고, 연속 실패하면 더 오래 쉰다.
+    """
+
+    def __init__(self, spool: LogSpool):
+        self.spool = spool
+        self.success_streak = 0
+        self.failures = 0
+
+    def settle(self, batch, ok: bool) -> float:
+        """반환값: 다음 배치 전에 추가로 쉴 시간(초)"""
+        spool = self.spool
+        if ok:
+            spool.ack([row_id for row_id, _ in batch])
+            self.failures = 0
+            self.success_streak += 1
+            if self.success_streak >= LOG_RECOVER_AFTER:
+                self.success_streak = 0
+                LOG_STATS.batch_limit = max(LOG_STATS.batch_limit // 2, LOG_BATCH_MAX)
+                LOG_STATS.pace = max(LOG_STATS.pace / 2, LOG_PACE_SEC)
+            return 0.0
+
+        self.success_streak = 0
+        self.failures += 1
+        if self.failures >= LOG_MAX_FAILURES:
+            logging.error("배치 %d건이 %d번 연속 실패하여 spool_dead 테이블로 옮깁니다.", len(batch), self.failures)
+            spool.dead_letter(batch)
+            LOG_STATS.record_dead(len(batch))
+            self.failures = 0
+            return 0.0
+
+        spool.release(batch)
+        # 실패가 이어지면 잠시 더 쉰다
+        return min(LOG_PACE_MAX_SEC, LOG_PACE_SEC * (2 ** self.failures))
+
+
+def log_worker_stats():
+    snap = LOG_STATS.snapshot(reset_window=True)
+    logging.info(
+        "로그 워커 통계 | rows/s=%.2f depth=%d written=%d batches=%d 429=%d dead=%d batch_limit=%d pace=%.1fs",
+        snap["rows_per_sec"], snap["queue_depth"], snap["rows_written"], snap["batches"],
+        snap["errors_429"], snap["rows_dead"], snap["batch_limit"], snap["pace"],
+    )
+
+
+def log_worker():
+    """
+    스풀에 쌓인 로그를 배치로 꺼내서 구글 시트에 기록하는 워커.
+
+    - 최대 batch_limit 개 또는 LOG_BATCH_WAIT_MS 동안 모은 뒤 append_rows 한 번으로 기록
+    - 기록에 성공한 항목만 ack(삭제)하고, 실패한 배치는 스풀에 되돌려 다시 시도
+    - 요청 사이에는 pace 초만큼 쉬어서 속도 제한 (쉬는 동안 쌓인 항목은 다음 배치로 합쳐짐)
+    - 429 발생 시 batch_limit/pace 를 늘리고, 연속 성공하면 기본값 쪽으로 되돌린다
+    """
+    spool = get_spool()
+    settler = BatchSettler(spool)
+    last_stats_at = time.monotonic()
+
+    while True:
+        batch, stop = spool.get_batch(LOG_STATS.batch_limit, LOG_BATCH_WAIT_MS)
+        if stop:
+            break
+
+        ok = _write_batch([item for _, item in batch])
+        time.sleep(settler.settle(batch, ok))
+
+        if time.monotonic() - last_stats_at >= LOG_STATS_INTERVAL:
+            last_stats_at = time.monotonic()
+            log_worker_stats()
+
+        # 너무 빠르게 연속해서 쓰지 않도록 기본 속도 제한
+        time.sleep(LOG_STATS.pace)
 
 
 # ============================================================
@@ -334,73 +767,407 @@ def log_worker():
 # ============================================================
 
 class BattleLogListener(StreamListener):
-    def __init__(self, api: Mastodon):
+    def __init__(self, api: Mastodon, cursor: NotificationCursor = None, seen: SeenSet = None):
         super().__init__()
         self.api = api
+        self.cursor = cursor
+        self.seen = seen if seen is not None else SeenSet()
 
     def on_notification(self, notification):
         # 멘션만 처리
         if notification.get("type") != "mention":
             return
 
+        # 따라잡기와 스트림이 겹쳐 같은 알림이 두 번 오는 경우 무시
+        if self.cursor is not None and not self.cursor.is_new(notification.get("id")):
+            return
+
+        # 커서는 스풀에 넣은 뒤에 옮긴다 (그 전에 죽으면 다음 시작 때 따라잡기로 다시 받음)
+        if self._handle(notification) and self.cursor is not None:
+            self.cursor.advance(notification.get("id"))
+
+    def _handle(self, notification) -> bool:
+        """멘션 하나를 검사해 스풀에 넣는다. 스풀 기록에 실패하면 False"""
         status = notification.get("status") or {}
+
+        # 이미 기록한 툿이면 무시
+        if not self.seen.first_seen(status.get("id")):
+            logging.info("이미 기록한 툿입니다. (status %s) 건너뜁니다.", status.get("id"))
+            return True
+
         content_html = status.get("content") or ""
         text = html_to_text(content_html)
 
         # 전투 커맨드 후보가 아니면 무시
         if not should_handle(text):
-            return
+            return True
 
         account = status.get("account") or {}
         nickname = account.get("display_name") or account.get("acct") or ""
         handle = account.get("acct") or ""
 
-        is_valid, cmd, targets, error_msg = validate_command(text)
+        with metrics.timed("battle_log_stage_seconds", stage="validate"):
+            is_valid, cmd, targets, error_msg = validate_command(text)
 
         logging.info(
             "멘션 처리 | nick=%s handle=%s valid=%s cmd=%s targets=%s errors=%s text=%s",
             nickname, handle, is_valid, cmd, targets, error_msg, text
         )
 
-        # 시트에 직접 쓰지 않고 큐에 넣어서 워커가 처리하게 한다.
+        # 시트에 직접 쓰지 않고 스풀에 넣어서 워커가 처리하게 한다.
         try:
-            LOG_QUEUE.put_nowait(
-                (nickname, handle, text, is_valid, cmd, targets, error_msg)
-            )
-        except queue.Full:
-            logging.error("로그 큐가 가득 찼습니다. 이 멘션은 시트에 기록되지 않습니다.")
+            metrics.inc("battle_log_mentions_total", valid=is_valid)
+            get_spool().put({
+                "ts": now_ts(),
+                "nickname": nickname,
+                "handle": handle,
+                "text": text,
+                "is_valid": is_valid,
+                "cmd": cmd,
+                "targets": targets,
+                "error_msg": error_msg,
+            })
+        except sqlite3.Error:
+            # 커서도 옮기지 않으므로 다음 따라잡기 때 다시 받아 재시도한다
+            logging.exception("로그 스풀 기록 실패. (status %s) 다시 받으면 재시도합니다.", status.get("id"))
+            self.seen.forget(status.get("id"))
+            return False
+        return True
+
+
+# ============================================================
+# asyncio 엔진 (선택, aiohttp 필요)
+# ============================================================
+
+def _streaming_url(api: Mastodon) -> str:
+    """사용자 스트림(SSE) 주소. 스트리밍 서버가 따로 있으면 인스턴스 정보의 streaming_api 를 쓴다."""
+    base = ASYNC_STREAMING_BASE_URL
+    if not base:
+        try:
+            base = api.instance()["urls"]["streaming_api"]
+        except Exception:
+            logging.warning("인스턴스 정보에서 스트리밍 주소를 찾지 못해 %s 를 사용합니다.", MASTODON_BASE_URL)
+            base = MASTODON_BASE_URL
+    base = base.replace("wss://", "https://", 1).replace("ws://", "http://", 1)
+    return base.rstrip("/") + "/api/v1/streaming/user"
+
+
+async def _iter_sse(response):
+    """SSE 응답에서 (event, data) 를 차례로 꺼낸다. (':thump' 같은 heartbeat 주석 줄은 무시)"""
+    event, data = None, []
+    async for raw in response.content:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield event or "message", "\n".join(data)
+            event, data = None, []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+
+
+async def _consume_stream(session, url: str, listener: BattleLogListener):
+    """스트림 한 번 접속해서 끊길 때까지 멘션을 리스너로 넘긴다. (검사와 스풀 기록은 이벤트 루프에서 바로)"""
+    headers = {
+        "Authorization": f"Bearer {MASTODON_ACCESS_TOKEN}",
+        "Accept": "text/event-stream",
+    }
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=ASYNC_STREAM_IDLE_TIMEOUT)
+    async with session.get(url, headers=headers, timeout=timeout) as response:
+        response.raise_for_status()
+        logging.info("전투 로그 스트림 시작 (asyncio)")
+        async for event, data in _iter_sse(response):
+            if event != "notification":
+                continue
+            try:
+                listener.on_notification(json.loads(data))
+            except Exception:
+                logging.exception("알림 처리 오류")
+
+
+async def _async_log_writer(spool: LogSpool):
+    """
+    log_worker 의 asyncio 버전. 로그 탭 하나에 작업 하나만 돌린다.
+    (시트 요청은 어차피 SheetsScheduler 한 줄로 나가므로 작업을 늘려도 빨라지지 않고,
+     여러 작업이 배치를 나눠 꺼내면 로그 줄 순서가 도착 순서와 달라질 수 있다)
+    스풀 대기와 시트 요청은 블로킹 호출이라 스레드에서 실행한다. (스풀을 닫아야 대기 중인 스레드가 끝남)
+    """
+    settler = BatchSettler(spool)
+    while True:
+        batch, stop = await asyncio.to_thread(spool.get_batch, LOG_STATS.batch_limit, LOG_BATCH_WAIT_MS)
+        if stop:
+            break
+
+        ok = await asyncio.to_thread(_write_batch, [item for _, item in batch])
+        await asyncio.sleep(settler.settle(batch, ok) + LOG_STATS.pace)
+
+
+async def _async_log_stats():
+    while True:
+        await asyncio.sleep(LOG_STATS_INTERVAL)
+        log_worker_stats()
+
+
+async def run_async(api: Mastodon, cursor: NotificationCursor, seen: SeenSet):
+    """asyncio 엔진 본체: 스트림 소비 + 비동기 시트 기록 작업 + 재접속"""
+    spool = get_spool()
+    listener = BattleLogListener(api, cursor, seen)
+    writer = asyncio.create_task(_async_log_writer(spool))
+    stats_task = asyncio.create_task(_async_log_stats())
+    delay = ASYNC_RECONNECT_MIN
+    try:
+        url = await asyncio.to_thread(_streaming_url, api)
+        # 멘션 하나(툿 JSON)가 기본 줄 버퍼보다 길 수 있어서 여유 있게
+        async with aiohttp.ClientSession(read_bufsize=2 ** 20) as session:
+            while True:
+                connected_at = time.monotonic()
+                try:
+                    # 스트림이 끊겨 있던 동안 도착한 멘션을 같은 리스너로 먼저 처리
+                    await asyncio.to_thread(catch_up, api, listener.on_notification, cursor)
+                    await _consume_stream(session, url, listener)
+                    logging.warning("스트림 연결이 끊어졌습니다.")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logging.warning("스트리밍 오류 발생: %r", e)
+                except Exception:
+                    logging.exception("스트림 에러 발생")
+                finally:
+                    cursor.save()
+                    seen.save()
+
+                if time.monotonic() - connected_at >= ASYNC_RECONNECT_RESET:
+                    delay = ASYNC_RECONNECT_MIN
+                metrics.inc("battle_log_stream_reconnects_total")
+                logging.info("%.1f초 후 재접속 | 중복 필터 통계 %s", delay, seen.stats())
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, ASYNC_RECONNECT_MAX)
+    finally:
+        stats_task.cancel()
+        # 스풀을 닫으면 기록 작업은 진행 중인 배치를 마치고 끝난다. (남은 항목은 다음 실행에서 기록)
+        spool.close()
+        await asyncio.gather(writer, return_exceptions=True)
+
+
+# ============================================================
+# 오프라인 재검사 (규칙 변경 후 지난 로그 다시 검사)
+# ============================================================
+
+def _log_rows_from_values(rows):
+    """
+    시트 값(또는 같은 형식의 CSV) → (시트 행 번호, D 본문, G, H)
+    G열이 O/X 인 줄만 로그로 본다. (머리글 등은 건너뜀)
+    """
+    for row_no, row in enumerate(rows, start=1):
+        if len(row) < 7 or row[6] not in ("O", "X"):
+            continue
+        yield row_no, row[3], row[6], row[7] if len(row) > 7 else ""
+
+
+def _log_rows_from_jsonl(path: str):
+    """JSONL: 한 줄에 {"row": 시트 행 번호, "text": D 본문, "valid": "O"/"X", "error": H} (row 가 없으면 줄 번호)"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            yield int(entry.get("row", line_no)), entry.get("text", ""), entry.get("valid", ""), entry.get("error", "")
+
+
+def read_log_rows(source: str):
+    """재검사 입력: 'sheet' 면 로그 탭 전체를 get_all_values 한 번으로, 아니면 CSV/JSONL 파일을 한 줄씩"""
+    if source == "sheet":
+        ws = get_sheet()
+        values = get_scheduler().call(ws.get_all_values, kind="read", priority=PRIORITY_LOG)
+        logging.info("로그 탭 %d줄을 읽었습니다.", len(values))
+        return _log_rows_from_values(values)
+    if source.endswith(".jsonl"):
+        return _log_rows_from_jsonl(source)
+
+    def csv_rows():
+        with open(source, "r", encoding="utf-8-sig", newline="") as f:
+            yield from _log_rows_from_values(csv.reader(f))
+
+    return csv_rows()
+
+
+def _revalidate_chunk(chunk):
+    """(행 번호, 본문, G, H) 묶음을 다시 검사해서 결과가 달라진 줄만 (행 번호, 새 G, 새 H) 로 반환"""
+    changed = []
+    for row_no, text, old_valid, old_error in chunk:
+        is_valid, _, _, error_msg = validate_command(text)
+        new_valid = "O" if is_valid else "X"
+        if new_valid != old_valid or error_msg != old_error:
+            changed.append((row_no, new_valid, error_msg))
+    return changed
+
+
+def revalidate_rows(rows, workers: int = None, chunk_size: int = REVALIDATE_CHUNK_SIZE):
+    """
+    rows 를 chunk_size 줄씩 잘라 프로세스 풀에서 다시 검사한다. (workers 가 1 이면 현재 프로세스에서)
+    입력은 한 번에 메모리에 올리지 않고, 진행 중인 묶음이 workers * 2 개를 넘지 않게 흘려 보낸다.
+
+    반환값: (검사한 줄 수, [(행 번호, 새 G, 새 H), ...] 행 번호 순)
+    """
+    workers = workers or os.cpu_count() or 1
+    rows = iter(rows)
+    chunks = iter(lambda: list(itertools.islice(rows, chunk_size)), [])
+    checked = 0
+    changed = []
+
+    if workers <= 1:
+        for chunk in chunks:
+            checked += len(chunk)
+            changed.extend(_revalidate_chunk(chunk))
+        return checked, sorted(changed)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for chunk in chunks:
+            checked += len(chunk)
+            pending.add(pool.submit(_revalidate_chunk, chunk))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    changed.extend(future.result())
+        for future in pending:
+            changed.extend(future.result())
+    return checked, sorted(changed)
+
+
+def _changed_ranges(changed):
+    """연속된 행은 하나의 범위로 묶어 batch_update 데이터로 만든다."""
+    data = []
+    for _, group in itertools.groupby(enumerate(changed), key=lambda pair: pair[1][0] - pair[0]):
+        run = [entry for _, entry in group]
+        data.append({
+            "range": f"G{run[0][0]}:H{run[-1][0]}",
+            "values": [[valid, error] for _, valid, error in run],
+        })
+    return data
+
+
+def write_back_changes(changed):
+    """바뀐 G/H열만 batch_update 한 번으로 기록"""
+    if not changed:
+        return
+    ws = get_sheet()
+    data = _changed_ranges(changed)
+    metrics.inc("sheets_calls_total", bot="battle_log", op="batch_update")
+    get_scheduler().call(ws.batch_update, data, kind="write", priority=PRIORITY_LOG)
+    logging.info("G/H열 %d줄 (범위 %d개) 수정 완료", len(changed), len(data))
+
+
+def run_revalidate(source: str, workers: int = None, chunk_size: int = REVALIDATE_CHUNK_SIZE,
+                   write_back: bool = True, output: str = REVALIDATE_OUTPUT):
+    """
+    지난 로그를 현재 규칙으로 다시 검사한다.
+    - source 가 'sheet' 면 바뀐 줄을 바로 시트에 반영 (write_back=False 면 목록만 저장)
+    - 파일 입력은 바뀐 줄 목록을 output 에 저장하고, write_back 이면 그 행 번호로 시트에도 반영
+    """
+    started = time.monotonic()
+    checked, changed = revalidate_rows(read_log_rows(source), workers, chunk_size)
+    logging.info(
+        "재검사 완료 | %d줄 중 %d줄 변경 (%.2fs, %.0f줄/s)",
+        checked, len(changed), time.monotonic() - started, checked / max(time.monotonic() - started, 1e-9),
+    )
+
+    if output and changed:
+        with open(output, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["row", "G", "H"])
+            writer.writerows(changed)
+        logging.info("변경 목록 저장: %s", output)
+
+    if write_back:
+        write_back_changes(changed)
+    return checked, changed
 
 
 # ============================================================
 # main
 # ============================================================
 
+def run_threaded(api: Mastodon, cursor: NotificationCursor, seen: SeenSet):
+    """기존 엔진: 블로킹 stream_user + 로그 워커 스레드"""
+    worker_thread = threading.Thread(target=log_worker, daemon=True)
+    worker_thread.start()
+    logging.info("로그 워커 스레드 시작")
+
+    listener = BattleLogListener(api, cursor, seen)
+
+    while True:
+        try:
+            # 스트림이 끊겨 있던 동안 도착한 멘션을 같은 리스너로 먼저 처리
+            catch_up(api, listener.on_notification, cursor)
+
+            logging.info("전투 로그 스트림 시작")
+            api.stream_user(listener, run_async=False, reconnect_async=True)
+        except Exception:
+            logging.exception("스트림 에러 발생, 5초 후 재시도")
+            logging.info("중복 필터 통계 | %s", seen.stats())
+            time.sleep(5)
+        finally:
+            cursor.save()
+            seen.save()
+
+
 def main():
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s %(levelname)s %(message)s",
     )
 
+    parser = argparse.ArgumentParser(description="전투 커맨드 로그봇")
+    parser.add_argument("--engine", choices=["thread", "asyncio"], default="thread",
+                        help="thread: 기존 스트림 + 워커 스레드, asyncio: aiohttp 스트림 + 비동기 기록 (aiohttp 필요)")
+    parser.add_argument("--revalidate", metavar="SOURCE",
+                        help="봇을 띄우지 않고 지난 로그를 다시 검사 (sheet 또는 CSV/JSONL 파일 경로)")
+    parser.add_argument("--workers", type=int, default=None, help="재검사 프로세스 수 (기본: CPU 수)")
+    parser.add_argument("--chunk-size", type=int, default=REVALIDATE_CHUNK_SIZE, help="재검사 묶음 크기(줄)")
+    parser.add_argument("--write-back", action="store_true", help="파일 입력일 때도 바뀐 G/H열을 시트에 반영")
+    parser.add_argument("--dry-run", action="store_true", help="시트 입력일 때 시트는 고치지 않고 변경 목록만 저장")
+    args = parser.parse_args()
+
+    if args.revalidate:
+        write_back = not args.dry_run if args.revalidate == "sheet" else args.write_back
+        run_revalidate(args.revalidate, args.workers, args.chunk_size, write_back=write_back)
+        return
+    if args.engine == "asyncio" and aiohttp is None:
+        parser.error("asyncio 엔진에는 aiohttp 가 필요합니다. (pip install aiohttp)")
+
+    if METRICS_PORT:
+        metrics.describe("battle_log_stage_seconds", "단계별 처리 시간(초)")
+        metrics.start_server(METRICS_PORT)
+    metrics.gauge_callback("battle_log_queue_depth", lambda: get_spool().qsize())
+
     logging.info("Mastodon 연결 시도")
     api = Mastodon(
         api_base_url=MASTODON_BASE_URL,
         access_token=MASTODON_ACCESS_TOKEN,
     )
 
-    # 로그 워커 스레드 시작
-    worker_thread = threading.Thread(target=log_worker, daemon=True)
-    worker_thread.start()
-    logging.info("로그 워커 스레드 시작")
-
-    listener = BattleLogListener(api)
+    cursor = NotificationCursor(NOTIFICATION_CURSOR_FILE)
+    seen = SeenSet(SEEN_FILE)
 
-    logging.info("전투 로그 스트림 시작")
-    while True:
+    if args.engine == "asyncio":
         try:
-            api.stream_user(listener, run_async=False, reconnect_async=True)
-        except Exception:
-            logging.exception("스트림 에러 발생, 5초 후 재시도")
-            time.sleep(5)
+            asyncio.run(run_async(api, cursor, seen))
+        except KeyboardInterrupt:
+            logging.info("종료합니다.")
+        finally:
+            # run_async 가 정리하기 전에 끝난 경우에도 스풀 대기 스레드가 종료를 막지 않도록
+            get_spool().close()
+            cursor.save()
+            seen.save()
+    else:
+        run_threaded(api, cursor, seen)
 
 
 if __name__ == "__main__":
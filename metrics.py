@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+가벼운 계측 모듈 (눈사람 봇 / 전투 로그봇 공용)
+
+- 단계별 처리 시간 히스토그램, API 호출/429 카운터, 큐 깊이 게이지
+- start_server(port) 로 로컬 HTTP /metrics 엔드포인트(Prometheus 텍스트 형식) 제공
+- enable() 하기 전에는 모든 기록 함수가 아무 일도 하지 않는다. (비활성 시 오버헤드 거의 없음)
+
+사용 예:
+    with metrics.timed("snowman_stage_seconds", stage="command"):
+        ...
+    metrics.inc("sheets_calls_total", op="append_rows")
+    metrics.gauge_callback("battle_log_queue_depth", lambda: spool.qsize())
+"""
+
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 지연 시간 히스토그램 버킷 (초)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_ENABLED = False
+_LOCK = threading.Lock()
+_COUNTERS = {}   # (name, labels) -> float
+_HISTOGRAMS = {}  # (name, labels) -> [bucket counts..., sum, count]
+_GAUGES = {}     # (name, labels) -> callable 또는 값
+_HELP = {}
+
+
+def enable():
+    """계측 시작. 이전에는 기록 함수가 모두 무시된다."""
+    global _ENABLED
+    _ENABLED = True
+
+
+def is_enabled() -> bool:
+    return _ENABLED
+
+
+def describe(name: str, text: str):
+    """/metrics 출력의 # HELP 문구"""
+    _HELP[name] = text
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, amount: float = 1, **labels):
+    """카운터 증가"""
+    if not _ENABLED:
+        return
+    key = _key(name, labels)
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + amount
+
+
+def observe(name: str, value: float, **labels):
+    """히스토그램에 값 하나 기록"""
+    if not _ENABLED:
+        return
+    key = _key(name, labels)
+    with _LOCK:
+        hist = _HISTOGRAMS.get(key)
+        if hist is None:
+            hist = _HISTOGRAMS[key] = [0] * len(DEFAULT_BUCKETS) + [0.0, 0]
+        for index, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                hist[index] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+
+def set_gauge(name: str, value: float, **labels):
+    """게이지 값 설정"""
+    if not _ENABLED:
+        return
+    with _LOCK:
+        _GAUGES[_key(name, labels)] = value
+
+
+def gauge_callback(name: str, fn, **labels):
+    """/metrics 를 읽을 때마다 fn() 으로 값을 구하는 게이지 (큐 깊이 등)"""
+    with _LOCK:
+        _GAUGES[_key(name, labels)] = fn
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(name: str, **labels):
+    """with 블록의 실행 시간을 히스토그램에 기록 (비활성 시 공용 no-op 객체 반환)"""
+    if not _ENABLED:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+# ============================================================
+# Prometheus 텍스트 출력 + HTTP 서버
+# ============================================================
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def render() -> str:
+    """현재 값을 Prometheus 텍스트 형식으로 출력"""
+    with _LOCK:
+        counters = dict(_COUNTERS)
+        histograms = {key: list(value) for key, value in _HISTOGRAMS.items()}
+        gauges = dict(_GAUGES)
+
+    lines = []
+    typed = set()
+
+    def header(name, kind):
+        if name in typed:
+            return
+        typed.add(name)
+        if name in _HELP:
+            lines.append(f"# HELP {name} {_HELP[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), value in sorted(gauges.items(), key=lambda item: item[0]):
+        if callable(value):
+            try:
+                value = value()
+            except Exception:
+                continue
+        header(name, "gauge")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), hist in sorted(histograms.items()):
+        header(name, "histogram")
+        for bound, count in zip(DEFAULT_BUCKETS, hist):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {hist[-1]}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {hist[-2]}")
+        lines.append(f"{name}_count{_format_labels(labels)} {hist[-1]}")
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int, host: str = "127.0.0.1"):
+    """계측을 켜고 /metrics HTTP 서버를 데몬 스레드로 시작"""
+    enable()
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    logging.info("metrics 엔드포인트 시작: http://%s:%d/metrics", host, port)
+    return server
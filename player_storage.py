@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+player_db 저장소 백엔드 (눈사람 봇)
+
+PlayerDB 는 메모리의 데이터를 기준으로 동작하고, 변경은 사용자 한 명 단위로 저장소에 넘긴다.
+저장소는 직렬화된 레코드(JSON 으로 바로 쓸 수 있는 dict)만 다룬다.
+
+- JsonJournalStorage: 기존 player_db.json + 변경분 저널(JSON Lines). 저널이 길어지면 전체 파일로 압축.
+- SqliteStorage: SQLite (WAL) 의 players 테이블. 변경은 행 하나 INSERT/UPDATE.
+
+공통 메서드:
+    load()                    → {user_id: 레코드} (JSON 백엔드는 남은 저널도 적용)
+    put(user_id, record)      사용자 한 명 저장 (레코드 전체, 새 사용자)
+    update(user_id, fields, removed)
+                              이미 있는 사용자의 바뀐 필드만 저장 (diff_record 결과)
+                              → 운영자가 같은 사용자의 다른 필드를 고쳤어도 덮어쓰지 않는다.
+    rename(old, new, record)  사용자 키 변경 (ACCT → 숫자 ID)
+    replace_all(records)      전체 교체 (마이그레이션용)
+    changed()                 마지막 load() 이후 외부(운영자)에서 수정되었는지
+    close()
+
+마이그레이션:
+    python player_storage.py migrate --to sqlite   # player_db.json(+저널) → player_db.sqlite3
+    python player_storage.py migrate --to json     # 반대 방향
+"""
+
+import argparse
+import copy
+import json
+import os
+import sqlite3
+import threading
+
+
+def read_json_file(path: str) -> dict:
+    """player_db.json 을 그대로 읽는다. (없거나 깨졌으면 빈 dict)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        print(f"경고: {path} 파일을 찾을 수 없거나 형식이 잘못되었습니다. 빈 DB를 시작합니다.")
+        return {}
+
+
+def diff_record(previous: dict, record: dict):
+    """
+    previous → record 로 바뀐 필드만 골라낸다. 반환값: (바뀐 필드 {키: 값}, 삭제된 키 목록)
+    dict 값(cooldown_times 등)은 바뀐 하위 키만 담는다. (운영자가 같은 dict 의 다른 키를 고쳤어도 덮어쓰지 않도록)
+    """
+    fields = {}
+    for key, value in record.items():
+        old = previous.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            changed = {sub: sub_value for sub, sub_value in value.items() if old.get(sub) != sub_value}
+            if changed:
+                fields[key] = changed
+        elif key not in previous or old != value:
+            fields[key] = value
+    removed = [key for key in previous if key not in record]
+    return fields, removed
+
+
+def apply_patch(record: dict, fields: dict, removed=()):
+    """diff_record 결과를 record 에 제자리에서 적용"""
+    for key, value in fields.items():
+        if isinstance(value, dict) and isinstance(record.get(key), dict):
+            record[key].update(value)
+        else:
+            record[key] = value
+    for key in removed:
+        record.pop(key, None)
+
+
+def write_json_file(records: dict, path: str):
+    """레코드 전체를 JSON 파일에 저장 (임시 파일에 쓴 뒤 원자적으로 교체)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, indent=4, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# ============================================================
+# JSON 파일 + 저널
+# ============================================================
+
+class JsonJournalStorage:
+    """
+    player_db.json + 변경분 저널.
+
+    - put()/update()/rename() 은 저널에 한 줄 추가 (fsync)
+      update() 는 레코드 전체가 아니라 바뀐 필드만 기록한다. (op=patch)
+      → 운영자가 직접 고친 파일 위에 저널을 다시 적용해도 봇이 바꾸지 않은 필드는 운영자 값이 남는다.
+    - 저널이 compact_every 줄을 넘으면 전체를 JSON 파일로 압축하고 저널을 비운다.
+    - 운영자가 player_db.json 을 직접 수정하면 mtime 변화로 감지한다.
+    """
+
+    def __init__(self, path: str, journal_path: str, compact_every: int = 100):
+        self.path = path
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self._records = {}
+        self._journal_count = 0
+        self._mtime = None
+        self._lock = threading.RLock()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> dict:
+        with self._lock:
+            records = read_json_file(self.path)
+            replayed = self._replay_journal(records)
+            self._records = records
+            self._mtime = self._file_mtime()
+            if replayed:
+                print(f"저널 {replayed}건을 복구했습니다. DB 파일을 압축합니다.")
+                self.compact()
+            # 호출한 쪽이 레코드를 고쳐도 압축용 사본은 바뀌지 않도록 복사해서 반환
+            return copy.deepcopy(records)
+
+    def _replay_journal(self, records: dict) -> int:
+        """저널의 변경분을 records 에 적용하고 적용한 줄 수를 반환 (잘린 마지막 줄은 무시)"""
+        replayed = 0
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+                    op = entry.get('op')
+                    if op == 'set':
+                        records[entry['user_id']] = entry['data']
+                    elif op == 'patch':
+                        # 운영자가 파일에서 지운 사용자는 되살리지 않음
+                        if entry['user_id'] in records:
+                            apply_patch(records[entry['user_id']], entry['fields'], entry.get('removed', ()))
+                    elif op == 'rename':
+                        if entry['old'] in records:
+                            records[entry['new']] = records.pop(entry['old'])
+                            records[entry['new']].setdefault('acct', entry['old'])
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        return replayed
+
+    def _append(self, entry: dict):
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_count += 1
+        if self._journal_count >= self.compact_every:
+            self.compact()
+
+    def put(self, user_id: str, record: dict):
+        with self._lock:
+            self._records[user_id] = record
+            self._append({'op': 'set', 'user_id': user_id, 'data': record})
+
+    def update(self, user_id: str, fields: dict, removed=()):
+        with self._lock:
+            apply_patch(self._records.setdefault(user_id, {}), copy.deepcopy(fields), removed)
+            entry = {'op': 'patch', 'user_id': user_id, 'fields': fields}
+            if removed:
+                entry['removed'] = list(removed)
+            self._append(entry)
+
+    def rename(self, old_id: str, new_id: str, record: dict):
+        with self._lock:
+            self._records.pop(old_id, None)
+            self._records[new_id] = record
+            self._append({'op': 'rename', 'old': old_id, 'new': new_id})
+
+    def replace_all(self, records: dict):
+        with self._lock:
+            self._records = dict(records)
+            self.compact()
+
+    def compact(self):
+        """전체 레코드를 파일에 원자적으로 기록하고 저널을 비운다."""
+        with self._lock:
+            write_json_file(self._records, self.path)
+            with open(self.journal_path, 'w', encoding='utf-8') as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_count = 0
+            self._mtime = self._file_mtime()
+
+    def changed(self) -> bool:
+        return self._file_mtime() != self._mtime
+
+    def close(self):
+        pass
+
+
+# ============================================================
+# SQLite (WAL)
+# ============================================================
+
+class SqliteStorage:
+    """
+    players(user_id, data) 테이블에 사용자 한 명당 한 행.
+
+    - 쿨타임 갱신 같은 변경은 행 하나만 다시 쓴다. (WAL + synchronous=NORMAL)
+      update() 는 트랜잭션 안에서 현재 행을 읽어 바뀐 필드만 반영하므로 다른 연결의 수정을 덮어쓰지 않는다.
+    - 다른 연결(운영 도구 등)이 커밋하면 PRAGMA data_version 이 바뀌므로 changed() 로 감지한다.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS players (user_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self._lock = threading.Lock()
+        self._data_version = None
+
+    def _current_data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def load(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, data FROM players").fetchall()
+            self._data_version = self._current_data_version()
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def put(self, user_id: str, record: dict):
+        payload = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO players (user_id, data) VALUES (?, ?)", (user_id, payload))
+
+    def update(self, user_id: str, fields: dict, removed=()):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM players WHERE user_id = ?", (user_id,)).fetchone()
+                record = json.loads(row[0]) if row else {}
+                apply_patch(record, fields, removed)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO players (user_id, data) VALUES (?, ?)",
+                    (user_id, json.dumps(record, ensure_ascii=False)),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            # 자기 자신의 쓰기는 data_version 을 바꾸지 않으므로 changed() 에는 영향 없음
+
+    def rename(self, old_id: str, new_id: str, record: dict):
+        payload = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM players WHERE user_id = ?", (old_id,))
+                self._conn.execute("INSERT OR REPLACE INTO players (user_id, data) VALUES (?, ?)", (new_id, payload))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def replace_all(self, records: dict):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM players")
+                self._conn.executemany(
+                    "INSERT INTO players (user_id, data) VALUES (?, ?)",
+                    [(user_id, json.dumps(record, ensure_ascii=False)) for user_id, record in records.items()],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def changed(self) -> bool:
+        with self._lock:
+            return self._current_data_version() != self._data_version
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_storage(backend: str, json_path: str, journal_path: str, sqlite_path: str, compact_every: int = 100):
+    """설정값(DB_BACKEND)에 맞는 저장소 생성"""
+    if backend == 'json':
+        return JsonJournalStorage(json_path, journal_path, compact_every)
+    if backend == 'sqlite':
+        return SqliteStorage(sqlite_path)
+    raise ValueError(f"알 수 없는 DB 백엔드입니다: {backend}")
+
+
+# ============================================================
+# 마이그레이션
+# ============================================================
+
+def migrate(source, target) -> int:
+    """source 저장소의 전체 레코드를 target 으로 복사하고 레코드 수를 반환"""
+    records = source.load()
+    target.replace_all(records)
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="player_db 저장소 마이그레이션")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("migrate", help="JSON ↔ SQLite 전체 복사")
+    p.add_argument("--to", choices=["sqlite", "json"], required=True)
+    p.add_argument("--json", default="player_db.json")
+    p.add_argument("--journal", default="player_db.journal")
+    p.add_argument("--sqlite", default="player_db.sqlite3")
+    args = parser.parse_args()
+
+    json_storage = JsonJournalStorage(args.json, args.journal)
+    sqlite_storage = SqliteStorage(args.sqlite)
+    if args.to == "sqlite":
+        count = migrate(json_storage, sqlite_storage)
+        print(f"{args.json} → {args.sqlite}: {count}명 복사 완료")
+    else:
+        count = migrate(sqlite_storage, json_storage)
+        print(f"{args.sqlite} → {args.json}: {count}명 복사 완료")
+    sqlite_storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Google Sheets 요청 스케줄러 (여러 이벤트 봇 공용)
+
+모든 Sheets 요청을 하나의 워커 스레드가 실행한다.
+
+- 토큰 버킷: 읽기/쓰기 각각 분당 할당량(SHEETS_*_PER_MINUTE)에 맞춰 요청 간격을 조절
+- 우선순위: 명령 응답에 필요한 읽기 > 게임 상태 기록 > 로그 추가 순으로 먼저 실행
+- 병합(coalesce): 아직 실행 전인 같은 key 의 요청이 있으면
+    읽기는 그 결과를 같이 받고, 쓰기는 마지막 내용으로 한 번만 실행한다.
+- 429 는 버킷을 비우고 지수 백오프 후 재시도 (retries=0 이면 호출한 쪽에서 처리)
+  백오프 중인 요청은 "이 시각 전에는 실행하지 않음" 표시만 하고 대기열에서 빼 두므로,
+  워커는 그동안 다른 (더 급한) 요청을 계속 처리한다.
+
+사용 예:
+    scheduler = SheetsScheduler()
+    values = scheduler.call(ss.values_get, "'팀'!A1:B13", kind="read", priority=PRIORITY_INTERACTIVE)
+    future = scheduler.submit(ws.append_rows, rows, kind="write", priority=PRIORITY_LOG)
+"""
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+# 우선순위 (숫자가 작을수록 먼저)
+PRIORITY_INTERACTIVE = 0  # 명령 처리 중 응답에 필요한 읽기
+PRIORITY_STATE = 1        # 게임 상태 기록/대조, 순위표
+PRIORITY_LOG = 2          # 로그 추가
+
+# Google Sheets API 기본 할당량은 사용자(서비스 계정)당 분당 읽기 60회, 쓰기 60회
+SHEETS_READS_PER_MINUTE = 60
+SHEETS_WRITES_PER_MINUTE = 60
+SHEETS_BURST = 10  # 잠시 쉬었다가 한꺼번에 보낼 수 있는 요청 수
+SHEETS_MAX_RETRIES = 5  # 429 재시도 횟수 (기본값)
+SHEETS_BACKOFF_BASE = 2.0  # 429 재시도 대기 기본값 (초, 재시도마다 2배 + 지터)
+SHEETS_BACKOFF_MAX = 64.0
+
+
+def is_rate_limited(error) -> bool:
+    """gspread APIError 등이 429(Too Many Requests) 인지 (HTTP 상태 코드로만 판단, 메시지 문자열은 보지 않음)"""
+    response = getattr(error, "response", None)
+    code = getattr(response, "status_code", None)
+    if code is None:
+        code = getattr(error, "code", None)
+    return code == 429
+
+
+class TokenBucket:
+    """분당 per_minute 개씩 채워지고 최대 burst 개까지 쌓이는 토큰 버킷"""
+
+    def __init__(self, per_minute: float, burst: int = SHEETS_BURST):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self) -> float:
+        """토큰 하나를 쓸 수 있을 때까지 남은 시간(초)"""
+        self._refill()
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1.0
+
+    def drain(self):
+        """429 를 받으면 남은 토큰을 버려 한동안 요청을 멈춘다."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _Request:
+    __slots__ = ("fn", "args", "kwargs", "kind", "key", "retries", "futures", "started",
+                 "priority", "attempt", "ready_at", "generation")
+
+    def __init__(self, fn, args, kwargs, kind, key, retries, priority):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.kind = kind
+        self.key = key
+        self.retries = retries
+        self.futures = []
+        self.started = False
+        self.priority = priority
+        self.attempt = 0                    # 429 로 재시도한 횟수
+        self.ready_at = time.monotonic()    # 실행할 수 있게 된 시각 (대기 시간 계산용, 백오프 중이면 그 끝)
+        self.generation = 0                 # 다시 대기열에 넣을 때마다 증가 (이전 자리의 항목은 무시)
+
+
+class SheetsScheduler:
+    def __init__(self, name: str = "sheets", reads_per_minute: float = None, writes_per_minute: float = None):
+        self.name = name
+        self.buckets = {
+            "read": TokenBucket(SHEETS_READS_PER_MINUTE if reads_per_minute is None else reads_per_minute),
+            "write": TokenBucket(SHEETS_WRITES_PER_MINUTE if writes_per_minute is None else writes_per_minute),
+        }
+        self._heap = []          # (priority, seq, _Request, generation)
+        self._delayed = []       # 429 백오프 중: (not_before(monotonic), seq, _Request)
+        self._pending = {}       # (kind, key) → 실행 전 _Request
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats = {"executed": 0, "coalesced": 0, "rate_limited": 0, "retries": 0, "waited_seconds": 0.0}
+        self._thread = threading.Thread(target=self._worker, name=f"{name}-scheduler", daemon=True)
+        self._thread.start()
+        metrics.gauge_callback("sheets_scheduler_queue_depth", self.qsize, scheduler=name)
+
+    def submit(self, fn, *args, kind: str = "write", priority: int = PRIORITY_STATE,
+               key=None, retries: int = SHEETS_MAX_RETRIES, **kwargs) -> Future:
+        """
+        요청을 대기열에 넣고 Future 반환.
+
+        kind: "read" / "write" (사용할 토큰 버킷)
+        key: 같은 대상(예: 범위 문자열)을 가리키는 요청을 병합할 때 쓰는 값 (None이면 병합 안 함)
+        retries: 429 재시도 횟수
+        """
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("SheetsScheduler 가 종료되었습니다.")
+            request = self._pending.get((kind, key)) if key is not None else None
+            if request is not None and not request.started:
+                self._stats["coalesced"] += 1
+                metrics.inc("sheets_coalesced_total", scheduler=self.name, kind=kind)
+                if kind == "write":
+                    # 쓰기는 마지막 내용으로 한 번만 실행
+                    request.fn, request.args, request.kwargs = fn, args, kwargs
+                request.futures.append(future)
+                if priority < request.priority:
+                    request.priority = priority
+                    if request.attempt == 0:
+                        # 더 급한 요청이 합쳐졌으면 앞쪽 자리에 한 번 더 넣는다 (실행은 한 번만)
+                        # (백오프 중인 재시도는 끝난 뒤 이 우선순위로 다시 들어간다)
+                        heapq.heappush(self._heap, (priority, next(self._seq), request, request.generation))
+                        self._cond.notify()
+                return future
+
+            request = _Request(fn, args, kwargs, kind, key, retries, priority)
+            request.futures.append(future)
+            if key is not None:
+                self._pending[(kind, key)] = request
+            heapq.heappush(self._heap, (priority, next(self._seq), request, request.generation))
+            self._cond.notify()
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        """submit 후 결과(또는 예외)를 기다린다."""
+        if threading.current_thread() is self._thread:
+            # 스케줄러 안에서 다시 부르면 대기열을 기다리지 않고 바로 실행 (교착 방지)
+            for name in ("kind", "priority", "key", "retries"):
+                kwargs.pop(name, None)
+            return fn(*args, **kwargs)
+        return self.submit(fn, *args, **kwargs).result()
+
+    def qsize(self) -> int:
+        with self._cond:
+            queued = sum(1 for _, _, request, generation in self._heap
+                         if not request.started and generation == request.generation)
+            return queued + len(self._delayed)
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+        stats["queued"] = self.qsize()
+        stats["tokens"] = {kind: round(bucket.tokens, 2) for kind, bucket in self.buckets.items()}
+        return stats
+
+    def _next_request(self):
+        """토큰이 있는 가장 급한 요청을 꺼낸다. (종료되었고 대기열과 백오프 목록이 비었으면 None)"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                # 백오프가 끝난 요청은 원래 우선순위 자리로 되돌린다
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, request = heapq.heappop(self._delayed)
+                    heapq.heappush(self._heap, (request.priority, next(self._seq), request, request.generation))
+                while self._heap and (self._heap[0][2].started or self._heap[0][3] != self._heap[0][2].generation):
+                    heapq.heappop(self._heap)  # 병합되어 이미 실행된 항목 / 다시 넣기 전의 자리
+                next_retry = self._delayed[0][0] - now if self._delayed else None
+                if not self._heap:
+                    if self._closed and next_retry is None:
+                        return None
+                    self._cond.wait(next_retry)
+                    continue
+
+                request = self._heap[0][2]
+                wait = self.buckets[request.kind].wait_time()
+                if wait > 0:
+                    # 기다리는 동안 더 급한 요청이 들어오거나 백오프가 끝나면 그것부터 다시 판단
+                    self._cond.wait(wait if next_retry is None else min(wait, next_retry))
+                    continue
+
+                heapq.heappop(self._heap)
+                self.buckets[request.kind].take()
+                request.started = True
+                if request.key is not None:
+                    self._pending.pop((request.kind, request.key), None)
+                # 대기 시간은 요청마다 한 번, 꺼낼 때 (실행할 수 있게 된 시각부터)
+                self._stats["waited_seconds"] += max(0.0, now - request.ready_at)
+                return request
+
+    def _execute(self, request: _Request):
+        """한 번 실행한다. 429 면 백오프 목록에 넣어 두고 워커는 바로 다음 요청으로 넘어간다."""
+        try:
+            result = request.fn(*request.args, **request.kwargs)
+        except Exception as e:
+            if not is_rate_limited(e) or request.attempt >= request.retries:
+                if is_rate_limited(e):
+                    self._count("rate_limited")
+                for future in request.futures:
+                    future.set_exception(e)
+                return
+            self._count("rate_limited")
+            self._count("retries")
+            metrics.inc("sheets_429_total", scheduler=self.name)
+            delay = min(SHEETS_BACKOFF_MAX, SHEETS_BACKOFF_BASE * (2 ** request.attempt)) + random.uniform(0, 1)
+            logging.warning("Sheets 429, %.1f초 후 재시도 (%d/%d)", delay, request.attempt + 1, request.retries)
+            request.attempt += 1
+            request.ready_at = time.monotonic() + delay
+            with self._cond:
+                for bucket in self.buckets.values():
+                    bucket.drain()
+                if request.key is not None and (request.kind, request.key) not in self._pending:
+                    # 백오프 중에 들어온 같은 key 요청이 먼저 실행되지 않고 이 요청에 합쳐지도록
+                    self._pending[(request.kind, request.key)] = request
+                request.started = False
+                request.generation += 1  # 대기열에 남은 예전 자리는 무시
+                heapq.heappush(self._delayed, (request.ready_at, next(self._seq), request))
+                self._cond.notify()
+            return
+
+        self._count("executed")
+        for future in request.futures:
+            future.set_result(result)
+
+    def _count(self, key):
+        with self._cond:
+            self._stats[key] += 1
+
+    def _worker(self):
+        while True:
+            request = self._next_request()
+            if request is None:
+                break
+            # 재시도 때는 백오프 중에 합쳐진 Future 만 새로 실행 중으로 표시한다
+            request.futures = [future for future in request.futures
+                               if future.running() or future.set_running_or_notify_cancel()]
+            if request.futures:
+                self._execute(request)
+
+    def stop(self):
+        """대기 중인 요청(백오프 중인 재시도 포함)을 모두 실행한 뒤 종료"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        logging.info("Sheets 스케줄러(%s) 종료 | %s", self.name, self._stats)
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+눈사람 게임 밸런스 시뮬레이터 (몬테카를로)
+
+장식 확률/점수, 목표 크기(PERFECT_HEAD/PERFECT_BODY), [눈사람/던지기] 범위를 바꿔 보며
+이벤트 기간 동안 팀 점수가 어떻게 분포하는지 미리 확인한다.
+
+- 점수 규칙은 snowman_bot 의 것을 그대로 쓴다. (size_score, DECORATION_DATA 의 행/점수/개수)
+  기본 규칙이면 앞쪽 팀 일부를 snowman_bot.TeamState 로 다시 계산해 결과가 같은지 검산한다.
+- 장식은 게임과 같은 snowman_bot.AliasTable 로 뽑는다.
+- 팀 = 머리(A열) + 몸통(B열) 두 명. 각자 쿨타임(COOL_DOWN_HOURS)마다
+  눈덩이 명령 1회, 장식 1회를 --activity 확률로 사용한다.
+- 눈덩이 명령 전략 (--policy)
+    greedy: 목표보다 5 이상 작으면 굴리기, 5 이상 크면 깎기, 그 사이면 쉰다
+    random: 굴리기/깎기/던지기 중 무작위
+    throw : 던지기만
+- NumPy 가 있으면 --batch 팀씩 벡터화해서 계산하고,
+  없으면 같은 규칙을 파이썬 루프로 계산한다. (훨씬 느리므로 --teams 를 줄여서 사용)
+
+사용법:
+    python simulate_balance.py --teams 1000000 --hours 72
+    python simulate_balance.py --perfect-head 150 --throw-range 20 --deco-prob 목도리=0.1 --deco-score 목도리=50
+"""
+
+import argparse
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import snowman_bot
+
+START_SIZE = 200  # 역할 등록 시 눈덩이 크기
+GREEDY_MARGIN = 5  # greedy 전략이 멈추는 목표와의 차이
+PERFECT_RANGE = 4  # 목표 ±4 이내 = 응답 메시지의 '완벽 범위' (머리 131~139, 몸통 271~279)
+VERIFY_TEAMS = 200  # TeamState 로 검산할 팀 수
+
+
+def _short_name(command: str) -> str:
+    """'[장식/목도리]' → '목도리'"""
+    return command.split('/', 1)[1].rstrip(']')
+
+
+class Rules:
+    """시뮬레이션에 쓰는 게임 규칙 (snowman_bot 설정값 + 명령행에서 바꾼 값)"""
+
+    def __init__(self, perfect_head=None, perfect_body=None, throw_range=10, deco_prob=None, deco_score=None):
+        self.perfect = {
+            'A': snowman_bot.PERFECT_HEAD if perfect_head is None else perfect_head,
+            'B': snowman_bot.PERFECT_BODY if perfect_body is None else perfect_body,
+        }
+        self.throw_range = throw_range
+
+        decorations = {command: dict(data) for command, data in snowman_bot.DECORATION_DATA.items()}
+        by_name = {_short_name(command): command for command in decorations}
+        for overrides, field in ((deco_prob or {}, 'prob'), (deco_score or {}, 'score')):
+            for name, value in overrides.items():
+                if name not in by_name:
+                    raise ValueError(f"알 수 없는 장식입니다: {name} (가능: {', '.join(by_name)})")
+                decorations[by_name[name]][field] = value
+        self.is_default = not deco_prob and not deco_score and self.perfect == snowman_bot.PERFECT_SIZES
+
+        # 장식 1회 획득 점수 = 행 점수 × 획득 개수 (DECORATION_SCORE_BY_ROW 와 같은 방식으로 계산)
+        score_by_row = {data['row']: data['score'] for data in decorations.values()}
+        self.decorations = decorations
+        self.rows = [data['row'] for data in decorations.values()]
+        self.counts = [data['count'] for data in decorations.values()]
+        self.values = [score_by_row[data['row']] * data['count'] for data in decorations.values()]
+        self.sampler = snowman_bot.AliasTable(decorations, [data['prob'] for data in decorations.values()])
+
+    def size_bounds(self, slots):
+        step = max(10, self.throw_range)
+        return max(0, START_SIZE - slots * step), START_SIZE + slots * step
+
+    def size_score_table(self, col, slots):
+        """가능한 모든 크기에 대한 size_score 표 (lo, [점수...])"""
+        lo, hi = self.size_bounds(slots)
+        return lo, [snowman_bot.size_score(size, self.perfect[col]) for size in range(lo, hi + 1)]
+
+
+# ============================================================
+# NumPy 벡터화
+# ============================================================
+
+def simulate_numpy(rules: Rules, n: int, slots: int, activity: float, policy: str, rng):
+    """
+    팀 n개를 한 번에 시뮬레이션.
+    반환값: {'size': {열: 크기}, 'size_score': {열: 점수}, 'deco_counts': {열: (n, 장식 수)}, 'deco_score': {열: 점수}}
+    """
+    prob = np.array(rules.sampler.prob)
+    alias = np.array(rules.sampler.alias)
+    values = np.array(rules.values)
+    k = len(values)
+    team_index = np.arange(n)
+    result = {'size': {}, 'size_score': {}, 'deco_counts': {}, 'deco_score': {}}
+
+    for col in 'AB':
+        perfect = rules.perfect[col]
+        size = np.full(n, START_SIZE, dtype=np.int64)
+        counts = np.zeros((n, k), dtype=np.int64)
+        for _ in range(slots):
+            # 눈덩이 명령
+            if policy == 'greedy':
+                diff = perfect - size
+                delta = np.where(diff >= GREEDY_MARGIN, 10, np.where(diff <= -GREEDY_MARGIN, -10, 0))
+            else:
+                delta = rng.integers(-rules.throw_range, rules.throw_range + 1, n)
+                if policy == 'random':
+                    command = rng.integers(0, 3, n)
+                    delta = np.where(command == 0, 10, np.where(command == 1, -10, delta))
+            size += np.where(rng.random(n) < activity, delta, 0)
+            size[size < 0] = START_SIZE  # 게임에서 음수 크기는 숫자로 읽히지 않아 200으로 취급됨 (_cell_int)
+
+            # 장식 (별칭 테이블: 칸 하나 + 균등 난수 하나)
+            x = rng.random(n) * k
+            slot = x.astype(np.int64)
+            pick = np.where(x - slot < prob[slot], slot, alias[slot])
+            counts[team_index, pick] += rng.random(n) < activity
+
+        lo, table = rules.size_score_table(col, slots)
+        result['size'][col] = size
+        result['size_score'][col] = np.array(table)[size - lo]
+        result['deco_counts'][col] = counts
+        result['deco_score'][col] = counts @ values
+    return result
+
+
+# ============================================================
+# 파이썬 루프 (NumPy 가 없을 때)
+# ============================================================
+
+def simulate_python(rules: Rules, n: int, slots: int, activity: float, policy: str, rng: random.Random):
+    """simulate_numpy 와 같은 규칙, 같은 형태의 결과 (리스트)"""
+    k = len(rules.values)
+    result = {'size': {}, 'size_score': {}, 'deco_counts': {}, 'deco_score': {}}
+    r = rules.throw_range
+
+    for col in 'AB':
+        perfect = rules.perfect[col]
+        lo, table = rules.size_score_table(col, slots)
+        sizes, counts_list = [], []
+        for _ in range(n):
+            size = START_SIZE
+            counts = [0] * k
+            for _ in range(slots):
+                if rng.random() < activity:
+                    if policy == 'greedy':
+                        diff = perfect - size
+                        size += 10 if diff >= GREEDY_MARGIN else -10 if diff <= -GREEDY_MARGIN else 0
+                    else:
+                        command = rng.randrange(3) if policy == 'random' else 2
+                        size += 10 if command == 0 else -10 if command == 1 else rng.randint(-r, r)
+                    if size < 0:
+                        size = START_SIZE
+                if rng.random() < activity:
+                    counts[rules.sampler.sample_index(rng)] += 1
+            sizes.append(size)
+            counts_list.append(counts)
+        result['size'][col] = sizes
+        result['size_score'][col] = [table[size - lo] for size in sizes]
+        result['deco_counts'][col] = counts_list
+        result['deco_score'][col] = [sum(c * v for c, v in zip(counts, rules.values)) for counts in counts_list]
+    return result
+
+
+# ============================================================
+# 검산 / 요약
+# ============================================================
+
+def verify_with_team_state(rules: Rules, result, final, limit=VERIFY_TEAMS) -> int:
+    """앞쪽 팀을 snowman_bot.TeamState 로 다시 계산해 최종 점수가 같은지 확인 (기본 규칙일 때만)"""
+    checked = min(limit, len(final))
+    for i in range(checked):
+        cells = {}
+        for col in 'AB':
+            cells[f"{col}2"] = int(result['size'][col][i])
+            for row, count, amount in zip(rules.rows, rules.counts, result['deco_counts'][col][i]):
+                cells[f"{col}{row}"] = cells.get(f"{col}{row}", 0) + int(amount) * count
+        expected = snowman_bot.TeamState.from_a1("sim", cells).final_score
+        if expected != int(final[i]):
+            raise AssertionError(f"팀 {i}: 시뮬레이터 {int(final[i])}점, TeamState {expected}점")
+    return checked
+
+
+def _summary(values):
+    ordered = sorted(values)
+    n = len(ordered)
+    mean = sum(ordered) / n
+    std = (sum((v - mean) ** 2 for v in ordered) / n) ** 0.5
+
+    def pct(q):
+        return ordered[min(n - 1, int(q * n))]
+
+    return (
+        f"평균 {mean:,.1f} 표준편차 {std:,.1f} | "
+        f"p1 {pct(0.01)} p10 {pct(0.10)} p50 {pct(0.50)} p90 {pct(0.90)} p99 {pct(0.99)} | 최고 {ordered[-1]}"
+    )
+
+
+def _histogram(values, bins=10, width=40):
+    lo, hi = min(values), max(values)
+    step = max(1, (hi - lo + bins) // bins)
+    counts = [0] * bins
+    for v in values:
+        counts[min(bins - 1, (v - lo) // step)] += 1
+    peak = max(counts)
+    lines = []
+    for i, count in enumerate(counts):
+        bar = "#" * round(width * count / peak) if peak else ""
+        lines.append(f"  {lo + i * step:>5} ~ {lo + (i + 1) * step - 1:>5} | {bar} {count / len(values):.1%}")
+    return "\n".join(lines)
+
+
+def _parse_overrides(pairs, cast):
+    overrides = {}
+    for pair in pairs or []:
+        name, _, value = pair.partition('=')
+        overrides[name.strip()] = cast(value)
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="눈사람 게임 밸런스 시뮬레이터")
+    parser.add_argument("--teams", type=int, default=1_000_000 if np is not None else 2_000)
+    parser.add_argument("--hours", type=float, default=72.0, help="이벤트 기간(시간)")
+    parser.add_argument("--cooldown-hours", type=float, default=snowman_bot.COOL_DOWN_HOURS)
+    parser.add_argument("--activity", type=float, default=0.5, help="쿨타임이 끝났을 때 명령을 쓰는 확률")
+    parser.add_argument("--policy", choices=["greedy", "random", "throw"], default="greedy")
+    parser.add_argument("--perfect-head", type=int, default=snowman_bot.PERFECT_HEAD)
+    parser.add_argument("--perfect-body", type=int, default=snowman_bot.PERFECT_BODY)
+    parser.add_argument("--throw-range", type=int, default=10, help="[눈사람/던지기] 변화 범위 (±)")
+    parser.add_argument("--deco-prob", action="append", metavar="이름=확률", help="예: 목도리=0.1 (여러 번 가능)")
+    parser.add_argument("--deco-score", action="append", metavar="이름=점수", help="예: 목도리=50 (여러 번 가능)")
+    parser.add_argument("--batch", type=int, default=100_000, help="NumPy 로 한 번에 계산할 팀 수")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rules = Rules(args.perfect_head, args.perfect_body, args.throw_range,
+                  _parse_overrides(args.deco_prob, float), _parse_overrides(args.deco_score, int))
+    slots = int(args.hours // args.cooldown_hours)
+
+    started = time.perf_counter()
+    final, size_a, size_b, deco, perfect_a, perfect_b = [], [], [], [], 0, 0
+    verified = 0
+    if np is not None:
+        rng = np.random.default_rng(args.seed)
+        for offset in range(0, args.teams, args.batch):
+            n = min(args.batch, args.teams - offset)
+            result = simulate_numpy(rules, n, slots, args.activity, args.policy, rng)
+            batch_final = (result['size_score']['A'] + result['size_score']['B']
+                           + result['deco_score']['A'] + result['deco_score']['B'])
+            if offset == 0 and rules.is_default:
+                verified = verify_with_team_state(rules, result, batch_final)
+            final.extend(batch_final.tolist())
+            size_a.extend(result['size_score']['A'].tolist())
+            size_b.extend(result['size_score']['B'].tolist())
+            deco.extend((result['deco_score']['A'] + result['deco_score']['B']).tolist())
+            perfect_a += int((result['size_score']['A'] >= 100 - PERFECT_RANGE).sum())
+            perfect_b += int((result['size_score']['B'] >= 100 - PERFECT_RANGE).sum())
+        engine = "NumPy"
+    else:
+        print("NumPy 가 없어 파이썬 루프로 계산합니다. (pip install numpy 로 훨씬 빨라짐)")
+        result = simulate_python(rules, args.teams, slots, args.activity, args.policy, random.Random(args.seed))
+        final = [a + b + c + d for a, b, c, d in zip(result['size_score']['A'], result['size_score']['B'],
+                                                    result['deco_score']['A'], result['deco_score']['B'])]
+        if rules.is_default:
+            verified = verify_with_team_state(rules, result, final)
+        size_a, size_b = result['size_score']['A'], result['size_score']['B']
+        deco = [a + b for a, b in zip(result['deco_score']['A'], result['deco_score']['B'])]
+        perfect_a = sum(1 for score in size_a if score >= 100 - PERFECT_RANGE)
+        perfect_b = sum(1 for score in size_b if score >= 100 - PERFECT_RANGE)
+        engine = "파이썬"
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"팀 {args.teams:,}개 | {args.hours:g}시간, 쿨타임 {args.cooldown_hours:g}시간 → 명령 기회 {slots}회/인 | "
+        f"활동률 {args.activity:.2f} | 전략 {args.policy} | {engine} {elapsed:.2f}s ({args.teams / elapsed:,.0f}팀/s)"
+    )
+    print(f"목표 크기 머리 {rules.perfect['A']} / 몸통 {rules.perfect['B']} | 던지기 ±{rules.throw_range}")
+    print("장식 " + ", ".join(
+        f"{_short_name(command)} {data['prob']:g}/{data['score']}점" for command, data in rules.decorations.items()
+    ))
+    if verified:
+        print(f"검산: 앞쪽 {verified}팀의 최종 점수가 snowman_bot.TeamState 계산과 일치")
+    print(f"최종 점수        {_summary(final)}")
+    print(f"크기 점수(머리)  {_summary(size_a)}")
+    print(f"크기 점수(몸통)  {_summary(size_b)}")
+    print(f"장식 점수(합계)  {_summary(deco)}")
+    print(f"완벽 범위(±{PERFECT_RANGE})    머리 {perfect_a / args.teams:.1%} / 몸통 {perfect_b / args.teams:.1%}")
+    print("최종 점수 분포")
+    print(_histogram(final))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,25 @@
-import json
+import bisect
+import heapq
+import html
 import random
 import re  # 정규표현식 모듈 추가
-from datetime import datetime, timedelta, MINYEAR
+from collections import deque
+from datetime import datetime
 import gspread
 from mastodon import Mastodon, StreamListener
+from mastodon import MastodonNetworkError, MastodonRatelimitError, MastodonServerError
 import os # os 모듈 추가
+import queue
+import threading
+import time
+import zlib
+
+import metrics
+from catchup import NotificationCursor, catch_up
+from dedup import SeenSet
+from game_journal import GameJournal
+from player_storage import diff_record, open_storage, read_json_file, write_json_file
+from sheets_scheduler import PRIORITY_INTERACTIVE, PRIORITY_STATE, SheetsScheduler, is_rate_limited
 
 # ==============================================================================
 # ⚙️ 설정값 및 데이터 구조 (여기를 실제 값으로 반드시 수정하세요!)
@@ -18,7 +33,37 @@ SERVICE_ACCOUNT_FILE = 'service_account.json'
 PERFECT_HEAD = 137
 PERFECT_BODY = 274  # 💡 최종 목표 크기: 274로 설정
 COOL_DOWN_HOURS = 1  # 그룹 쿨타임은 1시간으로 설정
+COOLDOWN_NOTIFY = False  # True면 쿨타임이 끝난 플레이어에게 DM으로 알림
+COOLDOWN_NOTIFY_INTERVAL = 30  # 쿨타임 만료 확인 주기 (초)
+COOLDOWN_EXPIRED_MESSAGES = {
+    'snowman_cmd': "손이 다 녹았다. 다시 눈덩이를 만질 수 있다.",
+    'decoration_cmd': "다시 장식을 찾으러 가 볼 수 있다.",
+}
 DB_FILE = 'player_db.json'
+DB_JOURNAL_FILE = 'player_db.journal'  # 변경분 저널 (JSON Lines)
+DB_COMPACT_EVERY = 100  # 저널이 이 줄 수를 넘으면 DB 파일로 압축
+DB_BACKEND = 'json'  # 'json' (player_db.json + 저널) 또는 'sqlite' (python player_storage.py migrate --to sqlite 로 옮긴 뒤 사용)
+DB_SQLITE_FILE = 'player_db.sqlite3'
+SHEET_FLUSH_INTERVAL = 5  # 팀 시트 변경분을 모아서 기록하는 주기 (초)
+SCORE_RECONCILE_INTERVAL = None  # 시트 전체와 캐시/점수를 대조하는 주기 (초, None이면 하지 않음)
+DISPATCH_WORKERS = 4  # 명령 처리 워커 수 (같은 팀은 항상 같은 워커에서 순서대로 처리)
+DISPATCH_QUEUE_SIZE = 100  # 워커별 대기열 크기 (가득 차면 스트림 수신을 잠시 멈춤)
+SEEN_FILE = 'seen_statuses.json'  # 이미 처리한 툿 ID (중복 처리 방지)
+REPLY_WORKERS = 2  # 응답 전송 워커 수
+REPLY_MAX_ATTEMPTS = 5  # 응답 전송 최대 시도 횟수
+REPLY_BACKOFF_BASE = 1.0  # 재시도 대기 기본값 (초, 시도마다 2배 + 지터)
+REPLY_BACKOFF_MAX = 60.0  # 재시도 대기 최대값 (초)
+REPLY_RATELIMIT_RESERVE = 5  # X-RateLimit-Remaining 이 이 값 이하면 리셋 시각까지 대기
+REPLY_LATENCY_WINDOW = 1000  # 응답 지연 백분위 계산에 쓰는 최근 표본 수
+CURSOR_FILE = 'snowman_cursor.json'  # 마지막으로 처리한 알림 ID (재접속 시 놓친 멘션 따라잡기용)
+METRICS_PORT = None  # 예: 9108 로 설정하면 http://127.0.0.1:9108/metrics 에서 계측값 제공 (None이면 계측 비활성)
+LEADERBOARD_SHEET = '순위'  # 전체 순위를 기록할 요약 워크시트 (None이면 기록하지 않음)
+LEADERBOARD_INTERVAL = 60  # 요약 워크시트 갱신 주기 (초, 순위가 바뀐 경우에만 기록)
+LEADERBOARD_REPLY_TOP = 10  # [눈사람/순위] 응답에 보여줄 상위 팀 수
+STREAM_RETRY_SECONDS = 5  # 스트림이 끊겼을 때 재접속 전 대기 시간
+JOURNAL_FILE = 'game_journal.jsonl'  # 처리된 명령 저널 (None이면 기록하지 않음, 시작 시 팀 상태를 시트 대신 저널로 복구)
+JOURNAL_SNAPSHOT_FILE = 'game_snapshots.jsonl'  # 전체 팀 상태 스냅숏
+JOURNAL_SNAPSHOT_EVERY = 500  # 명령 몇 건마다 스냅숏을 남길지
 
 # 게임 데이터 구조 (💡 장식 획득 확률 및 획득 개수, 점수 반영)
 DECORATION_DATA = {
@@ -36,66 +81,279 @@ DECORATION_DATA = {
 SNOWMAN_COOL_DOWN_CMDS = ['[눈사람/굴리기]', '[눈사람/깎기]', '[눈사람/던지기]']
 DECORATION_COMMAND = '[눈사람/장식]'
 REGISTRATION_COMMANDS = ['[눈사람/머리]', '[눈사람/몸통]']
+RANKING_COMMAND = '[눈사람/순위]'  # 쿨타임 없음
 
 SNOWMAN_COMMANDS = SNOWMAN_COOL_DOWN_CMDS
-ALL_COMMANDS = [DECORATION_COMMAND] + SNOWMAN_COMMANDS + REGISTRATION_COMMANDS
+ALL_COMMANDS = [DECORATION_COMMAND] + SNOWMAN_COMMANDS + REGISTRATION_COMMANDS + [RANKING_COMMAND]
+
+
+# ==============================================================================
+# 명령어 매처 (import 시 1회 컴파일)
+# ==============================================================================
+
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+# 대괄호 토큰: 안쪽에 대괄호/줄바꿈이 없는 [..] (명령어도 모두 이 형태)
+BRACKET_TOKEN_RE = re.compile(r'\[[^\[\]\n]*\]')
+
+
+def html_to_text(content):
+    """마스토돈 HTML 본문에서 태그를 제거하고 엔티티(&amp; 등)를 복원"""
+    if not content:
+        return ""
+    return html.unescape(HTML_TAG_RE.sub(' ', content))
+
+
+class CommandMatcher:
+    """
+    명령어 목록을 미리 사전으로 만들어 두고, 본문을 대괄호 토큰 단위로 한 번만 훑는다.
+
+    - 명령어는 모두 [..] 형태이므로 본문의 대괄호 토큰을 사전에서 찾기만 하면 된다.
+      (명령어 수가 늘어나도 토큰당 O(1))
+    - 여러 명령어가 있으면 목록에서 앞에 있는 명령어가 우선 (기존 동작과 동일)
+    - 같은 순회에서 '대괄호가 있는지' 여부도 함께 구한다. (오타 안내용)
+    """
+
+    def __init__(self, commands):
+        self.priority = {}
+        for index, cmd in enumerate(commands):
+            if BRACKET_TOKEN_RE.fullmatch(cmd) is None:
+                raise ValueError(f"명령어는 [..] 형태여야 합니다: {cmd}")
+            self.priority.setdefault(cmd.lower(), (index, cmd))
+
+    def match(self, text):
+        """(찾은 명령어 또는 None, 대괄호 토큰 존재 여부) 반환"""
+        best = None
+        has_bracket = False
+        for token in BRACKET_TOKEN_RE.finditer(text.lower()):
+            has_bracket = True
+            found = self.priority.get(token.group())
+            if found is not None and (best is None or found[0] < best[0]):
+                best = found
+                if best[0] == 0:
+                    break
+        return (best[1] if best else None), has_bracket
+
+
+COMMAND_MATCHER = CommandMatcher(ALL_COMMANDS)
 
 
 # ==============================================================================
 # 데이터베이스 및 쿨타임 관리 함수
 # ==============================================================================
 
-def load_db():
-    """JSON 파일에서 사용자 데이터베이스 로드 및 시간 객체 변환"""
-    default_cooldown_time = datetime(MINYEAR, 1, 1)
+def _parse_cooldown(value):
+    """저장된 쿨타임 값을 epoch 초(float)로 변환 (이전 형식인 ISO 문자열도 읽음, 없거나 잘못된 값은 None)"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def _parse_user(user_data):
+    """사용자 한 명의 레코드에서 쿨타임 값을 epoch 초로 정리"""
+    cooldown_times = user_data.setdefault('cooldown_times', {})
+    for group, value in cooldown_times.items():
+        cooldown_times[group] = _parse_cooldown(value)
+
+    if 'last_cmd' in user_data:
+        del user_data['last_cmd']
+
+    return user_data
+
+
+def _serialize_user(user_data):
+    """사용자 한 명의 레코드를 JSON 저장용 사본으로 변환 (메모리 상의 원본은 건드리지 않음)"""
+    user_to_save = dict(user_data)
+    if 'cooldown_times' in user_data:
+        # 쿨타임은 epoch 초(float) 또는 None 그대로 저장
+        user_to_save['cooldown_times'] = dict(user_data['cooldown_times'])
+    return user_to_save
 
-    try:
-        with open(DB_FILE, 'r', encoding='utf-8') as f:
-            db = json.load(f)
-            for user_id in db:
-                if 'cooldown_times' not in db[user_id]:
-                    db[user_id]['cooldown_times'] = {}
-
-                for group, time_str in db[user_id]['cooldown_times'].items():
-                    # 빈 문자열을 확실히 None으로 처리하기 위한 로직
-                    if time_str == "" or time_str is None:
-                        db[user_id]['cooldown_times'][group] = None
-                        continue
-
-                    if isinstance(time_str, str):
-                        try:
-                            # 1. datetime 문자열 변환 시도
-                            db[user_id]['cooldown_times'][group] = datetime.fromisoformat(time_str)
-                        except ValueError:
-                            # 2. 유효하지 않은 문자열이면 기본값 (과거)
-                            db[user_id]['cooldown_times'][group] = default_cooldown_time
-                    else:
-                        # 기타 예외 처리
-                        db[user_id]['cooldown_times'][group] = default_cooldown_time
-
-                if 'last_cmd' in db[user_id]:
-                    del db[user_id]['last_cmd']
-
-            return db
-    except (FileNotFoundError, json.JSONDecodeError):
-        print(f"경고: {DB_FILE} 파일을 찾을 수 없거나 형식이 잘못되었습니다. 빈 DB를 시작합니다.")
-        return {}
-
-
-def save_db(db):
-    """사용자 데이터베이스를 JSON 파일에 저장 및 시간 객체 문자열 변환"""
-    db_to_save = db.copy()
-    for user_id in db_to_save:
-        if 'cooldown_times' in db_to_save[user_id]:
-            for group, time_obj in db_to_save[user_id]['cooldown_times'].items():
-                if time_obj and isinstance(time_obj, datetime):
-                    db_to_save[user_id]['cooldown_times'][group] = time_obj.isoformat()
-                else:
-                    # None일 경우 JSON에서 null 대신 빈 문자열로 저장하여 load_db에서 안정적으로 처리
-                    db_to_save[user_id]['cooldown_times'][group] = ""
 
-    with open(DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(db_to_save, f, indent=4, ensure_ascii=False)
+def _merge_record(target, source):
+    """source 의 필드를 target 에 제자리에서 반영 (target 을 들고 있는 워커도 같은 객체에서 새 값을 본다)"""
+    for key in [key for key in target if key not in source]:
+        del target[key]
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_record(target[key], value)
+        else:
+            target[key] = value
+
+
+def load_db(path=DB_FILE):
+    """JSON 파일에서 사용자 데이터베이스 로드 및 시간 객체 변환"""
+    db = read_json_file(path)
+    for user_id in db:
+        _parse_user(db[user_id])
+    return db
+
+
+def save_db(db, path=DB_FILE):
+    """사용자 데이터베이스를 JSON 파일에 저장 (임시 파일에 쓴 뒤 원자적으로 교체)"""
+    write_json_file({user_id: _serialize_user(user_data) for user_id, user_data in db.items()}, path)
+
+
+class PlayerDB:
+    """
+    메모리에 상주하는 player_db 저장소.
+
+    - self.data 가 유일한 기준 데이터이며, 명령마다 파일을 다시 읽지 않는다.
+    - 변경은 사용자 단위로 저장소 백엔드(player_storage)에 넘긴다.
+        json: player_db.json + 저널 (저널이 DB_COMPACT_EVERY 줄을 넘으면 전체 파일로 압축)
+        sqlite: 사용자 한 명당 한 행 (변경 시 그 행만 다시 씀)
+    - 운영자가 저장소를 직접 수정하면 이를 감지해 다시 읽는다.
+      다시 읽을 때 레코드 객체를 바꾸지 않고 필드 단위로 반영하므로, 워커가 들고 있는 user_data 도 그대로 유효하다.
+    - 레코드 변경은 lock 안에서 바로 commit 까지 한다. (assign_role, set_cooldown 등)
+      → reload 가 커밋되지 않은 메모리 변경을 덮어쓰거나, 낡은 레코드가 운영자 수정을 덮어쓰지 않는다.
+    - commit 은 마지막으로 저장한 내용과 비교해 바뀐 필드만 저장소에 넘긴다. (storage.update, 백엔드 공통)
+    - 보조 색인 (모든 변경 시 함께 갱신되어 조회가 O(1)):
+        by_team_role: sheet_name → {role → user_id}
+        by_acct: acct → user_id
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or open_storage(DB_BACKEND, DB_FILE, DB_JOURNAL_FILE, DB_SQLITE_FILE, DB_COMPACT_EVERY)
+        self.data = {}
+        self.by_team_role = {}
+        self.by_acct = {}
+        self._indexed = {}  # user_id → 색인에 등록된 (acct, sheet_name, role)
+        self._stored = {}  # user_id → 마지막으로 저장소와 맞춘 직렬화 레코드 (commit 시 비교 기준)
+        self.cooldowns = CooldownIndex(COOL_DOWN_HOURS * 3600, schedule=COOLDOWN_NOTIFY)
+        self.lock = threading.RLock()
+        self.reload()
+
+    # --- 보조 색인 ---
+
+    @staticmethod
+    def _acct_of(user_id, user_data):
+        # 숫자 ID로 갱신되기 전의 항목은 키 자체가 ACCT
+        return user_data.get('acct') or (None if user_id.isdigit() else user_id)
+
+    def _unindex(self, user_id, cooldowns=True):
+        if cooldowns:
+            self.cooldowns.remove(user_id)
+        acct, sheet_name, role = self._indexed.pop(user_id, (None, None, None))
+        if acct and self.by_acct.get(acct) == user_id:
+            del self.by_acct[acct]
+        roles = self.by_team_role.get(sheet_name)
+        if roles and roles.get(role) == user_id:
+            del roles[role]
+            if not roles:
+                del self.by_team_role[sheet_name]
+
+    def _index(self, user_id):
+        # 쿨타임 색인은 지우지 않고 sync 로 바뀐 그룹만 갱신 (만료 알림 힙에 같은 항목이 쌓이지 않도록)
+        self._unindex(user_id, cooldowns=False)
+        user_data = self.data[user_id]
+        acct = self._acct_of(user_id, user_data)
+        sheet_name = user_data.get('sheet_name')
+        role = user_data.get('role')
+        if acct:
+            self.by_acct[acct] = user_id
+        if sheet_name and role:
+            self.by_team_role.setdefault(sheet_name, {})[role] = user_id
+        self._indexed[user_id] = (acct, sheet_name, role)
+        self.cooldowns.sync(user_id, user_data.get('cooldown_times', {}))
+
+    def _rebuild_indexes(self):
+        self.by_team_role = {}
+        self.by_acct = {}
+        self._indexed = {}
+        self.cooldowns = CooldownIndex(COOL_DOWN_HOURS * 3600, schedule=COOLDOWN_NOTIFY)
+        for user_id in self.data:
+            self._index(user_id)
+
+    def find_by_acct(self, acct):
+        """ACCT로 사용자 키 조회"""
+        return self.by_acct.get(acct)
+
+    def find_role_holder(self, sheet_name, role):
+        """해당 팀에서 역할을 맡은 사용자 키 조회 (없으면 None)"""
+        return self.by_team_role.get(sheet_name, {}).get(role)
+
+    def assign_role(self, user_id, role, col):
+        """역할 할당 후 저장 (같은 팀에 이미 그 역할이 있으면 False)"""
+        with self.lock:
+            user_data = self.data[user_id]
+            if self.find_role_holder(user_data.get('sheet_name'), role) is not None:
+                return False
+            user_data['role'] = role
+            user_data['col'] = col
+            user_data.setdefault('cooldown_times', {'snowman_cmd': None, 'decoration_cmd': None})
+            self.commit(user_id)
+            return True
+
+    def unassign_role(self, user_id):
+        """assign_role 되돌리기 (등록 중 시트 반영에 실패한 경우)"""
+        with self.lock:
+            user_data = self.data.get(user_id)
+            if user_data is None:
+                return
+            user_data.pop('role', None)
+            user_data.pop('col', None)
+            self.commit(user_id)
+
+    def set_cooldown(self, user_id, group, used_at):
+        """쿨타임 사용 시각 기록 후 저장"""
+        with self.lock:
+            self.data[user_id].setdefault('cooldown_times', {})[group] = used_at
+            self.commit(user_id)
+
+    def reload(self):
+        """저장소를 읽어 메모리 데이터를 재구성 (self.data 와 각 레코드 객체는 그대로 유지)"""
+        with self.lock:
+            db = {user_id: _parse_user(record) for user_id, record in self.storage.load().items()}
+            # 처리 중인 다른 워커가 빈 DB나 색인에서 빠진 낡은 레코드를 보지 않도록 제자리에서 갱신
+            for user_id in [uid for uid in self.data if uid not in db]:
+                del self.data[user_id]
+            for user_id, record in db.items():
+                if user_id in self.data:
+                    _merge_record(self.data[user_id], record)
+                else:
+                    self.data[user_id] = record
+            self._stored = {user_id: _serialize_user(record) for user_id, record in self.data.items()}
+            self._rebuild_indexes()
+
+    def refresh_if_changed(self):
+        """저장소가 외부에서 수정된 경우에만 다시 읽는다."""
+        with self.lock:
+            if self.storage.changed():
+                print("player_db 가 외부에서 수정되어 다시 읽습니다.")
+                self.reload()
+
+    def commit(self, user_id):
+        """사용자 한 명의 변경 내용을 색인에 반영하고, 바뀐 필드만 저장소에 기록"""
+        with self.lock:
+            self._index(user_id)
+            record = _serialize_user(self.data[user_id])
+            previous = self._stored.get(user_id)
+            if previous is None:
+                self.storage.put(user_id, record)
+            else:
+                fields, removed = diff_record(previous, record)
+                if not fields and not removed:
+                    return
+                self.storage.update(user_id, fields, removed)
+            self._stored[user_id] = record
+
+    def rename(self, old_id, new_id):
+        """사용자 키 변경 (ACCT → 숫자 ID). 원래 ACCT는 레코드의 acct 에 남긴다."""
+        with self.lock:
+            self._unindex(old_id)
+            self.data[new_id] = self.data.pop(old_id)
+            self.data[new_id].setdefault('acct', old_id)
+            self._index(new_id)
+            record = _serialize_user(self.data[new_id])
+            self.storage.rename(old_id, new_id, record)
+            self._stored.pop(old_id, None)
+            self._stored[new_id] = record
 
 
 def _get_cooldown_group(command):
@@ -107,8 +365,8 @@ def _get_cooldown_group(command):
     return None
 
 
-def check_group_cooldown(user_data, command):
-    """특정 명령 그룹의 쿨타임을 확인"""
+def check_group_cooldown(user_data, command, now=None):
+    """특정 명령 그룹의 쿨타임을 확인 (쿨타임 값은 epoch 초)"""
     group = _get_cooldown_group(command)
     if not group:
         return True, "등록 명령. 쿨타임 없음."
@@ -116,19 +374,18 @@ def check_group_cooldown(user_data, command):
     if 'cooldown_times' not in user_data:
         user_data['cooldown_times'] = {}
 
-    cooldown_time = user_data.get('cooldown_times', {}).get(group)
+    cooldown_time = user_data['cooldown_times'].get(group)
 
-    if not isinstance(cooldown_time, datetime):
+    if cooldown_time is None:
         return True, "쿨타임 정보 없음. 명령 실행 가능."
 
-    time_since_last = datetime.now() - cooldown_time
+    remaining = cooldown_time + COOL_DOWN_HOURS * 3600 - (time.time() if now is None else now)
 
-    if time_since_last.total_seconds() > COOL_DOWN_HOURS * 3600:
+    if remaining < 0:
         return True, "쿨타임 해제. 명령 실행 가능."
     else:
-        remaining = timedelta(hours=COOL_DOWN_HOURS) - time_since_last
-        minutes = int(remaining.total_seconds() // 60)
-        seconds = int(remaining.total_seconds() % 60)
+        minutes = int(remaining // 60)
+        seconds = int(remaining % 60)
 
         # 쿨타임 메시지 템플릿 (볼드체 제거)
         cooldown_msg = f"""
@@ -139,30 +396,838 @@ def check_group_cooldown(user_data, command):
         return False, cooldown_msg.strip()
 
 
+class CooldownIndex:
+    """
+    그룹별 쿨타임 만료 시각(epoch 초) 색인. PlayerDB 의 색인과 함께 갱신된다.
+
+    - expires[group][user_id] = 만료 시각 → 개별 확인과 '지금 쿨타임 중인 사용자' 일괄 조회
+    - schedule=True 이면 아직 만료되지 않은 항목을 (만료 시각, 그룹, user_id) 힙에도 넣어 두고,
+      pop_expired() 로 방금 풀린 사용자를 만료 순서대로 꺼낸다. (바뀐 항목은 꺼낼 때 건너뜀)
+      만료 알림을 쓰지 않으면 힙을 비울 곳이 없으므로 만들지 않는다.
+    - 만료 시각이 그대로인 set() 은 아무것도 하지 않는다. (commit 마다 모든 그룹이 다시 들어와도 힙이 늘지 않음)
+    """
+
+    def __init__(self, duration, schedule=False):
+        self.duration = duration
+        self.schedule = schedule
+        self.expires = {}
+        self._heap = []
+
+    def set(self, user_id, group, last_used):
+        if last_used is None:
+            self.expires.get(group, {}).pop(user_id, None)
+            return
+        expiry = last_used + self.duration
+        expires = self.expires.setdefault(group, {})
+        if expires.get(user_id) == expiry:
+            return
+        expires[user_id] = expiry
+        if self.schedule and expiry > time.time():
+            heapq.heappush(self._heap, (expiry, group, user_id))
+
+    def sync(self, user_id, cooldown_times):
+        """사용자 레코드의 cooldown_times 전체를 반영 (레코드에 없는 그룹은 삭제)"""
+        for group, last_used in cooldown_times.items():
+            self.set(user_id, group, last_used)
+        for group, expires in self.expires.items():
+            if group not in cooldown_times:
+                expires.pop(user_id, None)
+
+    def remove(self, user_id):
+        for expires in self.expires.values():
+            expires.pop(user_id, None)
+
+    def remaining(self, user_id, group, now=None):
+        """남은 쿨타임(초), 쿨타임이 아니면 0"""
+        expiry = self.expires.get(group, {}).get(user_id)
+        if expiry is None:
+            return 0.0
+        return max(0.0, expiry - (time.time() if now is None else now))
+
+    def cooling_down(self, group, now=None):
+        """해당 그룹 쿨타임이 아직 남은 사용자 ID 목록"""
+        now = time.time() if now is None else now
+        return [user_id for user_id, expiry in self.expires.get(group, {}).items() if expiry > now]
+
+    def pop_expired(self, now=None):
+        """now 까지 쿨타임이 끝난 (user_id, group) 목록을 만료 순서대로 꺼낸다."""
+        now = time.time() if now is None else now
+        expired = []
+        found = set()
+        while self._heap and self._heap[0][0] <= now:
+            expiry, group, user_id = heapq.heappop(self._heap)
+            # 같은 만료 시각이 두 번 들어간 경우 (A → B → A 로 바뀐 경우 등) 한 번만 꺼낸다
+            if self.expires.get(group, {}).get(user_id) == expiry and (user_id, group) not in found:
+                found.add((user_id, group))
+                expired.append((user_id, group))
+        return expired
+
+
+# ==============================================================================
+# 팀 시트 캐시 (메모리에서 명령 처리 후 변경된 셀만 모아서 기록)
+# ==============================================================================
+
+def _cell_int(value, default):
+    """시트 셀 값을 정수로 변환 (숫자가 아니면 기본값)"""
+    if value is not None and str(value).isdigit():
+        return int(value)
+    return default
+
+
+def _cell_str(value):
+    return '' if value is None else str(value)
+
+
+def _a1_range(sheet_name, cell):
+    """워크시트 이름을 포함한 A1 표기 범위 ('팀'!A2)"""
+    quoted = sheet_name.replace("'", "''")
+    return f"'{quoted}'!{cell}"
+
+
+# 점수 규칙
+PERFECT_SIZES = {'A': PERFECT_HEAD, 'B': PERFECT_BODY}
+DECORATION_SCORE_BY_ROW = {data['row']: data['score'] for data in DECORATION_DATA.values()}
+
+
+def size_score(size, perfect):
+    """크기 점수: 목표 크기와의 차이만큼 100점에서 감점 (최소 0)"""
+    return max(0, 100 - abs(size - perfect))
+
+
+class AliasTable:
+    """
+    가중치에 따라 항목 하나를 O(1)로 뽑는 별칭 테이블 (Vose 방식, 생성할 때 한 번 O(n))
+
+    칸 i 를 균등하게 고른 뒤 u < prob[i] 이면 items[i], 아니면 items[alias[i]].
+    random.choices(items, weights) 와 같은 분포이고, 매번 목록/누적 가중치를 만들지 않는다.
+    """
+
+    def __init__(self, items, weights):
+        self.items = list(items)
+        n = len(self.items)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("가중치 합이 0보다 커야 합니다.")
+
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            lo, hi = small.pop(), large.pop()
+            self.prob[lo] = scaled[lo]
+            self.alias[lo] = hi
+            scaled[hi] -= 1.0 - scaled[lo]
+            (small if scaled[hi] < 1.0 else large).append(hi)
+        # 남은 칸은 부동소수점 오차만 있으므로 확률 1
+
+    def sample_index(self, rng=random):
+        x = rng.random() * len(self.items)
+        i = int(x)
+        return i if x - i < self.prob[i] else self.alias[i]
+
+    def sample(self, rng=random):
+        return self.items[self.sample_index(rng)]
+
+
+# 장식 뽑기 테이블 (DECORATION_DATA 를 바꾸면 다시 생성해야 함)
+DECORATION_SAMPLER = AliasTable(DECORATION_DATA, [data['prob'] for data in DECORATION_DATA.values()])
+
+
+class TeamState:
+    """
+    팀 워크시트(A1:B13)의 메모리 사본. cells[(행, 열문자)] = 값
+
+    크기/장식 점수는 적재 시 한 번 계산한 뒤, set() 으로 셀이 바뀔 때마다
+    바뀐 만큼만 O(1)로 반영한다.
+    """
+
+    def __init__(self, sheet_name, values=None):
+        self.sheet_name = sheet_name
+        self.cells = {}
+        for row_index, row in enumerate(values or [], start=1):
+            for col_char, value in zip('AB', row):
+                self.cells[(row_index, col_char)] = value
+        self.recompute_scores()
+
+    @classmethod
+    def from_a1(cls, sheet_name, cells):
+        """{'A2': 207, ...} 형태(저널/스냅숏)로부터 생성"""
+        team = cls(sheet_name)
+        for a1, value in cells.items():
+            team.cells[(int(a1[1:]), a1[0])] = value
+        team.recompute_scores()
+        return team
+
+    def to_a1(self):
+        return {f"{col_char}{row_index}": value for (row_index, col_char), value in self.cells.items()}
+
+    def get_int(self, row_index, col_char, default=0):
+        return _cell_int(self.cells.get((row_index, col_char)), default)
+
+    def size(self, col_char):
+        return self.get_int(2, col_char, 200)
+
+    def deco_count(self, row_index, col_char):
+        return self.get_int(row_index, col_char, 0)
+
+    def recompute_scores(self):
+        """모든 셀로부터 점수를 처음부터 계산"""
+        self.size_scores = {col: size_score(self.size(col), PERFECT_SIZES[col]) for col in 'AB'}
+        self.deco_scores = {
+            col: sum(score * self.deco_count(row, col) for row, score in DECORATION_SCORE_BY_ROW.items())
+            for col in 'AB'
+        }
+
+    def set(self, row_index, col_char, value):
+        """셀 값을 바꾸고, 크기/장식 셀이면 해당 점수를 변화량만큼 갱신"""
+        if row_index == 2:
+            self.cells[(row_index, col_char)] = value
+            self.size_scores[col_char] = size_score(self.size(col_char), PERFECT_SIZES[col_char])
+        elif row_index in DECORATION_SCORE_BY_ROW:
+            delta = _cell_int(value, 0) - self.deco_count(row_index, col_char)
+            self.cells[(row_index, col_char)] = value
+            self.deco_scores[col_char] += delta * DECORATION_SCORE_BY_ROW[row_index]
+        else:
+            self.cells[(row_index, col_char)] = value
+
+    @property
+    def final_score(self):
+        return sum(self.size_scores.values()) + sum(self.deco_scores.values())
+
+    def score_cells(self):
+        """A11:B13 에 들어갈 점수 셀 값"""
+        return {
+            (11, 'A'): self.size_scores['A'],  # A11: 크기 점수-머리
+            (11, 'B'): self.size_scores['B'],  # B11: 크기 점수-몸통
+            (12, 'A'): self.deco_scores['A'],  # A12: 장식 점수-머리
+            (12, 'B'): self.deco_scores['B'],  # B12: 장식 점수-몸통
+            (13, 'A'): self.final_score,       # A13: 최종 점수
+        }
+
+
+class TeamStateCache:
+    """
+    팀별 시트 상태를 메모리에 보관하는 write-behind 캐시.
+
+    - 시작 시 한 번 시트에서 읽어오고, 이후 명령은 메모리에서만 처리한다.
+    - 변경된 셀은 dirty 목록에 모았다가 SHEET_FLUSH_INTERVAL 마다
+      values_batch_update 한 번으로 기록한다. (같은 셀은 마지막 값만 기록)
+    - 시트 기록은 SheetsScheduler 를 거친다. (공용 런타임에서는 다른 이벤트와 같은 스케줄러)
+    - journal 이 주어지면 reconcile() 로 바뀐 셀을 명령 저널에 남긴다.
+    """
+
+    def __init__(self, spreadsheet, scheduler=None, journal=None):
+        self.spreadsheet = spreadsheet
+        self.scheduler = scheduler or SheetsScheduler('snowman')
+        self.journal = journal
+        self.teams = {}
+        self._dirty = {}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()  # flush 와 reconcile 이 겹치지 않도록
+        self._flusher = None
+
+    def seed(self, sheet_names):
+        """
+        시작 시 지정한 팀 워크시트들을 한꺼번에 읽어 캐시에 적재
+
+        - worksheets() 1회로 실제 존재하는 워크시트를 확인하고
+        - values_batch_get 1회로 모든 팀의 A1:B13 을 가져온다.
+        일괄 조회가 실패하면 팀별로 하나씩 읽는다.
+        """
+        started = time.monotonic()
+        wanted = sorted(set(sheet_names))
+        if not wanted:
+            return
+
+        try:
+            metrics.inc('sheets_calls_total', bot='snowman', op='worksheets')
+            worksheets = self.scheduler.call(self.spreadsheet.worksheets, kind='read', priority=PRIORITY_STATE)
+            existing = {ws.title for ws in worksheets}
+            missing = [name for name in wanted if name not in existing]
+            if missing:
+                print(f"경고: player_db 에 있지만 시트에 없는 팀 워크시트: {', '.join(missing)}")
+            names = [name for name in wanted if name in existing]
+
+            metrics.inc('sheets_calls_total', bot='snowman', op='values_batch_get')
+            with metrics.timed('snowman_stage_seconds', stage='sheets_preload'):
+                response = self.scheduler.call(
+                    self.spreadsheet.values_batch_get, [_a1_range(name, 'A1:B13') for name in names],
+                    kind='read', priority=PRIORITY_STATE,
+                )
+            value_ranges = response.get('valueRanges', [])
+            with self._lock:
+                for name, value_range in zip(names, value_ranges):
+                    self.teams[name] = TeamState(name, value_range.get('values', []))
+        except Exception as e:
+            print(f"팀 시트 일괄 로드 오류, 팀별로 다시 읽습니다: {e}")
+            for sheet_name in wanted:
+                try:
+                    self._load(sheet_name)
+                except Exception as e:
+                    print(f"팀 시트 로드 오류 ({sheet_name}): {e}")
+
+        print(f"팀 시트 {len(self.teams)}개 적재 완료 ({time.monotonic() - started:.2f}s)")
+
+    def restore(self, teams, pending=()):
+        """
+        저널 스냅숏의 팀 상태({팀: {'A2': 값}})로 캐시를 채운다. (시트 읽기 없음)
+        스냅숏 당시 기록 대기 중이던 셀은 다시 기록 대기 목록에 넣는다.
+        """
+        with self._lock:
+            for sheet_name, cells in teams.items():
+                self.teams[sheet_name] = TeamState.from_a1(sheet_name, cells)
+            for sheet_name, a1 in pending:
+                team = self.teams.get(sheet_name)
+                if team is not None:
+                    self._dirty[(sheet_name, int(a1[1:]), a1[0])] = team.cells.get((int(a1[1:]), a1[0]))
+
+    def apply_events(self, events):
+        """
+        저널 이벤트의 셀 값을 적용하고 기록 대기 목록에 넣는다. (이미 시트에 반영된 값이어도 다시 기록해서 안전)
+        반환값: 적용한 팀 이름 집합
+        """
+        touched = set()
+        for event in events:
+            team = self.get(event['team'])
+            for a1, value in event.get('cells', {}).items():
+                self.set_cell(team, int(a1[1:]), a1[0], value)
+            touched.add(event['team'])
+        for sheet_name in touched:
+            self.write_scores(self.teams[sheet_name])
+        return touched
+
+    def export(self):
+        """저널 스냅숏용: ({팀: {'A2': 값}}, [(팀, 'A2'), ...] 기록 대기 셀)"""
+        with self._lock:
+            teams = {sheet_name: team.to_a1() for sheet_name, team in self.teams.items()}
+            pending = [(sheet_name, f"{col_char}{row_index}") for sheet_name, row_index, col_char in self._dirty]
+        return teams, pending
+
+    def _load(self, sheet_name):
+        a1 = _a1_range(sheet_name, 'A1:B13')
+        metrics.inc('sheets_calls_total', bot='snowman', op='values_get')
+        with metrics.timed('snowman_stage_seconds', stage='sheets_read'):
+            # 명령 응답을 기다리는 읽기이므로 가장 먼저 실행 (같은 팀을 동시에 읽으면 한 번만 요청)
+            response = self.scheduler.call(
+                self.spreadsheet.values_get, a1, kind='read', priority=PRIORITY_INTERACTIVE, key=a1,
+            )
+        team = TeamState(sheet_name, response.get('values', []))
+        with self._lock:
+            self.teams[sheet_name] = team
+        return team
+
+    def get(self, sheet_name):
+        """팀 상태 반환 (시작 시 적재되지 않은 팀은 이때 한 번 읽어온다)"""
+        with self._lock:
+            team = self.teams.get(sheet_name)
+        if team is None:
+            team = self._load(sheet_name)
+        return team
+
+    def set_cell(self, team, row_index, col_char, value):
+        """메모리 값을 갱신하고 기록 대기 목록에 추가"""
+        with self._lock:
+            team.set(row_index, col_char, value)
+            self._dirty[(team.sheet_name, row_index, col_char)] = value
+
+    def write_scores(self, team):
+        """점수 셀 중 값이 바뀐 것만 기록 대기 목록에 추가"""
+        for (row_index, col_char), value in team.score_cells().items():
+            if team.get_int(row_index, col_char, None) != value:
+                self.set_cell(team, row_index, col_char, value)
+
+    def reconcile(self):
+        """
+        모든 팀 시트의 A1:B10 을 한 번의 values_batch_get 으로 다시 읽어 캐시와 대조한다.
+
+        - 기록 대기 중인 셀은 캐시 값을 유지하고, 나머지는 시트 값(운영자 수정 등)을 따른다.
+        - 점수는 처음부터 다시 계산해 바뀐 점수 셀만 기록한다.
+        - 바뀐 셀은 팀마다 reconcile 이벤트로 저널에 남긴다. (재시작 때 이전 명령 결과로 되돌아가지 않도록)
+        반환값: 시트 값으로 바뀐 셀 수
+        """
+        changed = 0
+        with self._flush_lock:
+            with self._lock:
+                teams = list(self.teams.items())
+            if not teams:
+                return 0
+            metrics.inc('sheets_calls_total', bot='snowman', op='values_batch_get')
+            with metrics.timed('snowman_stage_seconds', stage='sheets_reconcile'):
+                response = self.scheduler.call(
+                    self.spreadsheet.values_batch_get, [_a1_range(name, 'A1:B10') for name, _ in teams],
+                    kind='read', priority=PRIORITY_STATE,
+                )
+            for (sheet_name, team), value_range in zip(teams, response.get('valueRanges', [])):
+                sheet_state = TeamState(sheet_name, value_range.get('values', []))
+                with self._lock:
+                    corrected = {}
+                    for row_index in range(1, 11):
+                        for col_char in 'AB':
+                            key = (row_index, col_char)
+                            if (sheet_name, row_index, col_char) in self._dirty:
+                                continue
+                            sheet_value = sheet_state.cells.get(key)
+                            if _cell_str(sheet_value) != _cell_str(team.cells.get(key)):
+                                team.cells[key] = sheet_value
+                                corrected[f"{col_char}{row_index}"] = sheet_value
+                    team.recompute_scores()
+                    self.write_scores(team)
+                    # 잠금 안에서 기록해야 같은 셀을 바꾼 명령 이벤트보다 앞 순서로 남는다
+                    if corrected and self.journal:
+                        try:
+                            self.journal.record_reconcile(sheet_name, corrected)
+                        except Exception as e:
+                            print(f"명령 저널 기록 오류 (시트 대조 {sheet_name}): {e}")
+                changed += len(corrected)
+        if changed:
+            print(f"시트 대조: 외부에서 수정된 셀 {changed}개를 캐시에 반영했습니다.")
+        return changed
+
+    def flush(self):
+        """대기 중인 셀 변경을 단일 batch 요청으로 시트에 기록"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            if not self._dirty:
+                return 0
+            pending = self._dirty
+            self._dirty = {}
+
+        data = [
+            {'range': _a1_range(sheet_name, f"{col_char}{row_index}"), 'values': [[value]]}
+            for (sheet_name, row_index, col_char), value in pending.items()
+        ]
+        try:
+            metrics.inc('sheets_calls_total', bot='snowman', op='values_batch_update')
+            with metrics.timed('snowman_stage_seconds', stage='sheets_flush'):
+                self.scheduler.call(
+                    self.spreadsheet.values_batch_update, {'valueInputOption': 'USER_ENTERED', 'data': data},
+                    kind='write', priority=PRIORITY_STATE,
+                )
+        except Exception as e:
+            if is_rate_limited(e):
+                metrics.inc('sheets_429_total', bot='snowman')
+            print(f"FATAL GSPREAD FLUSH ERROR ({len(data)} cells): {e}")
+            with self._lock:
+                # 실패한 변경은 되돌려 놓되, 그 사이 새로 바뀐 셀은 새 값을 유지
+                for key, value in pending.items():
+                    self._dirty.setdefault(key, value)
+            return 0
+
+        return len(data)
+
+    def start_flusher(self, interval=None):
+        """주기적으로 flush 하는 데몬 스레드 시작"""
+        interval = SHEET_FLUSH_INTERVAL if interval is None else interval
+
+        def _run():
+            last_reconcile = time.monotonic()
+            while True:
+                time.sleep(interval)
+                self.flush()
+                if SCORE_RECONCILE_INTERVAL and time.monotonic() - last_reconcile >= SCORE_RECONCILE_INTERVAL:
+                    last_reconcile = time.monotonic()
+                    try:
+                        self.reconcile()
+                    except Exception as e:
+                        print(f"시트 대조 오류: {e}")
+
+        self._flusher = threading.Thread(target=_run, daemon=True)
+        self._flusher.start()
+
+
+# ==============================================================================
+# 순위표 (캐시된 팀 점수로 계산, 시트 읽기 없음)
+# ==============================================================================
+
+class Leaderboard:
+    """
+    팀별 최종 점수를 (-점수, 팀 이름) 순으로 정렬된 리스트에 유지한다.
+
+    - update(): bisect 로 기존 항목을 빼고 새 위치에 끼워 넣음 (점수가 같으면 그대로)
+    - 같은 점수는 같은 순위 (1, 2, 2, 4 ...)
+    """
+
+    def __init__(self):
+        self.scores = {}
+        self._sorted = []
+        self._lock = threading.Lock()
+        self.version = 0  # 순위가 바뀔 때마다 증가 (요약 시트 기록 여부 판단용)
+
+    def update(self, sheet_name, score):
+        with self._lock:
+            old = self.scores.get(sheet_name)
+            if old == score:
+                return
+            if old is not None:
+                index = bisect.bisect_left(self._sorted, (-old, sheet_name))
+                del self._sorted[index]
+            bisect.insort(self._sorted, (-score, sheet_name))
+            self.scores[sheet_name] = score
+            self.version += 1
+
+    def rank_of(self, sheet_name):
+        """팀의 (순위, 점수) 반환, 없는 팀이면 None"""
+        with self._lock:
+            score = self.scores.get(sheet_name)
+            if score is None:
+                return None
+            return bisect.bisect_left(self._sorted, (-score, '')) + 1, score
+
+    def standings(self, limit=None):
+        """[(순위, 팀 이름, 점수)] 를 높은 점수부터 반환"""
+        with self._lock:
+            entries = self._sorted if limit is None else self._sorted[:limit]
+            result = []
+            rank = 0
+            previous = None
+            for position, (negative_score, sheet_name) in enumerate(entries, start=1):
+                if negative_score != previous:
+                    rank = position
+                    previous = negative_score
+                result.append((rank, sheet_name, -negative_score))
+            return result
+
+    def format_reply(self, sheet_name=None, limit=LEADERBOARD_REPLY_TOP):
+        """[눈사람/순위] 응답 본문"""
+        lines = [f"{rank}위 ― {name} ({score}점)" for rank, name, score in self.standings(limit)]
+        if not lines:
+            return "아직 집계된 순위가 없습니다."
+        text = "현재 눈사람 순위\n\n" + "\n".join(lines)
+        mine = self.rank_of(sheet_name) if sheet_name else None
+        if mine:
+            text += f"\n\n우리 팀({sheet_name}) ― {mine[0]}위, {mine[1]}점"
+        return text
+
+    def write_summary(self, spreadsheet, scheduler, sheet_name=LEADERBOARD_SHEET):
+        """전체 순위를 요약 워크시트에 단일 batch 요청으로 기록"""
+        rows = [['순위', '팀', '최종 점수']] + [list(entry) for entry in self.standings()]
+        metrics.inc('sheets_calls_total', bot='snowman', op='values_batch_update')
+        with metrics.timed('snowman_stage_seconds', stage='leaderboard_write'):
+            scheduler.call(spreadsheet.values_batch_update, {
+                'valueInputOption': 'USER_ENTERED',
+                'data': [{'range': _a1_range(sheet_name, f'A1:C{len(rows)}'), 'values': rows}],
+            }, kind='write', priority=PRIORITY_STATE, key=('leaderboard', sheet_name))
+
+    def start_writer(self, spreadsheet, scheduler, interval=None):
+        """순위가 바뀐 경우에만 주기적으로 요약 워크시트를 갱신하는 데몬 스레드 시작"""
+        interval = LEADERBOARD_INTERVAL if interval is None else interval
+
+        def _run():
+            written_version = None
+            while True:
+                time.sleep(interval)
+                version = self.version
+                if version == written_version:
+                    continue
+                try:
+                    self.write_summary(spreadsheet, scheduler)
+                    written_version = version
+                except Exception as e:
+                    print(f"순위 요약 시트 기록 오류: {e}")
+
+        thread = threading.Thread(target=_run, daemon=True)
+        thread.start()
+        return thread
+
+
+# ==============================================================================
+# 명령 디스패처 (워커 풀 + 팀 단위 순서 보장)
+# ==============================================================================
+
+class CommandDispatcher:
+    """
+    스트림 스레드에서 받은 툿을 워커 풀로 넘겨 처리한다.
+
+    - route(status)가 돌려준 키(팀 sheet_name)로 워커를 고르므로
+      같은 팀의 명령은 항상 한 워커에서 순서대로 처리된다.
+    - 워커별 대기열은 크기가 제한되어 있고, 가득 차면 submit()이 대기한다. (backpressure)
+    - submit(status, on_done) 의 on_done 은 처리가 끝난 뒤(실패 포함) 워커에서 호출된다. (알림 커서 갱신용)
+    """
+
+    def __init__(self, handler, route, workers=DISPATCH_WORKERS, queue_size=DISPATCH_QUEUE_SIZE):
+        self.handler = handler
+        self.route = route
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'processed': 0,
+            'failed': 0,
+            'blocked': 0,  # 대기열이 가득 차 submit()이 기다린 횟수
+            'blocked_seconds': 0.0,
+            'max_depth': 0,
+        }
+        self._threads = []
+        for index, q in enumerate(self.queues):
+            thread = threading.Thread(target=self._worker, args=(q,), name=f"snowman-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def submit(self, status, on_done=None):
+        """툿을 해당 팀의 워커 대기열에 넣는다. 대기열이 가득 차면 빌 때까지 기다린다."""
+        key = str(self.route(status))
+        q = self.queues[zlib.crc32(key.encode('utf-8')) % len(self.queues)]
+
+        try:
+            q.put_nowait((status, on_done))
+        except queue.Full:
+            print(f"DEBUG: 명령 대기열이 가득 찼습니다. (key={key}) 처리될 때까지 대기합니다.")
+            started = time.monotonic()
+            q.put((status, on_done))
+            self._count('blocked')
+            self._count('blocked_seconds', time.monotonic() - started)
+
+        with self._stats_lock:
+            self._stats['submitted'] += 1
+            self._stats['max_depth'] = max(self._stats['max_depth'], q.qsize())
+
+    def _worker(self, q):
+        while True:
+            item = q.get()
+            if item is None:
+                q.task_done()
+                break
+            status, on_done = item
+            try:
+                with metrics.timed('snowman_stage_seconds', stage='command'):
+                    self.handler(status)
+                self._count('processed')
+            except Exception as e:
+                self._count('failed')
+                print(f"FATAL COMMAND ERROR (status {status.get('id')}): {e}")
+            finally:
+                if on_done is not None:
+                    on_done()
+                q.task_done()
+
+    def stats(self):
+        """처리량 및 대기열 상태 (backpressure 지표)"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depths'] = [q.qsize() for q in self.queues]
+        return stats
+
+    def stop(self):
+        """대기 중인 명령을 모두 처리한 뒤 워커를 종료"""
+        for q in self.queues:
+            q.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+# ==============================================================================
+# 응답 전송기 (비동기 큐 + 마스토돈 rate limit 대응)
+# ==============================================================================
+
+def _jittered_backoff(attempt):
+    """attempt번째 재시도 대기 시간 (지수 증가 + full jitter)"""
+    return random.uniform(0, min(REPLY_BACKOFF_MAX, REPLY_BACKOFF_BASE * (2 ** attempt)))
+
+
+class ReplySender:
+    """
+    status_reply 를 큐에 넣고 별도 워커가 전송한다. (명령 처리는 바로 다음 툿으로 넘어감)
+
+    - 마스토돈 응답 헤더(X-RateLimit-Remaining/Reset)를 보고 남은 요청이 적으면 리셋 시각까지 대기
+    - 429(rate limit)는 리셋 시각까지, 네트워크/5xx 오류는 지수 백오프 + 지터로 재시도
+    - 큐에 넣은 시점부터 전송 완료까지의 지연을 기록해 백분위(p50/p90/p99)를 제공
+    """
+
+    def __init__(self, api, workers=REPLY_WORKERS):
+        self.api = api
+        self.queue = queue.Queue()
+        self._latencies = deque(maxlen=REPLY_LATENCY_WINDOW)
+        self._stats_lock = threading.Lock()
+        self._stats = {'sent': 0, 'failed': 0, 'retries': 0, 'rate_limited': 0}
+        self._threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"snowman-reply-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def send(self, status, text):
+        """응답을 전송 큐에 넣는다. (즉시 반환)"""
+        self.queue.put((status, text, time.monotonic()))
+
+    def post(self, acct, text):
+        """답글이 아닌 DM(direct) 툿을 전송 큐에 넣는다. (쿨타임 만료 알림 등)"""
+        status = {'account': {'acct': acct}}  # 답글 대상이 없다는 표시 ('id' 없음)
+        self.queue.put((status, f"@{acct} {text}", time.monotonic()))
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _wait_for_ratelimit(self):
+        """남은 요청 수가 적으면 리셋 시각(+지터)까지 대기"""
+        remaining = getattr(self.api, 'ratelimit_remaining', None)
+        reset = getattr(self.api, 'ratelimit_reset', None)
+        if remaining is None or reset is None or remaining > REPLY_RATELIMIT_RESERVE:
+            return
+        wait = reset - time.time()
+        if wait > 0:
+            print(f"DEBUG: 마스토돈 rate limit 잔여 {remaining}회, {wait:.1f}초 대기합니다.")
+            time.sleep(wait + random.uniform(0, 1))
+
+    def _deliver(self, status, text):
+        """한 건 전송 (재시도 포함). 성공 여부 반환"""
+        username = status['account']['acct']
+        for attempt in range(REPLY_MAX_ATTEMPTS):
+            if attempt:
+                self._count('retries')
+            self._wait_for_ratelimit()
+            try:
+                if 'id' in status:
+                    metrics.inc('mastodon_calls_total', bot='snowman', op='status_reply')
+                    with metrics.timed('snowman_stage_seconds', stage='reply'):
+                        self.api.status_reply(status, text)
+                else:
+                    metrics.inc('mastodon_calls_total', bot='snowman', op='status_post')
+                    with metrics.timed('snowman_stage_seconds', stage='reply'):
+                        self.api.status_post(text, visibility='direct')
+                print(f"DEBUG: Reply to @{username} SUCCESS.")
+                return True
+            except MastodonRatelimitError:
+                self._count('rate_limited')
+                metrics.inc('mastodon_429_total', bot='snowman')
+                reset = getattr(self.api, 'ratelimit_reset', None)
+                wait = max(0, reset - time.time()) if reset else _jittered_backoff(attempt)
+                print(f"DEBUG: 마스토돈 429, {wait:.1f}초 후 재시도 ({attempt + 1}/{REPLY_MAX_ATTEMPTS})")
+                time.sleep(wait + random.uniform(0, 1))
+            except (MastodonNetworkError, MastodonServerError) as e:
+                wait = _jittered_backoff(attempt)
+                print(f"DEBUG: Reply to @{username} 실패 ({e}), {wait:.1f}초 후 재시도 ({attempt + 1}/{REPLY_MAX_ATTEMPTS})")
+                time.sleep(wait)
+            except Exception as e:
+                print(f"FATAL REPLY ERROR for @{username}: {e}")
+                return False
+
+        print(f"FATAL REPLY ERROR for @{username}: {REPLY_MAX_ATTEMPTS}회 시도 후 포기")
+        return False
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            status, text, queued_at = item
+            try:
+                if self._deliver(status, text):
+                    self._count('sent')
+                    with self._stats_lock:
+                        self._latencies.append(time.monotonic() - queued_at)
+                else:
+                    self._count('failed')
+            finally:
+                self.queue.task_done()
+
+    def latency_percentiles(self):
+        """최근 응답 지연(초)의 p50/p90/p99"""
+        with self._stats_lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return {'p50': None, 'p90': None, 'p99': None}
+
+        def pick(q):
+            return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+        return {'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99)}
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queued'] = self.queue.qsize()
+        stats['latency'] = self.latency_percentiles()
+        return stats
+
+    def stop(self):
+        """큐에 남은 응답을 모두 보낸 뒤 워커 종료"""
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
 # ==============================================================================
 # SnowmanBot 클래스 (메인 로직)
 # ==============================================================================
 
 class SnowmanBot:
-    def __init__(self):
-        # 1. DB 로드 (시작 시 최초 1회)
-        self.player_db = load_db()
+    def __init__(self, mastodon=None, spreadsheet=None, scheduler=None, cursor=None):
+        """
+        mastodon/spreadsheet 을 넘기면 해당 연결을 새로 만들지 않고 그대로 사용 (벤치마크/공용 런타임용)
+        scheduler 를 넘기면 시트 요청을 그 SheetsScheduler 로 보낸다. (없으면 봇 전용 스케줄러 생성)
+        cursor 를 넘기면 그 NotificationCursor 를 쓴다. (없으면 CURSOR_FILE 로 봇 전용 커서 생성)
+        """
+        # 1. DB 로드 (시작 시 최초 1회, 이후에는 메모리 상의 데이터를 사용)
+        self.db = PlayerDB()
+        self.player_db = self.db.data
+
+        # 이미 처리한 툿 ID (DB 옆에 저장, 재접속/따라잡기 시 중복 적용 방지)
+        self.seen = SeenSet(SEEN_FILE)
 
         # 2. Gspread 인증 및 시트 연결
+        # 모든 시트 요청은 스케줄러를 거친다. (분당 할당량 + 우선순위)
+        self.scheduler = scheduler or SheetsScheduler('snowman')
         try:
-            self.gc = gspread.service_account(filename=SERVICE_ACCOUNT_FILE)
-            self.spreadsheet = self.gc.open(SHEET_NAME)
+            if spreadsheet is None:
+                self.gc = gspread.service_account(filename=SERVICE_ACCOUNT_FILE)
+                spreadsheet = self.scheduler.call(self.gc.open, SHEET_NAME, kind='read', priority=PRIORITY_STATE)
+            self.spreadsheet = spreadsheet
             print("Gspread 인증 및 시트 연결 완료.")
+
+            # 팀 시트 상태를 한 번만 읽어서 메모리에 적재
+            # (명령 저널이 있으면 마지막 스냅숏 + 이후 명령으로 복구하고, 스냅숏에 없는 팀만 시트에서 읽음)
+            self.journal = GameJournal(JOURNAL_FILE, JOURNAL_SNAPSHOT_FILE, JOURNAL_SNAPSHOT_EVERY) if JOURNAL_FILE else None
+            self.teams = TeamStateCache(self.spreadsheet, self.scheduler, self.journal)
+            recovery = self.journal.load() if self.journal else None
+            if recovery and recovery.seq is not None:
+                self.teams.restore(recovery.teams, recovery.pending)
+                print(f"명령 저널 스냅숏(seq {recovery.seq})에서 팀 {len(recovery.teams)}개 복구")
+            self.teams.seed(
+                data['sheet_name'] for data in self.player_db.values()
+                if data.get('sheet_name') and data['sheet_name'] not in self.teams.teams
+            )
+            if recovery:
+                started = time.monotonic()
+                touched = self.teams.apply_events(recovery.events)
+                if recovery.events:
+                    print(f"명령 저널 {len(recovery.events)}건 재적용 (팀 {len(touched)}개, {time.monotonic() - started:.3f}s)")
+                if recovery.seq is None or self.journal.due_snapshot():
+                    # 첫 실행이면 시트에서 읽은 상태를 기준 스냅숏으로 남긴다
+                    self.journal.snapshot(self.teams.export)
+            self.teams.start_flusher()
+
+            # 순위표는 적재된 팀 점수로 채우고, 이후 _update_scores 에서 갱신
+            self.leaderboard = Leaderboard()
+            for sheet_name, team in list(self.teams.teams.items()):
+                self.leaderboard.update(sheet_name, team.final_score)
+            if LEADERBOARD_SHEET:
+                self.leaderboard.start_writer(self.spreadsheet, self.scheduler)
         except Exception as e:
             print(f"Gspread 연결 오류: {e}")
             exit()
 
         # 3. Mastodon 연결
         try:
-            self.m = Mastodon(
-                access_token=ACCESS_TOKEN,
-                api_base_url=MASTODON_INSTANCE
-            )
+            if mastodon is None:
+                mastodon = Mastodon(
+                    access_token=ACCESS_TOKEN,
+                    api_base_url=MASTODON_INSTANCE,
+                    # rate limit 은 라이브러리가 멈춰 기다리지 않고 ReplySender 가 직접 처리
+                    ratelimit_method='throw'
+                )
+            self.m = mastodon
             # 봇 계정 정보를 미리 로드하여 중복 처리 방지에 사용
             self.bot_acct = self.m.account_verify_credentials()['acct']
             print("마스토돈 인증 완료.")
@@ -170,6 +1235,45 @@ class SnowmanBot:
             print(f"마스토돈 연결/인증 오류: {e}")
             exit()
 
+        # 4. 응답 전송 큐 + 명령 처리 워커 풀
+        self.replies = ReplySender(self.m)
+        self.dispatcher = CommandDispatcher(self.handle_command, self._dispatch_key)
+        metrics.gauge_callback('snowman_dispatch_queue_depth', lambda: sum(self.dispatcher.stats()['queue_depths']))
+        metrics.gauge_callback('snowman_reply_queue_depth', self.replies.queue.qsize)
+
+        # 5. 마지막으로 처리한 알림 위치 (재접속 시 놓친 멘션 따라잡기)
+        self.cursor = cursor if cursor is not None else NotificationCursor(CURSOR_FILE)
+
+        # 6. 쿨타임 만료 알림 (선택)
+        if COOLDOWN_NOTIFY:
+            threading.Thread(target=self._notify_cooldowns, name="snowman-cooldown", daemon=True).start()
+
+    def _notify_cooldowns(self):
+        """주기적으로 쿨타임이 끝난 플레이어를 일괄로 꺼내 DM 알림"""
+        while True:
+            time.sleep(COOLDOWN_NOTIFY_INTERVAL)
+            with self.db.lock:
+                expired = [
+                    (PlayerDB._acct_of(user_id, self.player_db[user_id]), group)
+                    for user_id, group in self.db.cooldowns.pop_expired()
+                    if user_id in self.player_db
+                ]
+            for acct, group in expired:
+                message = COOLDOWN_EXPIRED_MESSAGES.get(group)
+                if acct and message:
+                    self.replies.post(acct, message)
+
+    def _dispatch_key(self, status):
+        """툿을 보낸 사용자의 팀(sheet_name)을 찾아 워커 배정 키로 사용 (DB 변경 없음)"""
+        account = status['account']
+        user_id = str(account['id'])
+        if user_id not in self.player_db:
+            user_id = self.db.find_by_acct(account['acct'])
+        user_data = self.player_db.get(user_id) if user_id else None
+        if user_data and user_data.get('sheet_name'):
+            return user_data['sheet_name']
+        return f"user:{account['id']}"
+
     # --- ID 자동 획득 및 DB 갱신 함수 ---
     def _resolve_user_id(self, username, user_id):
         """사용자명(ACCT)을 통해 DB에서 사용자를 찾아냅니다."""
@@ -177,15 +1281,13 @@ class SnowmanBot:
         if user_id in self.player_db:
             return user_id, self.player_db[user_id]
 
-        if username in self.player_db:
+        known_id = self.db.find_by_acct(username)
+        if known_id is not None:
             print(f"ID 자동 획득: @{username}의 ID({user_id})를 찾아 DB 키를 갱신합니다.")
 
-            user_data = self.player_db.pop(username)
-            self.player_db[user_id] = user_data
-
-            save_db(self.player_db)
+            self.db.rename(known_id, user_id)
 
-            return user_id, user_data
+            return user_id, self.player_db[user_id]
 
         return None, None
 
@@ -208,37 +1310,25 @@ class SnowmanBot:
         new_role = '머리' if command == '[눈사람/머리]' else '몸통'
         new_col = 'A' if command == '[눈사람/머리]' else 'B'
 
-        is_role_taken = False
-        for uid, data in self.player_db.items():
-            if data.get('sheet_name') == sheet_name and data.get('role') == new_role:
-                is_role_taken = True
-                break
-
-        # 오류 메시지 수정: 역할 중복
-        if is_role_taken:
+        # 오류 메시지 수정: 역할 중복 (팀/역할 색인으로 확인 후 할당)
+        if not self.db.assign_role(user_id, new_role, new_col):
             return f"{sheet_name}의 {new_role} 역할이 이미 존재합니다. 운영 계정(@MARCH)으로 문의해 주십시오."
 
-        self.player_db[user_id]['role'] = new_role
-        self.player_db[user_id]['col'] = new_col
-
         try:
-            team_sheet = self.spreadsheet.worksheet(sheet_name)
-            col_index = ord(new_col) - ord('A') + 1
-            team_sheet.update_cell(1, col_index, username)
-            team_sheet.update_cell(2, col_index, 200)
+            team = self.teams.get(sheet_name)
+            self.teams.set_cell(team, 1, new_col, username)
+            self.teams.set_cell(team, 2, new_col, 200)
 
-            self._update_scores(team_sheet)
+            self._update_scores(team)
+            self._record(user_id, sheet_name, command, {f"{new_col}1": username, f"{new_col}2": 200})
 
         # 오류 메시지 수정: 시트 업데이트 오류
         except Exception as e:
             print(f"Gspread registration update error for @{username}: {e}")
+            # 역할을 되돌려 다시 등록할 수 있게 한다 (다른 명령의 commit 으로 반쯤 된 등록이 저장되지 않도록)
+            self.db.unassign_role(user_id)
             return "연동 오류가 발생하였습니다. 운영 계정(@MARCH)으로 문의해 주십시오."
 
-        if 'cooldown_times' not in self.player_db[user_id]:
-            self.player_db[user_id]['cooldown_times'] = {'snowman_cmd': None, 'decoration_cmd': None}
-
-        save_db(self.player_db)
-
         # 등록 스크립트 템플릿 적용 (볼드체 제거)
         registration_reply = f"""
 눈사람의 {new_role} 을/를 멋지게 만들어 보자.
@@ -248,7 +1338,7 @@ class SnowmanBot:
 """
         return registration_reply.strip()
 
-    def _update_snowman_size(self, team_sheet, role, col_char, current_size, command):
+    def _update_snowman_size(self, team, role, col_char, current_size, command):
         """눈덩이 크기 조절 및 응답 메시지 생성 로직"""
 
         if command == '[눈사람/굴리기]':
@@ -258,8 +1348,7 @@ class SnowmanBot:
         else:
             new_size = current_size + random.randint(-10, 10)
 
-        col_index = ord(col_char) - ord('A') + 1
-        team_sheet.update_cell(2, col_index, new_size)
+        self.teams.set_cell(team, 2, col_char, new_size)
 
         response_message = ""
 
@@ -297,29 +1386,24 @@ class SnowmanBot:
 
         return new_size, response_message
 
-    def _try_get_decoration(self, team_sheet, role, col_char):
-        """[눈사람/장식] 명령 처리: 가중치에 따라 하나의 장식을 획득하고 응답 메시지를 생성"""
+    def _try_get_decoration(self, team, role, col_char):
+        """
+        [눈사람/장식] 명령 처리: 가중치에 따라 하나의 장식을 획득하고 응답 메시지를 생성
+        반환값: (획득한 장식 명령, 새 보유 개수, 응답 메시지)
+        """
 
-        items = list(DECORATION_DATA.keys())
-        weights = [data['prob'] for data in DECORATION_DATA.values()]
-
-        # 1. 가중치에 따라 획득할 장식 선택
-        acquired_command = random.choices(items, weights=weights, k=1)[0]
+        # 1. 가중치에 따라 획득할 장식 선택 (미리 만든 별칭 테이블)
+        acquired_command = DECORATION_SAMPLER.sample()
         deco_info = DECORATION_DATA[acquired_command]
 
-        col_index = ord(col_char) - ord('A') + 1
         row_index = deco_info['row']
         count_to_add = deco_info['count']
 
-        current_count_str = team_sheet.cell(row_index, col_index).value
-        try:
-            current_count = int(current_count_str)
-        except (ValueError, TypeError):
-            current_count = 0
+        current_count = team.deco_count(row_index, col_char)
 
-            # 2. 시트 업데이트
+        # 2. 캐시 업데이트 (시트에는 flush 시 기록)
         new_count = current_count + count_to_add
-        team_sheet.update_cell(row_index, col_index, new_count)
+        self.teams.set_cell(team, row_index, col_char, new_count)
 
         item_name = acquired_command.split('/')[1].replace(']', '')
 
@@ -332,82 +1416,53 @@ class SnowmanBot:
 획득 ― {item_name}
 보유 현황 ― {new_count} 개
 """
-        return response_template.strip()
+        return acquired_command, new_count, response_template.strip()
 
-    def _update_scores(self, team_sheet):
-        """크기 및 장식 점수를 계산하고 시트에 최종 점수를 업데이트 (Batch Update 적용)"""
+    def _record(self, user_id, sheet_name, command, cells, rng=None):
+        """처리된 명령을 저널에 기록하고, 때가 되면 스냅숏을 남긴다."""
+        if not self.journal:
+            return
         try:
-            # 1. 데이터 읽기 (2행 ~ 10행)
-            data = team_sheet.get(f'A2:B10')
-
-            head_size = 200
-            body_size = 200
-
-            if data and len(data) > 0:
-                row_size = data[0]
-
-                if len(row_size) > 0 and str(row_size[0]).isdigit():
-                    head_size = int(row_size[0])
-
-                if len(row_size) > 1 and str(row_size[1]).isdigit():
-                    body_size = int(row_size[1])
-
-            max_deco_rows = len(list(DECORATION_DATA.values()))
-            head_counts = []
-            body_counts = []
-
-            for row_index in range(max_deco_rows):
-                if len(data) <= row_index + 1:
-                    head_counts.append(0)
-                    body_counts.append(0)
-                    continue
-
-                row = data[row_index + 1]
-
-                head_count = 0
-                if len(row) > 0 and str(row[0]).isdigit():
-                    head_count = int(row[0])
-                head_counts.append(head_count)
-
-                body_count = 0
-                if len(row) > 1 and str(row[1]).isdigit():
-                    body_count = int(row[1])
-                body_counts.append(body_count)
-
-            # 2. 크기 점수 계산
-            head_size_score = max(0, 100 - abs(head_size - PERFECT_HEAD))
-            body_size_score = max(0, 100 - abs(body_size - PERFECT_BODY))
-
-            # 3. 장식 점수 계산
-            deco_rows = list(DECORATION_DATA.values())
-            head_deco_score = sum(deco_rows[i]['score'] * head_counts[i] for i in range(len(deco_rows)))
-            body_deco_score = sum(deco_rows[i]['score'] * body_counts[i] for i in range(len(deco_rows)))
-
-            # 4. 최종 점수 계산
-            final_score = head_size_score + body_size_score + head_deco_score + body_deco_score
-
-            # 5. 시트에 모든 점수를 단일 요청(Batch Update)으로 업데이트
-            update_data = [
-                [head_size_score, body_size_score],  # 11행 (A11: 크기 점수-머리, B11: 크기 점수-몸통)
-                [head_deco_score, body_deco_score],  # 12행 (A12: 장식 점수-머리, B12: 장식 점수-몸통)
-                [final_score]  # 13행 (A13: 최종 점수)
-            ]
-
-            # A11:B13 범위에 데이터 업데이트 (단일 API 호출)
-            team_sheet.update('A11:B13', update_data)
+            with metrics.timed('snowman_stage_seconds', stage='journal'):
+                self.journal.record(user_id, sheet_name, command, cells, rng)
+                if self.journal.due_snapshot():
+                    self.journal.snapshot(self.teams.export)
+        except Exception as e:
+            print(f"명령 저널 기록 오류: {e}")
 
+    def _update_scores(self, team):
+        """바뀐 점수 셀만 기록 대기 목록에 추가하고 순위표 갱신 (점수는 셀이 바뀔 때 이미 증분 반영됨)"""
+        try:
+            self.teams.write_scores(team)
+            self.leaderboard.update(team.sheet_name, team.final_score)
         except Exception as e:
-            # 시트 업데이트 실패 시 로깅
-            print(f"FATAL GSPREAD UPDATE ERROR in _update_scores: {e}")
+            print(f"FATAL SCORE UPDATE ERROR in _update_scores: {e}")
 
     # --- 메인 명령 처리 함수 ---
 
     def handle_command(self, status):
         """툿을 받아 명령을 처리하고 응답을 생성하는 메인 함수"""
 
-        self.player_db = load_db()
+        # 이미 처리한 툿이면 무시 (크기 변경 등이 두 번 적용되지 않도록)
+        if not self.seen.first_seen(status['id']):
+            print(f"DEBUG: 이미 처리한 툿입니다. (status {status['id']}) 건너뜁니다.")
+            return
+
+        try:
+            self._handle_command(status)
+        except Exception:
+            # 처리 중 실패한 툿은 중복 필터에서 지워, 다시 들어오면 재시도되도록
+            self.seen.forget(status['id'])
+            raise
 
-        content = status['content'].lower()
+    def _handle_command(self, status):
+        """중복 확인을 마친 툿 하나를 처리 (예외는 handle_command 가 받아 중복 필터에서 지움)"""
+
+        # 파일이 외부에서 수정된 경우에만 다시 읽음
+        with metrics.timed('snowman_stage_seconds', stage='db_refresh'):
+            self.db.refresh_if_changed()
+
+        content = html_to_text(status['content'])
 
         incoming_user_id = str(status['account']['id'])
         incoming_username = status['account']['acct']
@@ -417,20 +1472,14 @@ class SnowmanBot:
         # 오류 메시지 수정: DB에 없는 사용자 ID
         if final_user_id is None:
             # NOTE: DB에 없는 사용자에게 응답을 보낼 필요가 없다면 아래 3줄을 주석 처리할 수 있습니다.
-            self.m.status_reply(status, "참여가 확인되지 않았습니다. 운영 계정(@MARCH)으로 문의해 주십시오.")
+            self.replies.send(status, "참여가 확인되지 않았습니다. 운영 계정(@MARCH)으로 문의해 주십시오.")
             return
 
-        command_found = None
-        for cmd in ALL_COMMANDS:
-            if cmd.lower() in content:
-                command_found = cmd
-                break
-
         # ======================================================================
         # 🚨 명령어 유효성 검사 및 응답 분기
         # ======================================================================
-        # 1. 툿에서 대괄호로 둘러싸인 텍스트가 있는지 정규식으로 확인
-        bracketed_text_search = re.search(r'\[.*?\]', content)
+        # 1. 명령어와 '대괄호로 둘러싸인 텍스트가 있는지'를 한 번의 순회로 확인
+        command_found, bracketed_text_search = COMMAND_MATCHER.match(content)
 
         # 2. 유효한 명령어가 발견되지 않았을 경우
         if not command_found:
@@ -439,7 +1488,7 @@ class SnowmanBot:
                 # 2-A. 대괄호는 있으나 유효한 명령어와 일치하지 않는 경우 (오타)
                 error_message = "존재하지 않는 커맨드입니다. 오타가 없는지 점검 부탁드리며, 오기재 · 미등록 등으로 판단될 시 운영 계정(@MARCH)으로 문의해 주십시오."
                 print(f"DEBUG: @{incoming_username}의 툿에 오타가 포함되어 응답: {error_message}")
-                self.m.status_reply(status, error_message)
+                self.replies.send(status, error_message)
                 return
             else:
                 # 2-B. 대괄호가 전혀 없는 경우 (이전 요청대로 응답 안 함)
@@ -449,36 +1498,42 @@ class SnowmanBot:
         # 3. 유효한 명령어가 발견된 경우 (기존 로직 수행)
         if command_found in REGISTRATION_COMMANDS:
             reply_text = self._handle_registration(status, command_found, final_user_id, incoming_username)
-            self.m.status_reply(status, reply_text)
+            self.replies.send(status, reply_text)
+            return
+
+        # 순위 조회는 역할/쿨타임과 무관 (캐시된 점수만 사용)
+        if command_found == RANKING_COMMAND:
+            self.replies.send(status, self.leaderboard.format_reply(user_data.get('sheet_name')))
             return
 
         # 오류 메시지 수정: 역할 할당 필요
         if not user_data.get('role'):
-            self.m.status_reply(status,
-                                "역할이 할당되지 않았습니다. [눈사람/머리] · [눈사람/몸통] 역할 등록이 완료되었는지 확인 부탁드리며, 미등록으로 판단될 시 운영 계정(@MARCH)으로 문의해 주십시오.")
+            self.replies.send(status,
+                              "역할이 할당되지 않았습니다. [눈사람/머리] · [눈사람/몸통] 역할 등록이 완료되었는지 확인 부탁드리며, 미등록으로 판단될 시 운영 계정(@MARCH)으로 문의해 주십시오.")
             return
 
         can_act, cooldown_msg = check_group_cooldown(user_data, command_found)
         if not can_act:
             print(f"DEBUG: Cooldown active for @{incoming_username}")
-            self.m.status_reply(status, cooldown_msg)
+            self.replies.send(status, cooldown_msg)
             return
 
         sheet_name = user_data['sheet_name']
         role = user_data['role']
         col_char = user_data['col']
-        team_sheet = self.spreadsheet.worksheet(sheet_name)
+        team = self.teams.get(sheet_name)
 
         reply_text = ""
+        journal_cells, rng = None, None  # 저널에 남길 결과 셀 값 / 무작위 결과
 
         if command_found in SNOWMAN_COOL_DOWN_CMDS:
-            # 눈덩이 크기 로드
-            col_index = ord(col_char) - ord('A') + 1
-            current_size_str = team_sheet.cell(2, col_index).value
-            current_size = int(current_size_str) if current_size_str and current_size_str.isdigit() else 200
+            # 눈덩이 크기 로드 (캐시)
+            current_size = team.size(col_char)
 
-            new_size, response_message = self._update_snowman_size(team_sheet, role, col_char, current_size,
+            new_size, response_message = self._update_snowman_size(team, role, col_char, current_size,
                                                                    command_found)
+            rng = {'delta': new_size - current_size} if command_found == '[눈사람/던지기]' else None
+            journal_cells = {f"{col_char}2": new_size}
 
             # 눈덩이 관련 명령 스크립트 템플릿 적용
             if command_found == '[눈사람/굴리기]':
@@ -497,37 +1552,56 @@ class SnowmanBot:
 """
 
         elif command_found == DECORATION_COMMAND:
-            reply_text = self._try_get_decoration(team_sheet, role, col_char)
+            acquired_command, new_count, reply_text = self._try_get_decoration(team, role, col_char)
+            rng = {'item': acquired_command}
+            journal_cells = {f"{col_char}{DECORATION_DATA[acquired_command]['row']}": new_count}
 
-        self._update_scores(team_sheet)
+        with metrics.timed('snowman_stage_seconds', stage='scores'):
+            self._update_scores(team)
+
+        if journal_cells:
+            self._record(final_user_id, sheet_name, command_found, journal_cells, rng)
 
         cooldown_group = _get_cooldown_group(command_found)
 
         if cooldown_group:
-            if 'cooldown_times' not in self.player_db[final_user_id]:
-                self.player_db[final_user_id]['cooldown_times'] = {}
-
-            self.player_db[final_user_id]['cooldown_times'][cooldown_group] = datetime.now()
+            used_at = time.time()
+            self.db.set_cooldown(final_user_id, cooldown_group, used_at)
             print(
-                f"DEBUG: Cooldown updated for user {final_user_id} group {cooldown_group} at {datetime.now().isoformat()}")
-
-        save_db(self.player_db)
+                f"DEBUG: Cooldown updated for user {final_user_id} group {cooldown_group} at {datetime.fromtimestamp(used_at).isoformat()}")
 
         # 멘션 중복 제거 (본문만 final_reply에 담음)
         final_reply = reply_text.strip()
 
         print(f"DEBUG: Replying to @{incoming_username} with: {final_reply[:50]}...")
-        try:
-            self.m.status_reply(status, final_reply)
-            print(f"DEBUG: Reply to @{incoming_username} SUCCESS.")
-        except Exception as e:
-            print(f"FATAL REPLY ERROR for @{incoming_username}: {e}")
+        self.replies.send(status, final_reply)
 
         return
 
     # --- 마스토돈 스트리밍 리스너 설정 ---
+    def on_mention(self, notification):
+        """
+        멘션 알림 하나를 워커 풀에 넘긴다. (스트림 스레드는 수신만 함, 공용 런타임에서도 이 메서드를 호출)
+        알림 커서는 워커가 처리를 마친 뒤에야 이 알림을 지나 저장된다. (대기열에 있는 채로 종료되면 따라잡기로 다시 받음)
+        """
+        notification_id = notification['id']
+        self.cursor.begin(notification_id)
+        self.dispatcher.submit(notification['status'], lambda: self.cursor.done(notification_id))
+
+    def shutdown(self):
+        """대기 중인 명령/응답을 처리하고, 아직 기록되지 않은 팀 시트 변경분과 중복 필터를 저장"""
+        self.dispatcher.stop()
+        self.cursor.save()
+        self.replies.stop()
+        self.teams.flush()
+        if self.journal:
+            # 다음 시작 때 재적용할 저널이 짧도록 마지막 상태를 스냅숏으로 남긴다
+            self.journal.snapshot(self.teams.export)
+            self.journal.close()
+        self.seen.save()
+
     def start_streaming(self):
-        """마스토돈 스트리밍 시작"""
+        """마스토돈 스트리밍 시작 (접속/재접속 때마다 놓친 멘션을 먼저 따라잡음)"""
 
         class Listener(StreamListener):
             def __init__(self, bot_instance):
@@ -536,8 +1610,10 @@ class SnowmanBot:
             # 멘션이 포함된 툿을 '알림(Notification)'을 통해 받아서 처리
             def on_notification(self, notification):
                 if notification['type'] == 'mention':
-                    status = notification['status']
-                    self.bot.handle_command(status)
+                    # 따라잡기와 스트림이 겹쳐 같은 알림이 두 번 오는 경우 무시
+                    if not self.bot.cursor.is_new(notification['id']):
+                        return
+                    self.bot.on_mention(notification)
 
             # '업데이트(Update)'는 새로운 툿이 올라올 때 발생.
             # on_notification과의 중복 방지를 위해 멘션에 대한 처리를 제거함.
@@ -550,10 +1626,27 @@ class SnowmanBot:
             def on_error(self, error):
                 print(f"스트리밍 오류 발생: {error}")
 
-        print("마스토돈 스트리밍 시작...")
-        # 봇 계정 ACCT 정보를 사용하여 on_update 로직에서 중복 검사를 할 수 있었지만,
-        # 가장 간단한 해결책은 on_update에서 멘션 처리를 완전히 제거하는 것임.
-        self.m.stream_user(Listener(self), run_async=False, reconnect_async=True)
+        listener = Listener(self)
+
+        while True:
+            try:
+                # 스트림이 끊겨 있던 동안 도착한 멘션을 같은 핸들러로 먼저 처리
+                handled = catch_up(self.m, listener.on_notification, self.cursor)
+                if handled:
+                    print(f"놓친 멘션 {handled}건을 따라잡았습니다.")
+
+                print("마스토돈 스트리밍 시작...")
+                # 봇 계정 ACCT 정보를 사용하여 on_update 로직에서 중복 검사를 할 수 있었지만,
+                # 가장 간단한 해결책은 on_update에서 멘션 처리를 완전히 제거하는 것임.
+                self.m.stream_user(listener, run_async=False, reconnect_async=True)
+            except Exception as e:
+                print(f"스트림 에러 발생, {STREAM_RETRY_SECONDS}초 후 재접속: {e}")
+                print(f"DEBUG: 중복 필터 통계 {self.seen.stats()}")
+                print(f"DEBUG: 응답 전송 통계 {self.replies.stats()}")
+                time.sleep(STREAM_RETRY_SECONDS)
+            finally:
+                self.cursor.save()
+                self.seen.save()
 
 
 if __name__ == '__main__':
@@ -565,8 +1658,16 @@ if __name__ == '__main__':
         print(f"FATAL ERROR: {SERVICE_ACCOUNT_FILE} 파일을 찾을 수 없습니다. 구글 설정이 필요합니다.")
         exit()
 
+    bot = None
     try:
+        if METRICS_PORT:
+            metrics.describe('snowman_stage_seconds', '단계별 처리 시간(초)')
+            metrics.start_server(METRICS_PORT)
         bot = SnowmanBot()
         bot.start_streaming()
     except Exception as e:
-        print(f"치명적인 봇 실행 오류: {e}")
\ No newline at end of file
+        print(f"치명적인 봇 실행 오류: {e}")
+    finally:
+        # 종료 전 대기 중인 명령을 처리하고, 아직 기록되지 않은 팀 시트 변경분을 기록
+        if bot is not None:
+            bot.shutdown()
\ No newline at end of file